@@ -1,89 +1,290 @@
+import os
+
+# Production workers started by serve.py run on eventlet
+if os.getenv('EVENTLET_MONKEY_PATCH') == '1':
+    import eventlet
+    eventlet.monkey_patch()
+
 from flask import Flask, request, jsonify
 from flask_socketio import SocketIO, emit, join_room
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-import os
 from datetime import datetime
 from app.routes.auth import auth_bp
 from app.routes.products import products_bp
 from app.routes.analytics import analytics_bp
 from app.routes.orders import orders_bp
-from app.utils.database import init_db
+from app.routes.batch import batch_bp
+from app.routes.admin import admin_bp
+from app.routes.sync import sync_bp
+from app.utils.admission import init_admission
+from app.utils.auth import decode_token, can_join_room
+from app.utils.broadcast import broadcaster
+from app.utils.database import init_db, ensure_indexes_in_background, get_status, configure_read_profiles
+from app.utils.message_queue import socketio_options
+from app.utils.metrics import metrics
+from app.utils.order_archive import order_archiver
+from app.utils.profiling import init_profiling
+from app.utils.realtime import init_realtime
+from app.utils.refresher import refresher
+from app.utils.serialization import MongoJSONProvider
+from app.utils.stock_history import stock_history
+from app.utils.catalog import catalog
+from app.utils.copurchase import copurchase
+from app.utils.stock_pipeline import stock_pipeline
+from app.utils.sync import backfill_in_background
+from app.utils.tasks import TaskPool, QueueFull
+from app.utils.versions import init_versions
 
 # Load environment variables
 load_dotenv()
 
 def create_app():
     app = Flask(__name__)
+    app.json = MongoJSONProvider(app)
     
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'qwipo-ai-secret-key-2024')
     app.config['MONGO_URI'] = os.getenv('MONGO_URI', 'mongodb://localhost:27017/qwipo_ai')
+    app.config['SOCKET_WORKERS'] = int(os.getenv('SOCKET_WORKERS', 8))
+    app.config['SOCKET_QUEUE_LIMIT'] = int(os.getenv('SOCKET_QUEUE_LIMIT', 512))
+    app.config['SOCKET_USER_QUEUE_LIMIT'] = int(os.getenv('SOCKET_USER_QUEUE_LIMIT', 4))
+    app.config['SOCKETIO_MESSAGE_QUEUE'] = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+    app.config['SOCKETIO_ASYNC_MODE'] = os.getenv('SOCKETIO_ASYNC_MODE')
+    app.config['STOCK_FLUSH_INTERVAL'] = float(os.getenv('STOCK_FLUSH_INTERVAL', 0.5))
+    app.config['STOCK_HISTORY_INTERVAL'] = float(os.getenv('STOCK_HISTORY_INTERVAL', 1.0))
+    app.config['CATALOG_POLL_INTERVAL'] = float(os.getenv('CATALOG_POLL_INTERVAL', 2.0))
+    app.config['COPURCHASE_TOP_K'] = int(os.getenv('COPURCHASE_TOP_K', 20))
+    app.config['COPURCHASE_POLL_INTERVAL'] = float(os.getenv('COPURCHASE_POLL_INTERVAL', 5.0))
+    app.config['VERSION_STORE_URL'] = os.getenv('VERSION_STORE_URL', app.config['SOCKETIO_MESSAGE_QUEUE'])
+    app.config['CHANGE_COALESCE_WINDOW'] = float(os.getenv('CHANGE_COALESCE_WINDOW', 0.25))
+    app.config['CHANGE_BUFFER_LIMIT'] = int(os.getenv('CHANGE_BUFFER_LIMIT', 100))
+    app.config['SLOW_CLIENT_BACKLOG'] = int(os.getenv('SLOW_CLIENT_BACKLOG', 32))
+    app.config['ANALYTICS_REFRESH_CONCURRENCY'] = int(os.getenv('ANALYTICS_REFRESH_CONCURRENCY', 2))
+    app.config['ANALYTICS_MAX_TIME_MS'] = int(os.getenv('ANALYTICS_MAX_TIME_MS', 5000))
+    app.config['ANALYTICS_MAX_STALENESS'] = int(os.getenv('ANALYTICS_MAX_STALENESS', 90))
+    app.config['ADMISSION_CAPACITY'] = int(os.getenv('ADMISSION_CAPACITY', 64))
+    app.config['ANALYTICS_RATE'] = float(os.getenv('ANALYTICS_RATE', 2.0))
+    app.config['ANALYTICS_BURST'] = int(os.getenv('ANALYTICS_BURST', 10))
+    app.config['ORDER_ARCHIVE_AFTER_DAYS'] = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', 90))
+    app.config['ORDER_ARCHIVE_INTERVAL'] = float(os.getenv('ORDER_ARCHIVE_INTERVAL', 3600))
+    app.config['ORDER_ARCHIVE_BATCH'] = int(os.getenv('ORDER_ARCHIVE_BATCH', 1000))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_INTERVAL_MS'] = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+    app.config['PROXY_FIX_X_FOR'] = int(os.getenv('PROXY_FIX_X_FOR', 0))
+    
+    # Client addresses (per-IP rate limits) come from the reverse proxy's X-Forwarded-For
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
     
     # Initialize extensions
     CORS(app, origins=['http://localhost:5173', 'http://127.0.0.1:5173'])
-    socketio = SocketIO(app, cors_allowed_origins=['http://localhost:5173', 'http://127.0.0.1:5173'])
+    # A message queue lets several worker processes share rooms and broadcasts
+    socketio = SocketIO(
+        app,
+        cors_allowed_origins=['http://localhost:5173', 'http://127.0.0.1:5173'],
+        async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+        **socketio_options(app.config['SOCKETIO_MESSAGE_QUEUE'])
+    )
+    init_realtime(socketio)
+    
+    # Background pool so slow socket commands never block event processing
+    socket_tasks = TaskPool(
+        'socket_tasks',
+        workers=app.config['SOCKET_WORKERS'],
+        max_queue=app.config['SOCKET_QUEUE_LIMIT'],
+        per_user_limit=app.config['SOCKET_USER_QUEUE_LIMIT']
+    )
+    socket_tasks.start()
+    
+    # Coalesced change events for distributor, retailer and category rooms
+    broadcaster.configure(
+        window=app.config['CHANGE_COALESCE_WINDOW'],
+        max_buffered=app.config['CHANGE_BUFFER_LIMIT'],
+        slow_backlog=app.config['SLOW_CLIENT_BACKLOG']
+    )
+    broadcaster.start()
+    
+    # Analytics responses kept warm and refreshed on change signals
+    refresher.configure(max_concurrency=app.config['ANALYTICS_REFRESH_CONCURRENCY'])
+    refresher.start()
+    
+    # Write-behind stock decrements merged per product
+    stock_pipeline.configure(interval=app.config['STOCK_FLUSH_INTERVAL'])
+    stock_pipeline.start()
+    
+    # Stock level samples batched into the stock_history time series
+    stock_history.configure(interval=app.config['STOCK_HISTORY_INTERVAL'])
+    stock_history.start()
+    
+    # Columnar in-memory catalog behind /api/products/query
+    catalog.configure(poll_interval=app.config['CATALOG_POLL_INTERVAL'])
+    catalog.start()
+    
+    # Item-to-item co-purchase neighbours from order baskets
+    copurchase.configure(
+        top_k=app.config['COPURCHASE_TOP_K'],
+        poll_interval=app.config['COPURCHASE_POLL_INTERVAL']
+    )
+    copurchase.start()
+    
+    # Finished orders past ORDER_ARCHIVE_AFTER_DAYS move to the compressed archive
+    order_archiver.configure(
+        min_age_days=app.config['ORDER_ARCHIVE_AFTER_DAYS'],
+        batch_size=app.config['ORDER_ARCHIVE_BATCH'],
+        interval=app.config['ORDER_ARCHIVE_INTERVAL']
+    )
+    order_archiver.start()
+    
+    # Initialize database lazily; indexes are reconciled in the background
+    init_db(app.config['MONGO_URI'], build_indexes=False)
+    ensure_indexes_in_background()
     
-    # Initialize database
-    init_db(app.config['MONGO_URI'])
+    # Documents written before change sequences existed get one for delta sync
+    backfill_in_background()
+    
+    # Analytics reads prefer replica-set secondaries within a staleness bound
+    configure_read_profiles(max_staleness=app.config['ANALYTICS_MAX_STALENESS'])
+    
+    # Version counters behind ETags; shared through Redis across workers
+    init_versions(app.config['VERSION_STORE_URL'])
+    
+    # Shed low-priority load early: order writes > catalog reads > analytics
+    admission = init_admission(app)
+    admission.configure(
+        capacity=app.config['ADMISSION_CAPACITY'],
+        analytics_rate=app.config['ANALYTICS_RATE'],
+        analytics_burst=app.config['ANALYTICS_BURST']
+    )
+    
+    # Sampling profiles of requests picked by rate or asked for by admins (X-Profile: 1)
+    profiler = init_profiling(app)
+    profiler.configure(
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        interval=app.config['PROFILE_INTERVAL_MS'] / 1000
+    )
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(products_bp, url_prefix='/api/products')
     app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
     app.register_blueprint(orders_bp, url_prefix='/api/orders')
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
     
     # Health check endpoint for mobile optimization
     @app.route('/api/health')
     def health_check():
+        database = get_status()
         return jsonify({
-            'status': 'healthy',
+            'status': 'healthy' if database['state'] == 'ready' else 'starting',
+            'ready': database['state'] == 'ready',
+            'database': database,
             'mobile_optimized': True,
             'version': '1.0.0',
-            'features': ['voice_assistant', 'real_time_updates', 'mobile_responsive']
+            'features': ['voice_assistant', 'real_time_updates', 'mobile_responsive'],
+            'worker': {
+                'pid': os.getpid(),
+                'async_mode': socketio.async_mode,
+                'message_queue': bool(app.config['SOCKETIO_MESSAGE_QUEUE'])
+            }
+        })
+    
+    @app.route('/api/metrics')
+    def get_metrics():
+        return jsonify({
+            'socket_tasks': socket_tasks.stats(),
+            'admission': admission.stats(),
+            'catalog': catalog.stats(),
+            'order_archive': order_archiver.stats(),
+            **metrics.snapshot()
         })
     
+    # Token payloads of the sockets connected to this worker, keyed by sid
+    socket_users = {}
+    
     # WebSocket events for real-time mobile updates
     @socketio.on('connect')
-    def handle_connect():
+    def handle_connect(auth=None):
+        token = (auth or {}).get('token') or request.args.get('token')
+        payload = decode_token(token) if token else None
+        if payload is None:
+            print('Client rejected: missing or invalid token')
+            return False
+        socket_users[request.sid] = payload
         print('Client connected')
         emit('status', {'msg': 'Connected to Qwipo AI'})
     
     @socketio.on('disconnect')
     def handle_disconnect():
+        socket_users.pop(request.sid, None)
         print('Client disconnected')
     
     @socketio.on('join_room')
     def handle_join_room(data):
-        room = data.get('room', 'default')
+        room = str((data or {}).get('room', ''))
+        user = socket_users.get(request.sid)
+        if user is None or not can_join_room(user, room):
+            emit('status', {'msg': f'Not allowed to join room: {room}'})
+            return {'status': 'rejected', 'error': 'Not allowed to join this room'}
         join_room(room)
         emit('status', {'msg': f'Joined room: {room}'})
+        return {'status': 'joined', 'room': room}
     
     @socketio.on('voice_command')
     def handle_voice_command(data):
         command = data.get('command', '')
-        user_id = data.get('user_id', 'anonymous')
+        user_id = socket_user_id() or 'anonymous'
+        sid = request.sid
         
-        # Process voice command
-        response = process_voice_command(command, user_id)
+        def deliver(request_id, response, error):
+            socketio.emit('voice_response', {
+                'request_id': request_id,
+                'command': command,
+                'response': response,
+                'error': error,
+                'timestamp': str(datetime.utcnow())
+            }, to=sid)
         
-        emit('voice_response', {
-            'command': command,
-            'response': response,
-            'timestamp': str(datetime.utcnow())
-        })
+        # Process voice command on the background pool
+        return submit_socket_task('voice_command', data, process_voice_command, (command, user_id), deliver)
     
     @socketio.on('stock_update_request')
     def handle_stock_update_request(data):
-        user_id = data.get('user_id')
+        user_id = socket_user_id()
+        sid = request.sid
         
-        # Get real-time stock data
-        stock_data = get_real_time_stock(user_id)
+        def deliver(request_id, stock_data, error):
+            socketio.emit('stock_update', {
+                'request_id': request_id,
+                'data': stock_data,
+                'error': error,
+                'timestamp': str(datetime.utcnow())
+            }, to=sid)
         
-        emit('stock_update', {
-            'data': stock_data,
-            'timestamp': str(datetime.utcnow())
-        })
+        # Get real-time stock data on the background pool
+        return submit_socket_task('stock_update_request', data, get_real_time_stock, (user_id,), deliver)
+    
+    def socket_user_id():
+        """User ID from the token the current socket connected with"""
+        return socket_users.get(request.sid, {}).get('user_id')
+    
+    def submit_socket_task(event, data, func, args, deliver):
+        """Queue a socket command and acknowledge it with its request ID"""
+        user_key = socket_user_id() or request.sid
+        try:
+            request_id = socket_tasks.submit(user_key, func, args, deliver, request_id=data.get('request_id'))
+        except QueueFull as e:
+            emit('task_rejected', {
+                'event': event,
+                'request_id': data.get('request_id'),
+                'error': str(e)
+            })
+            return {'status': 'rejected', 'error': str(e)}
+        
+        return {'status': 'queued', 'request_id': request_id}
     
     return app, socketio
 
@@ -153,4 +354,9 @@ def get_real_time_stock(user_id):
 
 if __name__ == '__main__':
     app, socketio = create_app()
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    socketio.run(
+        app,
+        debug=os.getenv('FLASK_DEBUG', '1') == '1',
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', 5000))
+    )
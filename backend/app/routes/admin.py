@@ -0,0 +1,102 @@
+from flask import Blueprint, request, jsonify, make_response
+from app.utils.auth import token_required, role_required
+from app.utils.profiling import profiler, memory_profiler
+
+admin_bp = Blueprint('admin', __name__)
+
+# tracemalloc grouping accepted by the diff endpoint
+MEMORY_KEY_TYPES = ('lineno', 'filename', 'traceback')
+
+@admin_bp.route('/profiling', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_profiling():
+    """Profiler settings and stored CPU profiles"""
+    return jsonify({
+        'sample_rate': profiler.sample_rate,
+        'interval_ms': profiler.interval * 1000,
+        'max_profiles': profiler.profiles.limit,
+        'profiles': profiler.list()
+    }), 200
+
+@admin_bp.route('/profiling', methods=['PUT'])
+@token_required
+@role_required(['admin'])
+def update_profiling():
+    """Change the request sample rate and sampling interval"""
+    data = request.get_json() or {}
+    sample_rate = data.get('sample_rate')
+    interval_ms = data.get('interval_ms')
+    if sample_rate is not None and not (isinstance(sample_rate, (int, float)) and 0 <= sample_rate <= 1):
+        return jsonify({'error': 'sample_rate must be between 0 and 1'}), 400
+    if interval_ms is not None and not (isinstance(interval_ms, (int, float)) and 1 <= interval_ms <= 1000):
+        return jsonify({'error': 'interval_ms must be between 1 and 1000'}), 400
+    
+    profiler.configure(
+        sample_rate=sample_rate,
+        interval=interval_ms / 1000 if interval_ms is not None else None
+    )
+    return jsonify({'sample_rate': profiler.sample_rate, 'interval_ms': profiler.interval * 1000}), 200
+
+@admin_bp.route('/profiling/<profile_id>', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_profile(profile_id):
+    """Download a profile as collapsed stacks (flamegraph.pl / speedscope input)"""
+    profile = profiler.profiles.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    response = make_response(profile['collapsed'] + '\n')
+    response.mimetype = 'text/plain'
+    response.headers['Content-Disposition'] = f'attachment; filename={profile["endpoint"]}-{profile_id}.folded'
+    return response
+
+@admin_bp.route('/memory/snapshots', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_memory_snapshots():
+    """Stored tracemalloc snapshots"""
+    return jsonify({'tracing': memory_profiler.tracing, 'snapshots': memory_profiler.list()}), 200
+
+@admin_bp.route('/memory/snapshots', methods=['POST'])
+@token_required
+@role_required(['admin'])
+def take_memory_snapshot():
+    """Take a tracemalloc snapshot (starts tracing on first use)"""
+    data = request.get_json(silent=True) or {}
+    return jsonify({'snapshot': memory_profiler.snapshot(data.get('label'))}), 201
+
+@admin_bp.route('/memory/diff', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_memory_diff():
+    """Top allocation growth between two snapshots (`to` omitted: now)"""
+    from_id = request.args.get('from')
+    key_type = request.args.get('key_type', 'lineno')
+    limit = request.args.get('limit', 25, type=int)
+    if not from_id:
+        return jsonify({'error': '`from` snapshot ID is required'}), 400
+    if key_type not in MEMORY_KEY_TYPES:
+        return jsonify({'error': f"key_type must be one of: {', '.join(MEMORY_KEY_TYPES)}"}), 400
+    
+    try:
+        diff = memory_profiler.diff(
+            from_id,
+            request.args.get('to'),
+            key_type=key_type,
+            include=request.args.get('include'),
+            limit=max(1, min(limit, 200))
+        )
+    except KeyError as e:
+        return jsonify({'error': f'Snapshot not found: {e.args[0]}'}), 404
+    
+    return jsonify(diff), 200
+
+@admin_bp.route('/memory', methods=['DELETE'])
+@token_required
+@role_required(['admin'])
+def stop_memory_tracing():
+    """Stop tracemalloc and drop its snapshots"""
+    memory_profiler.stop()
+    return jsonify({'message': 'Memory tracing stopped'}), 200
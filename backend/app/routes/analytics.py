@@ -1,13 +1,38 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
+from app.utils.batch import batch_cached
+from app.utils.copurchase import copurchase, with_products
 from app.utils.database import get_collection
+from app.utils.order_archive import with_archive, find_orders, ARCHIVE
+from app.utils.refresher import stale_while_revalidate
+from app.utils.singleflight import single_flight
+from app.utils.snapshots import shared_snapshot
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo.errors import ExecutionTimeout
 import random
 import math
 
 analytics_bp = Blueprint('analytics', __name__)
 
+def query_budget():
+    """Server-side time limit (maxTimeMS) for analytics queries"""
+    return current_app.config.get('ANALYTICS_MAX_TIME_MS', 5000)
+
+def timeout_response():
+    """503 for a query cancelled by its maxTimeMS budget"""
+    response = jsonify({'error': 'Analytics query exceeded its time budget'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+def load_active_products():
+    """Active product documents, loaded once per batch request"""
+    return batch_cached('products:active', lambda: list(
+        get_collection('products').find({'is_active': True}).max_time_ms(query_budget())
+    ))
+
 @analytics_bp.route('/dashboard', methods=['GET'])
+@stale_while_revalidate(interval=30)
 def get_dashboard_stats():
     """Get dashboard analytics"""
     try:
@@ -15,19 +40,21 @@ def get_dashboard_stats():
         orders = get_collection('orders')
         
         # Product stats
-        total_products = products.count_documents({})
-        active_products = products.count_documents({'is_active': True})
+        total_products = products.count_documents({}, maxTimeMS=query_budget())
+        active_products = products.count_documents({'is_active': True}, maxTimeMS=query_budget())
         low_stock_count = products.count_documents({
             '$expr': {'$lte': ['$stock', '$min_stock']}
-        })
+        }, maxTimeMS=query_budget())
         
         # Order stats
-        total_orders = orders.count_documents({})
-        pending_orders = orders.count_documents({'status': 'pending'})
+        # Archived orders are all delivered or cancelled
+        total_orders = (orders.count_documents({'status': {'$ne': 'draft'}}, maxTimeMS=query_budget())
+                        + get_collection(ARCHIVE).estimated_document_count(maxTimeMS=query_budget()))
+        pending_orders = orders.count_documents({'status': 'pending'}, maxTimeMS=query_budget())
         
         # Revenue (last 30 days)
         thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        revenue_pipeline = [
+        revenue_pipeline = with_archive([
             {
                 '$match': {
                     'status': 'delivered',
@@ -40,8 +67,8 @@ def get_dashboard_stats():
                     'total_revenue': {'$sum': '$total_amount'}
                 }
             }
-        ]
-        revenue_result = list(orders.aggregate(revenue_pipeline))
+        ], since=thirty_days_ago)
+        revenue_result = list(orders.aggregate(revenue_pipeline, maxTimeMS=query_budget()))
         monthly_revenue = revenue_result[0]['total_revenue'] if revenue_result else 0
         
         return jsonify({
@@ -60,10 +87,13 @@ def get_dashboard_stats():
             }
         }), 200
         
+    except ExecutionTimeout:
+        return timeout_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/sales', methods=['GET'])
+@stale_while_revalidate(interval=60, entities=('order',), params=('days',))
 def get_sales_analytics():
     """Get sales analytics"""
     try:
@@ -74,7 +104,7 @@ def get_sales_analytics():
         start_date = datetime.utcnow() - timedelta(days=days)
         
         # Daily sales
-        pipeline = [
+        pipeline = with_archive([
             {
                 '$match': {
                     'status': 'delivered',
@@ -96,19 +126,23 @@ def get_sales_analytics():
             {
                 '$sort': {'_id': 1}
             }
-        ]
+        ], since=start_date)
         
-        daily_sales = list(orders.aggregate(pipeline))
+        daily_sales = list(orders.aggregate(pipeline, maxTimeMS=query_budget()))
         
         return jsonify({
             'daily_sales': daily_sales,
             'period': f'{days} days'
         }), 200
         
+    except ExecutionTimeout:
+        return timeout_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/top-products', methods=['GET'])
+@stale_while_revalidate(interval=120, params=('limit',))
+@single_flight(normalize=lambda args: {'limit': args.get('limit', ['10'])})
 def get_top_products():
     """Get top selling products"""
     try:
@@ -117,8 +151,8 @@ def get_top_products():
         
         limit = int(request.args.get('limit', 10))
         
-        # Aggregate top products
-        pipeline = [
+        # Aggregate top products (all time, so both tiers)
+        pipeline = with_archive([
             {'$match': {'status': 'delivered'}},
             {'$unwind': '$items'},
             {
@@ -134,9 +168,9 @@ def get_top_products():
             },
             {'$sort': {'total_quantity': -1}},
             {'$limit': limit}
-        ]
+        ])
         
-        top_products = list(orders.aggregate(pipeline))
+        top_products = list(orders.aggregate(pipeline, maxTimeMS=query_budget()))
         
         # Enrich with product details
         for item in top_products:
@@ -151,10 +185,13 @@ def get_top_products():
             'count': len(top_products)
         }), 200
         
+    except ExecutionTimeout:
+        return timeout_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/stock-alerts', methods=['GET'])
+@stale_while_revalidate(interval=30, entities=('product',))
 def get_stock_alerts():
     """Get stock alerts"""
     try:
@@ -164,14 +201,13 @@ def get_stock_alerts():
         low_stock = list(products.find({
             '$expr': {'$lte': ['$stock', '$min_stock']},
             'is_active': True
-        }).limit(50))
+        }).limit(50).max_time_ms(query_budget()))
         
         # Categorize alerts
         critical = []
         warning = []
         
         for product in low_stock:
-            product['_id'] = str(product['_id'])
             stock_percentage = (product['stock'] / product['min_stock']) * 100 if product['min_stock'] > 0 else 100
             
             if stock_percentage <= 50:
@@ -185,10 +221,14 @@ def get_stock_alerts():
             'total_alerts': len(low_stock)
         }), 200
         
+    except ExecutionTimeout:
+        return timeout_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/revenue-trends', methods=['GET'])
+@stale_while_revalidate(interval=300, entities=('order',))
+@single_flight()
 def get_revenue_trends():
     """Get revenue trends"""
     try:
@@ -197,7 +237,7 @@ def get_revenue_trends():
         # Monthly revenue for last 6 months
         six_months_ago = datetime.utcnow() - timedelta(days=180)
         
-        pipeline = [
+        pipeline = with_archive([
             {
                 '$match': {
                     'status': 'delivered',
@@ -219,27 +259,28 @@ def get_revenue_trends():
             {
                 '$sort': {'_id': 1}
             }
-        ]
+        ], since=six_months_ago)
         
-        monthly_trends = list(orders.aggregate(pipeline))
+        monthly_trends = list(orders.aggregate(pipeline, maxTimeMS=query_budget()))
         
         return jsonify({
             'monthly_trends': monthly_trends,
             'period': '6 months'
         }), 200
         
+    except ExecutionTimeout:
+        return timeout_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/ai-predictions', methods=['GET'])
+@shared_snapshot(ttl=30)
+@single_flight()
 def get_ai_predictions():
     """Get AI-powered stock predictions and recommendations"""
     try:
-        products = get_collection('products')
-        orders = get_collection('orders')
-        
         # Get all products with their stock levels
-        all_products = list(products.find({'is_active': True}))
+        all_products = load_active_products()
         
         predictions = []
         
@@ -310,6 +351,8 @@ def get_ai_predictions():
             'ai_model_version': 'v2.1'
         }), 200
         
+    except ExecutionTimeout:
+        return timeout_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -317,18 +360,14 @@ def get_ai_predictions():
 def get_live_recommendations():
     """Get live stock recommendations with real-time updates"""
     try:
-        products = get_collection('products')
-        orders = get_collection('orders')
-        
         # Get recent order patterns for better recommendations
-        recent_orders = list(orders.find({
-            'created_at': {'$gte': datetime.utcnow() - timedelta(days=7)}
-        }))
+        week_ago = datetime.utcnow() - timedelta(days=7)
+        recent_orders = find_orders({'created_at': {'$gte': week_ago}}, since=week_ago, max_time_ms=query_budget())
         
         recommendations = []
         
         # Generate live recommendations
-        all_products = list(products.find({'is_active': True}))
+        all_products = load_active_products()
         
         for product in all_products[:15]:  # Focus on top 15 products
             stock_level = product.get('stock', 0)
@@ -403,17 +442,42 @@ def get_live_recommendations():
             'next_update_in': 300  # 5 minutes
         }), 200
         
+    except ExecutionTimeout:
+        return timeout_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@analytics_bp.route('/basket-suggestions', methods=['GET'])
+def get_basket_suggestions():
+    """Products a retailer has not bought yet that go with what they buy"""
+    retailer_id = request.args.get('retailer_id')
+    if not retailer_id:
+        return jsonify({'error': 'retailer_id is required'}), 400
+    if not copurchase.ready:
+        return jsonify({'error': 'Recommendations are loading, please retry shortly'}), 503
+    
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= 50:
+        return jsonify({'error': 'limit must be 1-50'}), 400
+    
+    suggestions = with_products(copurchase.suggestions(retailer_id, limit))
+    
+    return jsonify({
+        'retailer_id': retailer_id,
+        'suggestions': suggestions,
+        'count': len(suggestions),
+        'generated_at': datetime.utcnow().isoformat()
+    }), 200
+
 @analytics_bp.route('/live-stocks', methods=['GET'])
+@shared_snapshot(ttl=5)  # matches next_update_in
 def get_live_stocks():
     """Get live stock market data with real-time updates"""
     try:
         products = get_collection('products')
         
         # Get all active products
-        all_products = list(products.find({'is_active': True}).limit(1000))
+        all_products = list(products.find({'is_active': True}).limit(1000).max_time_ms(query_budget()))
         
         live_stocks = []
         
@@ -511,6 +575,8 @@ def get_live_stocks():
             'next_update_in': 5  # seconds - super fast live updates
         }), 200
         
+    except ExecutionTimeout:
+        return timeout_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
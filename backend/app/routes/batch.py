@@ -0,0 +1,42 @@
+from flask import Blueprint, request, jsonify, current_app
+from app.utils.batch import dispatch_batch
+from app.utils.metrics import metrics
+
+batch_bp = Blueprint('batch', __name__)
+
+# Maximum number of sub-requests in one batch
+MAX_BATCH_SIZE = 20
+
+@batch_bp.route('', methods=['POST'])
+def run_batch():
+    """Run several GET API requests concurrently and return all results"""
+    try:
+        data = request.get_json() or {}
+        items = data.get('requests')
+
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'requests must be a non-empty list'}), 400
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'At most {MAX_BATCH_SIZE} requests per batch'}), 400
+
+        for index, item in enumerate(items):
+            if isinstance(item, str):
+                item = items[index] = {'id': str(index), 'path': item}
+            if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+                return jsonify({'error': f'Request {index} must have a path'}), 400
+            if item.get('method', 'GET').upper() != 'GET':
+                return jsonify({'error': 'Only GET requests can be batched'}), 400
+            if not item['path'].startswith('/api/') or item['path'].startswith('/api/batch'):
+                return jsonify({'error': f"Invalid path: {item['path']}"}), 400
+            item.setdefault('id', str(index))
+
+        metrics.incr('batch.requests')
+        results = dispatch_batch(current_app._get_current_object(), items, request.headers, request.remote_addr)
+
+        return jsonify({
+            'responses': results,
+            'count': len(results)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,17 +1,22 @@
 from flask import Blueprint, request, jsonify
-from app.utils.database import get_collection
+from app.utils.database import get_collection, DURABLE_WRITES
 from app.utils.auth import token_required
+from app.utils.broadcast import publish_change, order_rooms
+from app.utils.order_archive import find_orders, find_order, count_orders, with_archive, ARCHIVE
+from app.utils.stock_pipeline import stock_pipeline
+from app.utils.sync import next_seq
+from app.utils.versions import conditional, bump_version
 from datetime import datetime
 from bson import ObjectId
+from pymongo import UpdateOne
 
 orders_bp = Blueprint('orders', __name__)
 
 @orders_bp.route('/', methods=['GET'])
+@conditional('orders')
 def get_orders():
     """Get all orders (filtered by user role)"""
     try:
-        orders = get_collection('orders')
-        
         # Get query parameters
         retailer_id = request.args.get('retailer_id')
         status = request.args.get('status')
@@ -23,17 +28,8 @@ def get_orders():
         if status:
             query['status'] = status
         
-        # Get orders
-        order_list = list(orders.find(query).sort('created_at', -1).limit(100))
-        
-        # Convert ObjectId to string
-        for order in order_list:
-            order['_id'] = str(order['_id'])
-            if 'retailer_id' in order:
-                order['retailer_id'] = str(order['retailer_id'])
-            for item in order.get('items', []):
-                if 'product_id' in item:
-                    item['product_id'] = str(item['product_id'])
+        # Get orders (older pages reach into the archive)
+        order_list = find_orders(query, sort=('created_at', -1), limit=100)
         
         return jsonify({
             'orders': order_list,
@@ -44,22 +40,15 @@ def get_orders():
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<order_id>', methods=['GET'])
+@conditional('orders', doc_arg='order_id')
 def get_order(order_id):
     """Get single order by ID"""
     try:
-        orders = get_collection('orders')
-        order = orders.find_one({'_id': ObjectId(order_id)})
+        order = find_order({'_id': ObjectId(order_id)})
         
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
-        order['_id'] = str(order['_id'])
-        if 'retailer_id' in order:
-            order['retailer_id'] = str(order['retailer_id'])
-        for item in order.get('items', []):
-            if 'product_id' in item:
-                item['product_id'] = str(item['product_id'])
-        
         return jsonify({'order': order}), 200
         
     except Exception as e:
@@ -83,8 +72,9 @@ def create_order():
             total_amount += item['quantity'] * item['price']
         
         # Create order document
-        orders = get_collection('orders')
+        orders = get_collection('orders').with_options(write_concern=DURABLE_WRITES)
         order_doc = {
+            '_id': ObjectId(),
             'retailer_id': data.get('retailer_id', ''),
             'items': data['items'],
             'total_amount': total_amount,
@@ -93,22 +83,22 @@ def create_order():
             'notes': data.get('notes', ''),
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow(),
-            'mobile_order': data.get('mobile_order', False)
+            'mobile_order': data.get('mobile_order', False),
+            'change_seq': next_seq('orders')
         }
+        notify = {'status': order_doc['status'], 'total_amount': total_amount}
         
-        result = orders.insert_one(order_doc)
+        # Queue stock decrements in the outbox before the order exists, so a
+        # crash in between can never lose a decrement
+        stock_pipeline.enqueue(order_doc['_id'], data['items'], order_doc['retailer_id'], notify)
+        try:
+            result = orders.insert_one(order_doc)
+        except Exception:
+            stock_pipeline.discard(order_doc['_id'])
+            raise
         
-        # Update product stock
-        products = get_collection('products')
-        for item in data['items']:
-            if 'product_id' in item:
-                products.update_one(
-                    {'_id': ObjectId(item['product_id'])},
-                    {
-                        '$inc': {'stock': -item['quantity']},
-                        '$set': {'updated_at': datetime.utcnow()}
-                    }
-                )
+        bump_version('orders', result.inserted_id)
+        publish_change('order', result.inserted_id, 'create', notify, order_rooms(order_doc))
         
         return jsonify({
             'message': 'Order created successfully',
@@ -119,6 +109,20 @@ def create_order():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Allowed order status transitions (drafts come from the auto-reorder job)
+ORDER_TRANSITIONS = {
+    'draft': ['pending', 'cancelled'],
+    'pending': ['confirmed', 'cancelled'],
+    'confirmed': ['processing', 'shipped', 'cancelled'],
+    'processing': ['shipped', 'cancelled'],
+    'shipped': ['delivered'],
+    'delivered': [],
+    'cancelled': []
+}
+
+# Maximum number of orders in one bulk status update
+BULK_STATUS_LIMIT = 1000
+
 @orders_bp.route('/<order_id>/status', methods=['PUT'])
 def update_order_status(order_id):
     """Update order status"""
@@ -128,45 +132,225 @@ def update_order_status(order_id):
         if 'status' not in data:
             return jsonify({'error': 'Status is required'}), 400
         
-        valid_statuses = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'cancelled']
-        if data['status'] not in valid_statuses:
+        new_status = data['status']
+        if new_status not in ORDER_TRANSITIONS:
             return jsonify({'error': 'Invalid status'}), 400
+        if new_status == 'pending':
+            return submit_draft(order_id)
         
+        # Only update when the current status may move to the new one
+        allowed_from = [status for status, targets in ORDER_TRANSITIONS.items() if new_status in targets]
         orders = get_collection('orders')
-        result = orders.update_one(
-            {'_id': ObjectId(order_id)},
+        order = orders.find_one_and_update(
+            {'_id': ObjectId(order_id), 'status': {'$in': allowed_from}},
             {
                 '$set': {
-                    'status': data['status'],
-                    'updated_at': datetime.utcnow()
+                    'status': new_status,
+                    'updated_at': datetime.utcnow(),
+                    'change_seq': next_seq('orders')
                 }
-            }
+            },
+            projection={'retailer_id': 1, 'items.product_id': 1}
         )
         
-        if result.matched_count == 0:
-            return jsonify({'error': 'Order not found'}), 404
+        if order is None:
+            current = orders.find_one({'_id': ObjectId(order_id)}, {'status': 1})
+            if current is None:
+                return jsonify({'error': 'Order not found'}), 404
+            if current.get('status') == new_status:
+                return jsonify({'message': 'Order status unchanged'}), 200
+            return jsonify({
+                'error': f"Cannot change status from {current.get('status')} to {new_status}"
+            }), 409
+        
+        bump_version('orders', order_id)
+        publish_change('order', order_id, 'update', {'status': new_status},
+                       order_rooms(order, order_distributors([order])))
         
         return jsonify({'message': 'Order status updated successfully'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def submit_draft(order_id):
+    """Turn a draft order into a pending one, reserving its stock like create_order"""
+    orders = get_collection('orders').with_options(write_concern=DURABLE_WRITES)
+    draft = orders.find_one({'_id': ObjectId(order_id)}, {'status': 1, 'retailer_id': 1, 'items': 1, 'total_amount': 1})
+    if draft is None:
+        return jsonify({'error': 'Order not found'}), 404
+    if draft.get('status') == 'pending':
+        return jsonify({'message': 'Order status unchanged'}), 200
+    if draft.get('status') != 'draft':
+        return jsonify({'error': f"Cannot change status from {draft.get('status')} to pending"}), 409
+    
+    # Decrements are applied only once the order has left draft; if the
+    # status write below fails the entry is discarded (or orphaned)
+    notify = {'status': 'pending', 'total_amount': draft.get('total_amount', 0)}
+    stock_pipeline.enqueue(draft['_id'], draft['items'], draft.get('retailer_id'), notify)
+    try:
+        result = orders.update_one(
+            {'_id': draft['_id'], 'status': 'draft'},
+            {'$set': {'status': 'pending', 'updated_at': datetime.utcnow(), 'change_seq': next_seq('orders')}}
+        )
+    except Exception:
+        stock_pipeline.discard(draft['_id'])
+        raise
+    if result.modified_count == 0:
+        stock_pipeline.discard(draft['_id'])
+        return jsonify({'error': 'Order is no longer a draft'}), 409
+    
+    bump_version('orders', order_id)
+    publish_change('order', order_id, 'update', {'status': 'pending'},
+                   order_rooms(draft, order_distributors([draft])))
+    
+    return jsonify({'message': 'Order status updated successfully'}), 200
+
+@orders_bp.route('/status/bulk', methods=['PUT'])
+def bulk_update_order_status():
+    """Move many orders to a new status in one bulk write"""
+    try:
+        data = request.get_json()
+        
+        new_status = data.get('status')
+        order_ids = data.get('order_ids') or []
+        if new_status not in ORDER_TRANSITIONS:
+            return jsonify({'error': 'Invalid status'}), 400
+        if new_status == 'pending':
+            return jsonify({'error': 'Submit draft orders one at a time'}), 400
+        if not isinstance(order_ids, list) or not order_ids:
+            return jsonify({'error': 'order_ids must be a non-empty list'}), 400
+        if len(order_ids) > BULK_STATUS_LIMIT:
+            return jsonify({'error': f'At most {BULK_STATUS_LIMIT} orders per request'}), 400
+        
+        outcomes = {}
+        object_ids = []
+        for order_id in dict.fromkeys(str(order_id) for order_id in order_ids):
+            if ObjectId.is_valid(order_id):
+                object_ids.append(ObjectId(order_id))
+            else:
+                outcomes[order_id] = {'order_id': order_id, 'outcome': 'invalid_id'}
+        
+        orders = get_collection('orders')
+        found = {
+            order['_id']: order
+            for order in orders.find(
+                {'_id': {'$in': object_ids}},
+                {'status': 1, 'retailer_id': 1, 'items.product_id': 1}
+            )
+        }
+        
+        # Validate every transition, guarding each write on the status we read
+        now = datetime.utcnow()
+        attempted = []
+        for object_id in object_ids:
+            order_id = str(object_id)
+            order = found.get(object_id)
+            if order is None:
+                outcomes[order_id] = {'order_id': order_id, 'outcome': 'not_found'}
+                continue
+            
+            current = order.get('status')
+            outcome = {'order_id': order_id, 'from': current, 'to': new_status}
+            if current == new_status:
+                outcome['outcome'] = 'unchanged'
+            elif new_status not in ORDER_TRANSITIONS.get(current, []):
+                outcome['outcome'] = 'invalid_transition'
+            else:
+                outcome['outcome'] = 'updated'
+                attempted.append(object_id)
+            outcomes[order_id] = outcome
+        
+        if attempted:
+            first = next_seq('orders', len(attempted))
+            result = orders.bulk_write([
+                UpdateOne(
+                    {'_id': object_id, 'status': found[object_id]['status']},
+                    {'$set': {'status': new_status, 'updated_at': now, 'change_seq': first + offset}}
+                )
+                for offset, object_id in enumerate(attempted)
+            ], ordered=False)
+            
+            # Orders changed by someone else between the read and the write
+            if result.matched_count < len(attempted):
+                for order in orders.find({'_id': {'$in': attempted}}, {'status': 1}):
+                    if order.get('status') != new_status:
+                        outcomes[str(order['_id'])]['outcome'] = 'conflict'
+                        outcomes[str(order['_id'])]['from'] = order.get('status')
+        
+        updated = [found[ObjectId(order_id)] for order_id, outcome in outcomes.items()
+                   if outcome['outcome'] == 'updated']
+        if updated:
+            bump_version('orders', *[order['_id'] for order in updated])
+            publish_bulk_status_change(updated, new_status)
+        
+        summary = {}
+        for outcome in outcomes.values():
+            summary[outcome['outcome']] = summary.get(outcome['outcome'], 0) + 1
+        
+        return jsonify({
+            'status': new_status,
+            'results': list(outcomes.values()),
+            'summary': summary
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def publish_bulk_status_change(order_list, new_status):
+    """Publish one aggregated change per affected room for a bulk update"""
+    distributors = product_distributors(order_list)
+    by_room = {}
+    for order in order_list:
+        order_distributor_ids = {distributors.get(str(item.get('product_id'))) for item in order.get('items', [])}
+        for room in order_rooms(order, order_distributor_ids):
+            if room:
+                by_room.setdefault(room, []).append(str(order['_id']))
+    
+    batch_id = str(ObjectId())
+    for room, order_ids in by_room.items():
+        publish_change('order_batch', batch_id, 'update', {
+            'status': new_status,
+            'order_ids': order_ids
+        }, [room])
+
+def product_distributors(order_list):
+    """Map product IDs in the given orders to their distributor IDs"""
+    product_ids = set()
+    for order in order_list:
+        for item in order.get('items', []):
+            if item.get('product_id') and ObjectId.is_valid(str(item['product_id'])):
+                product_ids.add(ObjectId(item['product_id']))
+    if not product_ids:
+        return {}
+    
+    products = get_collection('products')
+    return {
+        str(product['_id']): product.get('distributor_id')
+        for product in products.find({'_id': {'$in': list(product_ids)}}, {'distributor_id': 1})
+    }
+
+def order_distributors(order_list):
+    """Distributor IDs owning the products in the given orders"""
+    return list(set(product_distributors(order_list).values()))
+
 @orders_bp.route('/stats', methods=['GET'])
+@conditional('orders')
 def get_order_stats():
     """Get order statistics"""
     try:
         orders = get_collection('orders')
         
-        # Get stats
-        total_orders = orders.count_documents({})
+        # Get stats (archived orders are all delivered or cancelled)
+        total_orders = (orders.count_documents({'status': {'$ne': 'draft'}})
+                        + get_collection(ARCHIVE).estimated_document_count())
         pending_orders = orders.count_documents({'status': 'pending'})
-        completed_orders = orders.count_documents({'status': 'delivered'})
+        completed_orders = count_orders({'status': 'delivered'})
         
         # Calculate total revenue
-        pipeline = [
+        pipeline = with_archive([
             {'$match': {'status': 'delivered'}},
             {'$group': {'_id': None, 'total_revenue': {'$sum': '$total_amount'}}}
-        ]
+        ])
         revenue_result = list(orders.aggregate(pipeline))
         total_revenue = revenue_result[0]['total_revenue'] if revenue_result else 0
         
@@ -1,12 +1,36 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from app.utils.database import get_collection
-from app.utils.auth import token_required
-from datetime import datetime
+from app.utils.auth import token_required, role_required
+from app.utils.broadcast import publish_change, product_rooms
+from app.utils.copurchase import copurchase, with_products
+from app.utils.product_import import ProductImport, open_error_file, detect_format, IMPORTS, IMPORT_FORMATS
+from app.utils.catalog import catalog, price_buckets, SORT_FIELDS, FACET_FIELDS, PRICE_BOUNDS, STOCK_STATUSES
+from app.utils.stock_history import stock_history, downsample, pick_resolution, RESOLUTIONS, DEFAULT_WINDOW, MAX_POINTS as MAX_HISTORY_POINTS
+from app.utils.stock_shards import sharded_stock
+from app.utils.sync import next_seq, record_tombstones
+from app.utils.versions import conditional, bump_version
+from datetime import datetime, timezone
 from bson import ObjectId
+from gridfs.errors import NoFile
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 products_bp = Blueprint('products', __name__)
 
+# Internal bookkeeping fields never returned to clients
+PRODUCT_PROJECTION = {'stock_batches': 0}
+
+# Upper bound on stock shards per product
+MAX_STOCK_SHARDS = 64
+
+# Upper bound on rows per catalog query page
+MAX_QUERY_LIMIT = 1000
+
+# Upper bound on price facet buckets
+MAX_PRICE_BUCKETS = 20
+
 @products_bp.route('/', methods=['GET'])
+@conditional('products')
 def get_products():
     """Get all products (with optional filters)"""
     try:
@@ -27,13 +51,7 @@ def get_products():
             query['name'] = {'$regex': search, '$options': 'i'}
         
         # Get products
-        product_list = list(products.find(query).limit(100))
-        
-        # Convert ObjectId to string
-        for product in product_list:
-            product['_id'] = str(product['_id'])
-            if 'distributor_id' in product:
-                product['distributor_id'] = str(product['distributor_id'])
+        product_list = sharded_stock.overlay(list(products.find(query, PRODUCT_PROJECTION).limit(100)))
         
         return jsonify({
             'products': product_list,
@@ -43,20 +61,155 @@ def get_products():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@products_bp.route('/query', methods=['GET'])
+def query_products():
+    """Filter, sort and page products from the in-memory columnar catalog"""
+    if not catalog.ready:
+        return jsonify({'error': 'Catalog is loading, please retry shortly'}), 503
+    
+    try:
+        sort = request.args.get('sort')
+        descending = bool(sort) and sort.startswith('-')
+        sort = sort.lstrip('-') if sort else None
+        if sort and sort not in SORT_FIELDS:
+            return jsonify({'error': f"sort must be one of: {', '.join(SORT_FIELDS)}"}), 400
+        
+        limit = request.args.get('limit', 100, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if not 1 <= limit <= MAX_QUERY_LIMIT or offset < 0:
+            return jsonify({'error': f'limit must be 1-{MAX_QUERY_LIMIT} and offset non-negative'}), 400
+        
+        product_list, total, version = catalog.query(
+            sort=sort,
+            descending=descending,
+            limit=limit,
+            offset=offset,
+            with_total=request.args.get('include_total') == 'true',
+            **catalog_filters()
+        )
+        
+        response = jsonify({
+            'products': product_list,
+            'count': len(product_list),
+            'total': total,
+            'version': version
+        })
+        response.headers['X-Catalog-Version'] = str(version)
+        return response, 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def catalog_filters():
+    """Catalog filter keyword arguments from the query string"""
+    return {
+        'category': request.args.get('category'),
+        'brand': request.args.get('brand'),
+        'supplier': request.args.get('supplier'),
+        'distributor_id': request.args.get('distributor_id'),
+        'min_price': request.args.get('min_price', type=float),
+        'max_price': request.args.get('max_price', type=float),
+        'stock_status': request.args.get('stock_status'),
+        'active_only': request.args.get('active') == 'true'
+    }
+
+@products_bp.route('/facets', methods=['GET'])
+def get_facets():
+    """Category, brand, supplier, price-bucket and stock-status counts for a filter"""
+    try:
+        filters = catalog_filters()
+        if filters['stock_status'] is not None and filters['stock_status'] not in STOCK_STATUSES:
+            return jsonify({'error': f"stock_status must be one of: {', '.join(STOCK_STATUSES)}"}), 400
+        
+        bounds = PRICE_BOUNDS
+        if request.args.get('price_buckets'):
+            try:
+                bounds = tuple(sorted({float(value) for value in request.args['price_buckets'].split(',')}))
+            except ValueError:
+                return jsonify({'error': 'price_buckets must be comma-separated numbers'}), 400
+            if len(bounds) > MAX_PRICE_BUCKETS:
+                return jsonify({'error': f'At most {MAX_PRICE_BUCKETS} price buckets'}), 400
+        
+        if catalog.ready:
+            facets, total, version = catalog.facets(price_bounds=bounds, **filters)
+            response = jsonify({'facets': facets, 'total': total, 'version': version, 'source': 'catalog'})
+            response.headers['X-Catalog-Version'] = str(version)
+            return response, 200
+        
+        # Catalog still loading: one $facet aggregation instead
+        products = get_collection('products')
+        result = next(products.aggregate(facet_pipeline(filters, bounds)), {})
+        facets = {
+            field: [{'value': group['_id'], 'count': group['count']} for group in result.get(field, [])]
+            for field in FACET_FIELDS
+        }
+        counts = dict.fromkeys(range(len(bounds) + 1), 0)
+        for group in result.get('price', []):
+            counts[0 if group['_id'] == 'below' else bounds.index(group['_id']) + 1] = group['count']
+        facets['price'] = price_buckets(bounds, list(counts.values()))
+        stock_counts = {group['_id']: group['count'] for group in result.get('stock_status', [])}
+        facets['stock_status'] = {status: stock_counts.get(status, 0) for status in STOCK_STATUSES}
+        total = result['total'][0]['count'] if result.get('total') else 0
+        
+        return jsonify({'facets': facets, 'total': total, 'source': 'database'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def facet_pipeline(filters, bounds):
+    """$facet aggregation equivalent to ColumnarCatalog.facets"""
+    match = {field: filters[field] for field in ('category', 'brand', 'supplier', 'distributor_id')
+             if filters[field] is not None}
+    if filters['min_price'] is not None or filters['max_price'] is not None:
+        match['price'] = {}
+        if filters['min_price'] is not None:
+            match['price']['$gte'] = filters['min_price']
+        if filters['max_price'] is not None:
+            match['price']['$lte'] = filters['max_price']
+    if filters['active_only']:
+        match['is_active'] = {'$ne': False}
+    
+    stock_status = {'$switch': {
+        'branches': [
+            {'case': {'$lte': ['$stock', 0]}, 'then': 'out_of_stock'},
+            {'case': {'$lte': ['$stock', '$min_stock']}, 'then': 'low_stock'}
+        ],
+        'default': 'in_stock'
+    }}
+    if filters['stock_status'] is not None:
+        match['$expr'] = {'$eq': [stock_status, filters['stock_status']]}
+    
+    def count_by(expression):
+        return [{'$group': {'_id': expression, 'count': {'$sum': 1}}}, {'$sort': {'count': -1, '_id': 1}}]
+    
+    return [
+        {'$match': match},
+        {'$facet': {
+            **{field: count_by(f'${field}') for field in FACET_FIELDS},
+            'price': [{'$bucket': {
+                'groupBy': '$price',
+                'boundaries': list(bounds) + [float('inf')],
+                'default': 'below'
+            }}],
+            'stock_status': count_by(stock_status),
+            'total': [{'$count': 'count'}]
+        }}
+    ]
+
 @products_bp.route('/<product_id>', methods=['GET'])
+@conditional('products', doc_arg='product_id')
 def get_product(product_id):
     """Get single product by ID"""
     try:
         products = get_collection('products')
-        product = products.find_one({'_id': ObjectId(product_id)})
+        product = products.find_one({'_id': ObjectId(product_id)}, PRODUCT_PROJECTION)
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        product['_id'] = str(product['_id'])
-        if 'distributor_id' in product:
-            product['distributor_id'] = str(product['distributor_id'])
-        
+        sharded_stock.overlay([product])
         return jsonify({'product': product}), 200
         
     except Exception as e:
@@ -90,10 +243,20 @@ def create_product():
             'distributor_id': data.get('distributor_id', ''),
             'is_active': True,
             'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
+            'updated_at': datetime.utcnow(),
+            'change_seq': next_seq('products')
         }
         
-        result = products.insert_one(product_doc)
+        if data.get('sku'):
+            product_doc['sku'] = str(data['sku'])
+        
+        try:
+            result = products.insert_one(product_doc)
+        except DuplicateKeyError:
+            return jsonify({'error': 'A product with this SKU already exists'}), 409
+        bump_version('products', result.inserted_id)
+        stock_history.record(result.inserted_id, product_doc['stock'], 'create')
+        publish_change('product', result.inserted_id, 'create', product_doc, product_rooms(product_doc))
         
         return jsonify({
             'message': 'Product created successfully',
@@ -116,41 +279,259 @@ def update_product(product_id):
         }
         
         allowed_fields = ['name', 'description', 'category', 'price', 'mrp', 
-                         'stock', 'min_stock', 'unit', 'brand', 'image_url', 'is_active']
+                         'stock', 'min_stock', 'unit', 'brand', 'image_url', 'is_active', 'sku']
         
         for field in allowed_fields:
             if field in data:
                 update_data[field] = data[field]
         
-        result = products.update_one(
-            {'_id': ObjectId(product_id)},
-            {'$set': update_data}
-        )
+        update_data['change_seq'] = next_seq('products')
         
-        if result.matched_count == 0:
+        try:
+            previous = products.find_one_and_update(
+                {'_id': ObjectId(product_id)},
+                {'$set': update_data},
+                projection={'distributor_id': 1, 'category': 1, 'sharded_stock': 1, 'stock_shards': 1},
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            return jsonify({'error': 'A product with this SKU already exists'}), 409
+        
+        if previous is None:
             return jsonify({'error': 'Product not found'}), 404
         
+        # Stock of a sharded product lives in its shards; the document keeps a copy
+        if 'stock' in update_data and previous.get('sharded_stock'):
+            sharded_stock.reset(product_id, int(data['stock']), previous.get('stock_shards'))
+        
+        # Notify both the old and new category rooms when a product moves
+        rooms = product_rooms(previous) + product_rooms({**previous, **update_data})
+        bump_version('products', product_id)
+        if 'stock' in update_data:
+            stock_history.record(product_id, update_data['stock'], 'update')
+        publish_change('product', product_id, 'update', update_data, rooms)
+        
         return jsonify({'message': 'Product updated successfully'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@products_bp.route('/import', methods=['POST'])
+@token_required
+@role_required(['distributor', 'admin'])
+def import_products():
+    """Create or update a distributor's products from a CSV or NDJSON upload
+
+    The upload is either the raw request body (Content-Type text/csv or
+    application/x-ndjson) or a multipart `file` field. Rows are upserted
+    by SKU while the body is read; progress goes to the distributor's room
+    as `import_progress` events and rejected rows to a downloadable CSV.
+    """
+    try:
+        if request.user.get('role') == 'admin':
+            distributor_id = request.args.get('distributor_id')
+            if not distributor_id:
+                return jsonify({'error': 'distributor_id is required'}), 400
+        else:
+            distributor_id = request.user['user_id']
+        
+        filename = None
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({'error': 'Missing file'}), 400
+            stream, filename = upload.stream, upload.filename
+            fmt = detect_format(upload.mimetype, filename)
+        else:
+            stream = request.stream
+            fmt = detect_format(request.content_type)
+        fmt = request.args.get('format', fmt)
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'error': f"Unsupported format, use one of: {', '.join(IMPORT_FORMATS)}"}), 400
+        
+        product_import = ProductImport(distributor_id, fmt, filename, request.user['user_id'])
+        summary = product_import.run(stream)
+        if summary['inserted'] or summary['updated']:
+            bump_version('products')
+        
+        if summary['errors']:
+            summary['error_file'] = f"/api/products/import/{summary['_id']}/errors"
+        return jsonify(summary), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/import/<import_id>', methods=['GET'])
+@token_required
+@role_required(['distributor', 'admin'])
+def get_import(import_id):
+    """Status and counts of a product import"""
+    try:
+        summary = get_collection(IMPORTS).find_one({'_id': ObjectId(import_id)})
+        if summary is None or not can_access_import(summary):
+            return jsonify({'error': 'Import not found'}), 404
+        
+        if summary['errors']:
+            summary['error_file'] = f"/api/products/import/{summary['_id']}/errors"
+        return jsonify(summary), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/import/<import_id>/errors', methods=['GET'])
+@token_required
+@role_required(['distributor', 'admin'])
+def download_import_errors(import_id):
+    """Rejected rows of an import as CSV (row, error, data)"""
+    try:
+        summary = get_collection(IMPORTS).find_one({'_id': ObjectId(import_id)}, {'distributor_id': 1})
+        if summary is None or not can_access_import(summary):
+            return jsonify({'error': 'Import not found'}), 404
+        try:
+            error_file = open_error_file(import_id)
+        except NoFile:
+            return jsonify({'error': 'Import has no rejected rows'}), 404
+        
+        response = Response(iter(lambda: error_file.read(error_file.chunk_size), b''), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={error_file.filename}'
+        response.headers['Content-Length'] = str(error_file.length)
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def can_access_import(summary):
+    """Admins see every import, distributors their own"""
+    return request.user.get('role') == 'admin' or summary['distributor_id'] == request.user['user_id']
+
 @products_bp.route('/<product_id>', methods=['DELETE'])
 def delete_product(product_id):
     """Delete product (Distributor only)"""
     try:
         products = get_collection('products')
-        result = products.delete_one({'_id': ObjectId(product_id)})
+        deleted = products.find_one_and_delete(
+            {'_id': ObjectId(product_id)},
+            projection={'distributor_id': 1, 'category': 1, 'sharded_stock': 1}
+        )
         
-        if result.deleted_count == 0:
+        if deleted is None:
             return jsonify({'error': 'Product not found'}), 404
         
+        if deleted.get('sharded_stock'):
+            sharded_stock.disable(product_id)
+        
+        record_tombstones('products', [{
+            '_id': deleted['_id'],
+            'distributor_id': deleted.get('distributor_id'),
+            'category': deleted.get('category')
+        }])
+        bump_version('products', product_id)
+        publish_change('product', product_id, 'delete', rooms=product_rooms(deleted))
+        
         return jsonify({'message': 'Product deleted successfully'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@products_bp.route('/<product_id>/history', methods=['GET'])
+def get_stock_history(product_id):
+    """Get downsampled stock history (min/max/last per bucket)"""
+    try:
+        end = parse_time(request.args.get('to')) or datetime.utcnow()
+        start = parse_time(request.args.get('from')) or end - DEFAULT_WINDOW
+        if start >= end:
+            return jsonify({'error': '`from` must be before `to`'}), 400
+        
+        resolution = request.args.get('resolution') or pick_resolution(start, end)
+        if resolution not in RESOLUTIONS:
+            return jsonify({'error': f"resolution must be one of: {', '.join(RESOLUTIONS)}"}), 400
+        if (end - start).total_seconds() / RESOLUTIONS[resolution][2] > MAX_HISTORY_POINTS:
+            return jsonify({'error': f'Too many {resolution} buckets; use a coarser resolution'}), 400
+        
+        points = downsample(product_id, start, end, resolution)
+        
+        return jsonify({
+            'product_id': product_id,
+            'from': start,
+            'to': end,
+            'resolution': resolution,
+            'points': points,
+            'count': len(points)
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/<product_id>/related', methods=['GET'])
+def get_related_products(product_id):
+    """Products most often bought together with this one"""
+    if not copurchase.ready:
+        return jsonify({'error': 'Recommendations are loading, please retry shortly'}), 503
+    
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= copurchase.top_k:
+        return jsonify({'error': f'limit must be 1-{copurchase.top_k}'}), 400
+    
+    neighbors = copurchase.related(product_id, limit)
+    related = with_products(neighbors)
+    co_purchases = {neighbor_id: count for neighbor_id, _, count in neighbors}
+    for product in related:
+        product['co_purchases'] = co_purchases[product['product_id']]
+    
+    return jsonify({
+        'product_id': product_id,
+        'related': related,
+        'count': len(related)
+    }), 200
+
+def parse_time(value):
+    """Parse an ISO 8601 query parameter into a naive UTC datetime"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid timestamp: {value}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@products_bp.route('/<product_id>/sharding', methods=['PUT'])
+@token_required
+@role_required(['admin', 'distributor'])
+def set_stock_sharding(product_id):
+    """Enable or disable sharded stock counters for a high-contention product"""
+    try:
+        data = request.get_json() or {}
+        if 'shards' not in data:
+            return jsonify({'error': 'shards is required (0 disables sharding)'}), 400
+        shards = int(data['shards'])
+        if shards < 0 or shards > MAX_STOCK_SHARDS:
+            return jsonify({'error': f'shards must be between 0 and {MAX_STOCK_SHARDS}'}), 400
+        
+        if shards:
+            stock = sharded_stock.enable(product_id, shards)
+        else:
+            stock = sharded_stock.disable(product_id)
+        
+        if stock is None:
+            return jsonify({'error': 'Product not found'}), 404
+        
+        bump_version('products', product_id)
+        
+        return jsonify({
+            'message': 'Stock sharding updated successfully',
+            'shards': shards,
+            'stock': stock
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @products_bp.route('/categories', methods=['GET'])
+@conditional('products')
 def get_categories():
     """Get all product categories"""
     try:
@@ -163,20 +544,16 @@ def get_categories():
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/low-stock', methods=['GET'])
+@conditional('products')
 def get_low_stock():
     """Get products with low stock"""
     try:
         products = get_collection('products')
         
         # Find products where stock <= min_stock
-        low_stock_products = list(products.find({
+        low_stock_products = sharded_stock.overlay(list(products.find({
             '$expr': {'$lte': ['$stock', '$min_stock']}
-        }).limit(50))
-        
-        for product in low_stock_products:
-            product['_id'] = str(product['_id'])
-            if 'distributor_id' in product:
-                product['distributor_id'] = str(product['distributor_id'])
+        }, PRODUCT_PROJECTION).limit(50)))
         
         return jsonify({
             'products': low_stock_products,
@@ -0,0 +1,75 @@
+from flask import Blueprint, request, jsonify
+from app.routes.products import PRODUCT_PROJECTION
+from app.utils.auth import token_required
+from app.utils.stock_shards import sharded_stock
+from app.utils.sync import changes_since
+
+sync_bp = Blueprint('sync', __name__)
+
+DEFAULT_SYNC_LIMIT = 500
+MAX_SYNC_LIMIT = 1000
+
+def sync_window():
+    """(since, limit) from the query string; raises ValueError"""
+    try:
+        since = int(request.args.get('since') or 0)
+    except ValueError:
+        since = -1
+    if since < 0:
+        raise ValueError('since must be a token returned by an earlier sync')
+    limit = request.args.get('limit', DEFAULT_SYNC_LIMIT, type=int)
+    return since, max(1, min(limit, MAX_SYNC_LIMIT))
+
+@sync_bp.route('/products', methods=['GET'])
+@token_required
+def sync_products():
+    """Products changed or deleted since a sync token (omit it for a full sync)"""
+    try:
+        since, limit = sync_window()
+
+        query = {}
+        if request.args.get('distributor_id'):
+            query['distributor_id'] = request.args['distributor_id']
+        if request.args.get('category'):
+            query['category'] = request.args['category']
+
+        product_list, deleted, token, has_more = changes_since('products', since, limit, query, PRODUCT_PROJECTION)
+
+        return jsonify({
+            'products': sharded_stock.overlay(product_list),
+            'deleted': deleted,
+            'token': str(token),
+            'has_more': has_more
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@sync_bp.route('/orders', methods=['GET'])
+@token_required
+def sync_orders():
+    """Orders changed or deleted since a sync token; retailers get their own"""
+    try:
+        since, limit = sync_window()
+
+        query = {}
+        if request.user.get('role') == 'retailer':
+            query['retailer_id'] = request.user['user_id']
+        elif request.args.get('retailer_id'):
+            query['retailer_id'] = request.args['retailer_id']
+
+        order_list, deleted, token, has_more = changes_since('orders', since, limit, query)
+
+        return jsonify({
+            'orders': order_list,
+            'deleted': deleted,
+            'token': str(token),
+            'has_more': has_more
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,160 @@
+import math
+import threading
+import time
+from flask import request, jsonify, g
+from app.utils.auth import decode_token
+from app.utils.batch import batch_cached
+from app.utils.metrics import metrics
+
+# Priority classes, most important first. `share` is the fraction of total
+# capacity a class may fill, so lower classes are shed before higher ones;
+# `route_limit` caps concurrent requests to any single endpoint of the class.
+PRIORITY_CLASSES = {
+    'orders': {'share': 1.0, 'route_limit': None, 'rate': None, 'burst': None},
+    'catalog': {'share': 0.8, 'route_limit': None, 'rate': 20.0, 'burst': 40},
+    'analytics': {'share': 0.5, 'route_limit': 4, 'rate': 2.0, 'burst': 10},
+}
+
+# Buckets idle longer than this are forgotten
+BUCKET_IDLE_TTL = 600
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens/second"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def take(self):
+        """Take one token; returns 0 on success or seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class AdmissionController:
+    """In-memory admission control for API requests
+
+    Each request is put in a priority class. It is rejected with 429 when
+    the caller's token bucket for that class is empty, when its endpoint
+    is at the class's route limit, or when admitting it would push total
+    in-flight requests past the class's share of `capacity`. Order writes
+    may use all of it, analytics only half.
+    """
+
+    def __init__(self, capacity=64, classes=None):
+        self.capacity = capacity
+        self.classes = {name: dict(options) for name, options in (classes or PRIORITY_CLASSES).items()}
+        self._lock = threading.Lock()
+        self._in_flight = {name: 0 for name in self.classes}
+        self._route_in_flight = {}
+        self._buckets = {}
+        self._swept_at = time.monotonic()
+
+    def configure(self, capacity=None, analytics_rate=None, analytics_burst=None):
+        """Override defaults from app config"""
+        if capacity is not None:
+            self.capacity = capacity
+        if analytics_rate is not None:
+            self.classes['analytics']['rate'] = analytics_rate
+        if analytics_burst is not None:
+            self.classes['analytics']['burst'] = analytics_burst
+
+    def try_admit(self, priority, user_key, endpoint=None):
+        """Admit a request; returns None or the Retry-After seconds"""
+        options = self.classes[priority]
+        with self._lock:
+            if sum(self._in_flight.values()) >= self.capacity * options['share']:
+                metrics.incr(f'admission.shed.{priority}')
+                return 1
+            if options['route_limit'] and self._route_in_flight.get(endpoint, 0) >= options['route_limit']:
+                metrics.incr(f'admission.shed.{priority}')
+                return 1
+
+            if options['rate']:
+                bucket = self._buckets.get((priority, user_key))
+                if bucket is None:
+                    bucket = self._buckets[(priority, user_key)] = TokenBucket(options['rate'], options['burst'])
+                wait = bucket.take()
+                if wait:
+                    metrics.incr(f'admission.rate_limited.{priority}')
+                    return wait
+
+            self._in_flight[priority] += 1
+            self._route_in_flight[endpoint] = self._route_in_flight.get(endpoint, 0) + 1
+            metrics.set_gauge(f'admission.in_flight.{priority}', self._in_flight[priority])
+            self._sweep()
+        return None
+
+    def release(self, priority, endpoint=None):
+        with self._lock:
+            self._in_flight[priority] -= 1
+            self._route_in_flight[endpoint] -= 1
+            metrics.set_gauge(f'admission.in_flight.{priority}', self._in_flight[priority])
+
+    def stats(self):
+        return {'capacity': self.capacity, 'in_flight': dict(self._in_flight), 'buckets': len(self._buckets)}
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self._swept_at < BUCKET_IDLE_TTL:
+            return
+        self._swept_at = now
+        for key in [key for key, bucket in self._buckets.items() if now - bucket.updated_at > BUCKET_IDLE_TTL]:
+            del self._buckets[key]
+
+# Global admission controller
+admission = AdmissionController()
+
+def request_priority():
+    """Priority class of the current request, or None when not controlled"""
+    blueprint = request.blueprint
+    if blueprint == 'orders':
+        return 'orders' if request.method != 'GET' else 'catalog'
+    if blueprint in ('products', 'sync'):
+        return 'catalog'
+    if blueprint == 'analytics':
+        return 'analytics'
+    return None
+
+def request_user_key():
+    """Token subject when the request is authenticated, else the client address"""
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.split(' ')[1] if auth_header.startswith('Bearer ') else None
+    if token:
+        payload = batch_cached(('token', token), lambda: decode_token(token))
+        if payload:
+            return f"user:{payload.get('user_id') or payload.get('email')}"
+    return f'ip:{request.remote_addr}'
+
+def init_admission(app):
+    """Register admission checks on the app"""
+
+    @app.before_request
+    def admit_request():
+        priority = request_priority()
+        if priority is None:
+            return None
+        retry_after = admission.try_admit(priority, request_user_key(), request.endpoint)
+        if retry_after is not None:
+            response = jsonify({'error': 'Too many requests, please retry later', 'priority': priority})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            return response
+        g.admission_priority = priority
+        return None
+
+    @app.teardown_request
+    def release_request(exc=None):
+        priority = g.pop('admission_priority', None)
+        if priority is not None:
+            admission.release(priority, request.endpoint)
+
+    return admission
@@ -3,6 +3,7 @@ import bcrypt
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify
+from app.utils.batch import batch_cached
 import os
 
 SECRET_KEY = os.getenv('JWT_SECRET', 'qwipo-jwt-secret-2024')
@@ -64,8 +65,8 @@ def token_required(f):
         if not token:
             return jsonify({'error': 'Token is missing'}), 401
         
-        # Decode token
-        payload = decode_token(token)
+        # Decode token (once per batch when called from /api/batch)
+        payload = batch_cached(('token', token), lambda: decode_token(token))
         if payload is None:
             return jsonify({'error': 'Token is invalid or expired'}), 401
         
@@ -75,6 +76,17 @@ def token_required(f):
     
     return decorated
 
+def can_join_room(user, room):
+    """Whether a socket authenticated as `user` (a token payload) may join `room`
+
+    Category rooms are open to every signed-in user; retailer and
+    distributor rooms only to the user they belong to.
+    """
+    if room.startswith('category:'):
+        return True
+    role = user.get('role')
+    return role in ('retailer', 'distributor') and room == f"{role}:{user.get('user_id')}"
+
 def role_required(allowed_roles):
     """Decorator to check if user has required role"""
     def decorator(f):
@@ -0,0 +1,122 @@
+import threading
+from flask import request, has_request_context
+from werkzeug.test import EnvironBuilder
+from app.utils import realtime
+from app.utils.metrics import metrics
+
+# WSGI environ key carrying the cache shared by the sub-requests of one batch
+BATCH_ENVIRON_KEY = 'qwipo.batch'
+
+# Request headers copied from the batch request into every sub-request
+FORWARDED_HEADERS = ('Authorization', 'Accept-Language')
+
+class BatchCache:
+    """Values computed once and shared by all sub-requests of a batch
+
+    The first sub-request asking for a key computes it; concurrent ones
+    wait for that result instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._pending = {}
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._values:
+                metrics.incr('batch.cache_hits')
+                return self._values[key]
+            event = self._pending.get(key)
+            owner = event is None
+            if owner:
+                event = self._pending[key] = realtime.create_event()
+
+        if not owner:
+            event.wait()
+            with self._lock:
+                if key in self._values:
+                    metrics.incr('batch.cache_hits')
+                    return self._values[key]
+            # The owner failed; compute without sharing
+            return loader()
+
+        try:
+            value = loader()
+            with self._lock:
+                self._values[key] = value
+            return value
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            event.set()
+
+def batch_cached(key, loader):
+    """Share loader() across the sub-requests of the current batch
+
+    Outside a batch this simply calls loader().
+    """
+    cache = request.environ.get(BATCH_ENVIRON_KEY) if has_request_context() else None
+    if cache is None:
+        return loader()
+    return cache.get(key, loader)
+
+def dispatch_batch(app, items, headers, remote_addr=None):
+    """Run GET sub-requests concurrently through the app's URL map
+
+    Each item is {'id', 'path', 'headers'}; returns one result per item,
+    in order, with the sub-response's status, ETag and decoded body.
+    Sub-requests carry the batch request's client address.
+    """
+    cache = BatchCache()
+    results = [None] * len(items)
+    done = realtime.create_event()
+    remaining = [len(items)]
+    lock = threading.Lock()
+
+    def run(index, item):
+        try:
+            results[index] = dispatch_one(app, item, headers, cache, remote_addr)
+        except Exception as e:
+            results[index] = {'id': item.get('id'), 'status': 500, 'body': {'error': str(e)}}
+        finally:
+            with lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                done.set()
+
+    for index, item in enumerate(items):
+        realtime.start_background_task(run, index, item)
+    done.wait()
+    metrics.incr('batch.subrequests', len(items))
+    return results
+
+def dispatch_one(app, item, headers, cache, remote_addr=None):
+    """Dispatch one sub-request in its own request context"""
+    path, _, query_string = item['path'].partition('?')
+    sub_headers = {name: value for name, value in headers.items() if name in FORWARDED_HEADERS}
+    if item.get('headers', {}).get('If-None-Match'):
+        sub_headers['If-None-Match'] = item['headers']['If-None-Match']
+
+    builder = EnvironBuilder(path=path, query_string=query_string, method='GET', headers=sub_headers,
+                             environ_base={'REMOTE_ADDR': remote_addr} if remote_addr else None)
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    environ[BATCH_ENVIRON_KEY] = cache
+
+    with app.request_context(environ):
+        response = app.full_dispatch_request()
+        if response.status_code == 304:
+            body = None
+        elif response.is_json:
+            body = response.get_json()
+        else:
+            body = response.get_data(as_text=True)
+
+    result = {'id': item.get('id'), 'status': response.status_code, 'body': body}
+    if response.headers.get('ETag'):
+        result['etag'] = response.headers['ETag']
+    return result
@@ -0,0 +1,187 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from bson import ObjectId
+from app.utils import realtime
+from app.utils.metrics import metrics
+
+class ChangeBroadcaster:
+    """Coalesces data change events per room and fans them out over Socket.IO
+
+    Writes publish changes to the rooms they affect. Every `window`
+    seconds each room receives one `changes` message holding the latest
+    version of every changed document, so a burst of updates to the same
+    product collapses into a single entry. Connections whose outgoing
+    Engine.IO queue is backed up are skipped and their updates parked in
+    a bounded per-connection buffer where newer updates replace older
+    ones; the buffer is flushed once the client catches up.
+    """
+
+    def __init__(self, window=0.25, max_buffered=100, slow_backlog=32):
+        self.window = window
+        self.max_buffered = max_buffered
+        self.slow_backlog = slow_backlog
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._stalled = {}
+        self._listeners = []
+        self._started = False
+
+    def configure(self, window=None, max_buffered=None, slow_backlog=None):
+        """Override defaults from app config"""
+        if window is not None:
+            self.window = window
+        if max_buffered is not None:
+            self.max_buffered = max_buffered
+        if slow_backlog is not None:
+            self.slow_backlog = slow_backlog
+
+    def start(self):
+        """Start the background flush loop (idempotent)"""
+        if self._started:
+            return
+        self._started = True
+        realtime.start_background_task(self._run)
+
+    def subscribe(self, listener):
+        """Call listener(change, rooms) for every change published in this process"""
+        self._listeners.append(listener)
+
+    def publish(self, entity, doc_id, op, data=None, rooms=()):
+        """Queue a change event for the given rooms"""
+        change = {
+            'entity': entity,
+            'id': str(doc_id) if doc_id is not None else None,
+            'op': op,
+            'data': _plain(data or {}),
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        rooms = [room for room in dict.fromkeys(rooms) if room]
+
+        with self._lock:
+            for room in rooms:
+                changes = self._pending.setdefault(room, OrderedDict())
+                _merge(changes, (entity, change['id']), change)
+        metrics.incr('changes.published')
+
+        for listener in list(self._listeners):
+            try:
+                listener(change, rooms)
+            except Exception as e:
+                print(f"✗ Change listener error: {e}")
+        return change
+
+    def flush(self):
+        """Deliver everything coalesced since the last flush"""
+        socketio = realtime.get_socketio()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if socketio is None:
+            return
+
+        for room, changes in pending.items():
+            slow = [sid for sid, eio_sid in _participants(socketio, room)
+                    if self._backlog(socketio, eio_sid) > self.slow_backlog]
+            for sid in slow:
+                self._park(sid, room, changes)
+
+            socketio.emit('changes', {
+                'room': room,
+                'changes': list(changes.values())
+            }, to=room, skip_sid=slow or None)
+            metrics.incr('changes.messages')
+            metrics.incr('changes.coalesced', len(changes))
+
+        self._retry_stalled(socketio)
+
+    def _run(self):
+        while True:
+            realtime.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"✗ Change broadcast error: {e}")
+
+    def _backlog(self, socketio, eio_sid):
+        eio_socket = socketio.server.eio.sockets.get(eio_sid)
+        if eio_socket is None:
+            return 0
+        return eio_socket.queue.qsize()
+
+    def _park(self, sid, room, changes):
+        with self._lock:
+            buffered = self._stalled.setdefault(sid, OrderedDict())
+            for key, change in changes.items():
+                _merge(buffered, (room,) + key, change)
+                metrics.incr('changes.parked')
+            while len(buffered) > self.max_buffered:
+                buffered.popitem(last=False)
+                metrics.incr('changes.dropped')
+            metrics.set_gauge('changes.stalled_connections', len(self._stalled))
+
+    def _retry_stalled(self, socketio):
+        with self._lock:
+            stalled = list(self._stalled.items())
+
+        for sid, buffered in stalled:
+            eio_sid = socketio.server.manager.eio_sid_from_sid(sid, '/')
+            if eio_sid is None:
+                with self._lock:
+                    self._stalled.pop(sid, None)
+                continue
+            if self._backlog(socketio, eio_sid) > self.slow_backlog:
+                continue
+
+            with self._lock:
+                buffered = self._stalled.pop(sid, OrderedDict())
+                metrics.set_gauge('changes.stalled_connections', len(self._stalled))
+            by_room = OrderedDict()
+            for (room, _, _), change in buffered.items():
+                by_room.setdefault(room, []).append(change)
+            for room, changes in by_room.items():
+                socketio.emit('changes', {'room': room, 'changes': changes}, to=sid)
+
+def _participants(socketio, room):
+    """Local (sid, eio_sid) pairs in a room; empty before anyone connects"""
+    try:
+        return list(socketio.server.manager.get_participants('/', room))
+    except KeyError:
+        return []
+
+def _merge(changes, key, change):
+    """Fold a change into a coalescing buffer, keeping the newest state"""
+    previous = changes.pop(key, None)
+    if previous is not None:
+        metrics.incr('changes.superseded')
+        if change['op'] == 'update' and previous['op'] in ('create', 'update'):
+            change = dict(change, op=previous['op'], data={**previous['data'], **change['data']})
+    changes[key] = change
+
+def _plain(value):
+    """Convert BSON values so the payload survives Socket.IO's JSON encoder"""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def product_rooms(product):
+    """Rooms interested in a product document"""
+    return [
+        f"distributor:{product['distributor_id']}" if product.get('distributor_id') else None,
+        f"category:{product['category']}" if product.get('category') else None
+    ]
+
+def order_rooms(order, distributor_ids=()):
+    """Rooms interested in an order document"""
+    rooms = [f"retailer:{order['retailer_id']}" if order.get('retailer_id') else None]
+    rooms.extend(f'distributor:{distributor_id}' for distributor_id in distributor_ids if distributor_id)
+    return rooms
+
+# Global change broadcaster
+broadcaster = ChangeBroadcaster()
+publish_change = broadcaster.publish
@@ -0,0 +1,555 @@
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from app.utils import realtime
+from app.utils.broadcast import broadcaster
+from app.utils.database import get_collection, get_status
+from app.utils.metrics import metrics
+from app.utils.sync import TOMBSTONES, SYNC_SETTLE
+
+# Product fields held as dictionary-encoded columns
+CODED_FIELDS = ('category', 'brand', 'supplier', 'distributor_id')
+
+# Product fields held as numeric columns: field -> (dtype, default)
+NUMERIC_FIELDS = {
+    'price': (np.float64, 0.0),
+    'stock': (np.int64, 0),
+    'min_stock': (np.int64, 0),
+    'updated_at': (np.float64, 0.0),
+}
+
+# Fields a query can sort by (each has a sorted index)
+SORT_FIELDS = ('price', 'stock', 'min_stock', 'updated_at')
+
+# Stock status filters accepted by queries
+STOCK_STATUSES = ('in_stock', 'low_stock', 'out_of_stock')
+
+# Facets counted by value
+FACET_FIELDS = ('category', 'brand', 'supplier')
+
+# Default price bucket lower bounds for facet counts
+PRICE_BOUNDS = (0, 50, 100, 250, 500, 1000)
+
+# Facet results kept per catalog version
+FACET_CACHE_SIZE = 64
+
+# Projection used when loading products from MongoDB
+CATALOG_PROJECTION = {
+    'name': 1, 'category': 1, 'brand': 1, 'supplier': 1, 'distributor_id': 1,
+    'price': 1, 'stock': 1, 'min_stock': 1, 'is_active': 1, 'updated_at': 1
+}
+
+# Rows examined per step when walking an index for the first N matches
+WALK_CHUNK = 4096
+
+def price_buckets(bounds, counts):
+    """Price facet entries from per-bucket counts
+
+    counts[0] is the number of prices below bounds[0] (listed only when
+    non-zero); counts[i] those in [bounds[i-1], bounds[i]).
+    """
+    buckets = [{'min': None, 'max': bounds[0], 'count': counts[0]}] if counts[0] else []
+    for index, low in enumerate(bounds):
+        high = bounds[index + 1] if index + 1 < len(bounds) else None
+        buckets.append({'min': low, 'max': high, 'count': counts[index + 1]})
+    return buckets
+
+class Dictionary:
+    """Maps distinct string values to dense integer codes"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        value = '' if value is None else str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        """Code of an existing value, or -1"""
+        return self.codes.get(str(value), -1)
+
+class ColumnarCatalog:
+    """Process-local columnar snapshot of the products collection
+
+    Each tracked field is a NumPy array indexed by row; categorical fields
+    are dictionary-encoded int32 codes. Two kinds of index avoid full
+    scans: posting lists (rows grouped by code) for the coded fields and
+    a sorted row order per sortable field. Queries walk the most useful
+    index in chunks and stop once they have enough rows.
+
+    Rows are updated in place from product change events and by polling
+    `updated_at` and the product tombstones in sync_tombstones (for writes
+    and deletes made by other workers). Rows changed since an
+    index was built are "stale" for it: walks skip them and evaluate them
+    separately, so results stay exact. An index is rebuilt once enough of
+    its rows are stale. Deleted rows are masked out until the next full
+    reload. `version` increases with every applied change.
+    """
+
+    def __init__(self, poll_interval=2.0, reload_interval=600):
+        self.poll_interval = poll_interval
+        self.reload_interval = reload_interval
+        self.version = 0
+        self.loaded_at = None
+        self._lock = threading.RLock()
+        self._started = False
+        self._last_seen = None
+        self._tombstone_seq = None
+        self._recent = {}
+        self._facet_cache = {}
+        self._facet_version = None
+        self._reset(0)
+
+    def _reset(self, capacity):
+        capacity = max(capacity, 1024)
+        self.size = 0
+        self.rows = {}
+        self.ids = [None] * capacity
+        self.names = [None] * capacity
+        self.dictionaries = {field: Dictionary() for field in CODED_FIELDS}
+        self.codes = {field: np.full(capacity, -1, dtype=np.int32) for field in CODED_FIELDS}
+        self.numbers = {field: np.full(capacity, default, dtype=dtype)
+                        for field, (dtype, default) in NUMERIC_FIELDS.items()}
+        self.active = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+        # Indexes: 'coded' -> {field: (row order, codes in that order)}, sort field -> row order
+        self._indexes = {}
+        self._stale = {name: np.zeros(capacity, dtype=bool) for name in ('coded',) + SORT_FIELDS}
+        self._stale_rows = {name: [] for name in self._stale}
+
+    def configure(self, poll_interval=None):
+        """Override defaults from app config"""
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+
+    def start(self):
+        """Subscribe to product changes and start the refresher (idempotent)"""
+        if self._started:
+            return
+        self._started = True
+        broadcaster.subscribe(self._on_change)
+        realtime.start_background_task(self._run)
+
+    @property
+    def ready(self):
+        return self.loaded_at is not None
+
+    def get_many(self, product_ids):
+        """Product dicts for the given IDs, in order, skipping unknown or deleted ones"""
+        with self._lock:
+            rows = [self.rows[key] for key in map(str, product_ids) if key in self.rows]
+            return self._rows(np.asarray(rows, dtype=np.int64))
+
+    def stats(self):
+        return {'ready': self.ready, 'rows': len(self.rows), 'version': self.version}
+
+    def load(self):
+        """Full reload from MongoDB"""
+        started = time.perf_counter()
+        # Deletes recorded from here on are replayed by the next poll
+        last = get_collection(TOMBSTONES).find_one({'entity': 'products'}, {'change_seq': 1},
+                                                   sort=[('change_seq', -1)])
+        tombstone_seq = last['change_seq'] if last else 0
+        products = get_collection('products')
+        cursor = products.find({}, CATALOG_PROJECTION, batch_size=10000)
+        count = self.load_documents(cursor, products.estimated_document_count())
+        self._tombstone_seq = tombstone_seq
+        metrics.observe('catalog.load_time', time.perf_counter() - started)
+        return count
+
+    def load_documents(self, documents, expected=0):
+        """Replace the snapshot with the given product documents"""
+        with self._lock:
+            self._reset(int(expected * 1.1))
+            latest = None
+            for doc in documents:
+                self._upsert(doc)
+                if doc.get('updated_at') and (latest is None or doc['updated_at'] > latest):
+                    latest = doc['updated_at']
+            for name in self._stale:
+                self._build(name)
+            self._last_seen = latest or datetime.utcnow()
+            self.loaded_at = time.time()
+            self.version += 1
+            metrics.set_gauge('catalog.rows', self.size)
+            return self.size
+
+    def apply(self, doc):
+        """Insert or update one product (partial documents update only their fields)"""
+        with self._lock:
+            self._upsert(doc)
+            self.version += 1
+
+    def remove(self, product_id):
+        with self._lock:
+            row = self.rows.pop(str(product_id), None)
+            if row is not None:
+                self.alive[row] = False
+                self.version += 1
+
+    def query(self, sort=None, descending=False, limit=100, offset=0, with_total=False, **filters):
+        """Filter, sort and page the catalog
+
+        `filters` are the keyword arguments of `_spec`. Returns (rows,
+        total, version); total is None unless with_total.
+        """
+        if sort is not None and sort not in SORT_FIELDS:
+            raise ValueError(f'Cannot sort by {sort}')
+
+        with self._lock:
+            spec = self._spec(**filters)
+            candidates = self._candidates(spec)
+            wanted = offset + limit
+            if sort is None:
+                matches = self._scan(candidates, spec, wanted)
+            elif candidates is not None and len(candidates) * len(candidates) < wanted * self.size:
+                # Few candidates: filter them all and sort what is left
+                matches = self._top(candidates[self._evaluate(candidates, spec)], sort, descending, wanted)
+            else:
+                matches = self._walk(sort, descending, spec, wanted)
+
+            total = None
+            if with_total:
+                rows = candidates if candidates is not None else slice(0, self.size)
+                total = int(np.count_nonzero(self._evaluate(rows, spec)))
+            return self._rows(matches[offset:wanted]), total, self.version
+
+    def facets(self, price_bounds=PRICE_BOUNDS, **filters):
+        """Facet counts for every product matching `filters`, in one pass
+
+        The matching rows are selected once; each facet is then a
+        bincount over that selection. Results are cached until the next
+        change. Returns (facets, total, version).
+        """
+        key = (tuple(price_bounds), tuple(sorted(filters.items())))
+        with self._lock:
+            if self._facet_version != self.version:
+                self._facet_cache, self._facet_version = {}, self.version
+            if key in self._facet_cache:
+                return self._facet_cache[key]
+
+            spec = self._spec(**filters)
+            candidates = self._candidates(spec)
+            if candidates is not None:
+                rows = candidates[self._evaluate(candidates, spec)]
+            else:
+                # Row numbers once: gathering by index beats a boolean mask per column
+                rows = np.flatnonzero(self._evaluate(slice(0, self.size), spec))
+
+            def column(values):
+                return values[:self.size] if len(rows) == self.size else values.take(rows)
+
+            facets = {}
+            for field in FACET_FIELDS:
+                counts = np.bincount(column(self.codes[field]), minlength=len(self.dictionaries[field].values))
+                present = np.flatnonzero(counts)
+                present = present[np.argsort(-counts[present], kind='stable')]
+                values = self.dictionaries[field].values
+                facets[field] = [{'value': values[code], 'count': int(counts[code])} for code in present.tolist()]
+
+            # One comparison per bound beats searchsorted for a handful of buckets
+            prices = column(self.numbers['price'])
+            at_least = [len(prices)] + [int(np.count_nonzero(prices >= bound)) for bound in price_bounds] + [0]
+            facets['price'] = price_buckets(price_bounds, [at_least[i] - at_least[i + 1] for i in range(len(price_bounds) + 1)])
+
+            stock = column(self.numbers['stock'])
+            min_stock = column(self.numbers['min_stock'])
+            out_of_stock = int(np.count_nonzero(stock <= 0))
+            in_stock = int(np.count_nonzero(stock > min_stock))
+            facets['stock_status'] = {
+                'in_stock': in_stock,
+                'low_stock': len(stock) - in_stock - out_of_stock,
+                'out_of_stock': out_of_stock
+            }
+            if len(self._facet_cache) >= FACET_CACHE_SIZE:
+                self._facet_cache.pop(next(iter(self._facet_cache)))
+            result = self._facet_cache[key] = (facets, len(stock), self.version)
+            return result
+
+    def _spec(self, category=None, brand=None, supplier=None, distributor_id=None,
+              min_price=None, max_price=None, stock_status=None, active_only=False):
+        """Compile query filters against the current dictionaries"""
+        if stock_status is not None and stock_status not in STOCK_STATUSES:
+            raise ValueError(f'Unknown stock status: {stock_status}')
+        spec = {
+            'codes': [], 'min_price': min_price, 'max_price': max_price,
+            'stock_status': stock_status, 'active_only': active_only
+        }
+        for field, value in (('category', category), ('brand', brand),
+                             ('supplier', supplier), ('distributor_id', distributor_id)):
+            if value is not None:
+                spec['codes'].append((field, self.dictionaries[field].lookup(value)))
+        return spec
+
+    def _evaluate(self, rows, spec):
+        """Boolean array: which of `rows` (index array or slice) match the spec"""
+        keep = self.alive[rows]
+        for field, code in spec['codes']:
+            keep = keep & (self.codes[field][rows] == code)
+        if spec['min_price'] is not None or spec['max_price'] is not None:
+            price = self.numbers['price'][rows]
+            if spec['min_price'] is not None:
+                keep = keep & (price >= spec['min_price'])
+            if spec['max_price'] is not None:
+                keep = keep & (price <= spec['max_price'])
+        if spec['stock_status'] is not None:
+            stock = self.numbers['stock'][rows]
+            min_stock = self.numbers['min_stock'][rows]
+            if spec['stock_status'] == 'out_of_stock':
+                keep = keep & (stock <= 0)
+            elif spec['stock_status'] == 'low_stock':
+                keep = keep & (stock > 0) & (stock <= min_stock)
+            else:
+                keep = keep & (stock > min_stock)
+        if spec['active_only']:
+            keep = keep & self.active[rows]
+        return keep
+
+    def _candidates(self, spec):
+        """Rows of the smallest posting list among the coded filters, or None"""
+        if not spec['codes']:
+            return None
+        postings = self._index('coded')
+        best = None
+        for field, code in spec['codes']:
+            order, offsets = postings[field]
+            rows = order[offsets[code]:offsets[code + 1]] if 0 <= code < len(offsets) - 1 else order[:0]
+            if best is None or len(rows) < len(best):
+                best = rows
+        stale = self._stale_rows['coded']
+        if stale:
+            best = np.concatenate([best[~self._stale['coded'][best]], np.asarray(stale, dtype=best.dtype)])
+        return best
+
+    def _scan(self, candidates, spec, wanted):
+        """First `wanted` matching rows, in candidate or row order"""
+        size = len(candidates) if candidates is not None else self.size
+        found, count = [], 0
+        for start in range(0, size, WALK_CHUNK):
+            if candidates is not None:
+                rows = candidates[start:start + WALK_CHUNK]
+                hits = rows[self._evaluate(rows, spec)]
+            else:
+                rows = slice(start, min(start + WALK_CHUNK, size))
+                hits = np.flatnonzero(self._evaluate(rows, spec)) + start
+            found.append(hits)
+            count += len(hits)
+            if count >= wanted:
+                break
+        return np.concatenate(found)[:wanted] if found else np.empty(0, dtype=np.int64)
+
+    def _walk(self, field, descending, spec, wanted):
+        """Top `wanted` matching rows by walking the field's sorted index"""
+        order, keys = self._index(field)
+        low, high = 0, len(order)
+        if field == 'price':
+            # Seek straight to the requested price range
+            if spec['min_price'] is not None:
+                low = int(np.searchsorted(keys, spec['min_price'], 'left'))
+            if spec['max_price'] is not None:
+                high = int(np.searchsorted(keys, spec['max_price'], 'right'))
+
+        changed = np.asarray(self._stale_rows[field], dtype=np.int64)
+        stale = self._stale[field] if len(changed) else None
+        found, count = [], 0
+        for start in range(low, high, WALK_CHUNK):
+            if descending:
+                end = high - (start - low)
+                rows = order[max(low, end - WALK_CHUNK):end][::-1]
+            else:
+                rows = order[start:min(start + WALK_CHUNK, high)]
+            keep = self._evaluate(rows, spec)
+            if stale is not None:
+                keep &= ~stale[rows]
+            found.append(rows[keep])
+            count += int(np.count_nonzero(keep))
+            if count >= wanted:
+                break
+
+        # Rows changed since the index was built are ranked separately
+        if len(changed):
+            found.append(changed[self._evaluate(changed, spec)])
+        matches = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        return self._top(matches, field, descending, wanted)
+
+    def _top(self, rows, field, descending, wanted):
+        """Sort `rows` by field and keep the first `wanted`"""
+        keys = self.numbers[field][rows]
+        if descending:
+            keys = -keys
+        if wanted < len(rows):
+            top = np.argpartition(keys, wanted - 1)[:wanted]
+            return rows[top[np.argsort(keys[top], kind='stable')]]
+        return rows[np.argsort(keys, kind='stable')]
+
+    def _index(self, name):
+        """The named index, rebuilt first if too many of its rows are stale"""
+        if name not in self._indexes or len(self._stale_rows[name]) > max(WALK_CHUNK, self.size // 20):
+            self._build(name)
+        return self._indexes[name]
+
+    def _build(self, name):
+        started = time.perf_counter()
+        size = self.size
+        if name == 'coded':
+            # Posting lists: rows grouped by code, with each code's offsets
+            index = {}
+            for field in CODED_FIELDS:
+                codes = self.codes[field][:size]
+                order = np.argsort(codes, kind='stable')
+                offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(self.dictionaries[field].values)))])
+                index[field] = (order, offsets)
+        else:
+            order = np.argsort(self.numbers[name][:size], kind='stable')
+            index = (order, self.numbers[name][:size][order])
+        self._indexes[name] = index
+        self._stale[name][:] = False
+        self._stale_rows[name] = []
+        metrics.observe('catalog.index_build_time', time.perf_counter() - started)
+
+    def _mark_stale(self, name, row):
+        if not self._stale[name][row]:
+            self._stale[name][row] = True
+            self._stale_rows[name].append(row)
+
+    def _rows(self, rows):
+        """Product dicts for an array of rows"""
+        columns = {
+            '_id': [self.ids[row] for row in rows.tolist()],
+            'name': [self.names[row] for row in rows.tolist()],
+            'is_active': self.active[rows].tolist()
+        }
+        for field in CODED_FIELDS:
+            values = self.dictionaries[field].values
+            columns[field] = [values[code] for code in self.codes[field][rows].tolist()]
+        for field in ('price', 'stock', 'min_stock'):
+            columns[field] = self.numbers[field][rows].tolist()
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def _upsert(self, doc):
+        key = str(doc['_id'])
+        row = self.rows.get(key)
+        partial = row is not None
+        if not partial:
+            row = self._append(key)
+            for name in self._stale:
+                self._mark_stale(name, row)
+
+        if 'name' in doc or not partial:
+            self.names[row] = doc.get('name', '')
+        for field in CODED_FIELDS:
+            if field in doc or not partial:
+                code = self.dictionaries[field].encode(doc.get(field))
+                if code != self.codes[field][row]:
+                    self.codes[field][row] = code
+                    self._mark_stale('coded', row)
+        for field, (dtype, default) in NUMERIC_FIELDS.items():
+            if field in doc or not partial:
+                value = doc.get(field)
+                if field == 'updated_at':
+                    value = value.timestamp() if isinstance(value, datetime) else None
+                    if value is None and partial:
+                        continue
+                value = default if value is None else value
+                if value != self.numbers[field][row]:
+                    self.numbers[field][row] = value
+                    self._mark_stale(field, row)
+        if 'is_active' in doc or not partial:
+            self.active[row] = doc.get('is_active', True)
+
+    def _append(self, key):
+        if self.size == len(self.ids):
+            self._grow(len(self.ids) * 2)
+        row = self.size
+        self.size += 1
+        self.rows[key] = row
+        self.ids[row] = key
+        self.alive[row] = True
+        return row
+
+    def _grow(self, capacity):
+        extra = capacity - len(self.ids)
+        self.ids.extend([None] * extra)
+        self.names.extend([None] * extra)
+        for field in CODED_FIELDS:
+            self.codes[field] = np.concatenate([self.codes[field], np.full(extra, -1, dtype=np.int32)])
+        for field, (dtype, default) in NUMERIC_FIELDS.items():
+            self.numbers[field] = np.concatenate([self.numbers[field], np.full(extra, default, dtype=dtype)])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        for name in self._stale:
+            self._stale[name] = np.concatenate([self._stale[name], np.zeros(extra, dtype=bool)])
+
+    def _on_change(self, change, rooms):
+        if change['entity'] != 'product' or not self.ready:
+            return
+        if change['op'] == 'delete':
+            self.remove(change['id'])
+        else:
+            self.apply({**change['data'], '_id': change['id']})
+
+    def _poll(self):
+        """Pick up products written by other workers since the last poll
+
+        Reads back SYNC_SETTLE before the newest updated_at seen, so a
+        write that commits late with an earlier timestamp is still
+        caught; versions already applied in that window are skipped.
+        """
+        products = get_collection('products')
+        since = self._last_seen
+        latest = since
+        recent = {key: seen for key, seen in self._recent.items() if seen >= since - SYNC_SETTLE}
+        for doc in products.find({'updated_at': {'$gte': since - SYNC_SETTLE}}, CATALOG_PROJECTION):
+            key = str(doc['_id'])
+            if recent.get(key) == doc['updated_at']:
+                continue
+            recent[key] = doc['updated_at']
+            self.apply(doc)
+            if doc['updated_at'] > latest:
+                latest = doc['updated_at']
+        self._recent = recent
+        self._last_seen = latest
+        self._poll_deletes()
+
+    def _poll_deletes(self):
+        """Remove products deleted by other workers since the last poll
+
+        Tombstones younger than SYNC_SETTLE are read again next time, so
+        one that took a lower change_seq and landed late is not skipped.
+        """
+        if self._tombstone_seq is None:
+            return
+        settled_before = datetime.utcnow() - SYNC_SETTLE
+        token, settled = self._tombstone_seq, True
+        for tombstone in get_collection(TOMBSTONES).find(
+            {'entity': 'products', 'change_seq': {'$gt': self._tombstone_seq}},
+            {'doc_id': 1, 'change_seq': 1, 'updated_at': 1}
+        ).sort('change_seq', 1):
+            self.remove(tombstone['doc_id'])
+            settled = settled and tombstone['updated_at'] <= settled_before
+            if settled:
+                token = tombstone['change_seq']
+        self._tombstone_seq = token
+
+    def _run(self):
+        while True:
+            realtime.sleep(self.poll_interval)
+            if get_status()['state'] != 'ready':
+                continue
+            try:
+                if not self.ready or time.time() - self.loaded_at > self.reload_interval:
+                    self.load()
+                else:
+                    self._poll()
+            except Exception as e:
+                print(f"✗ Catalog refresh error: {e}")
+
+# Global columnar catalog
+catalog = ColumnarCatalog()
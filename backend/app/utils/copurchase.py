@@ -0,0 +1,261 @@
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from bson import ObjectId
+from scipy import sparse
+from app.utils import realtime
+from app.utils.catalog import catalog, Dictionary
+from app.utils.database import get_collection, get_status
+from app.utils.metrics import metrics
+from app.utils.order_archive import ARCHIVE
+
+# Orders that are not real purchases
+EXCLUDED_STATUSES = ['draft', 'cancelled']
+
+# Ranked suggestions kept per retailer between model changes
+SUGGESTIONS_CACHED = 50
+
+# How far back each poll looks again, for orders inserted out of _id order
+POLL_LAG = timedelta(seconds=30)
+
+class CoPurchaseIndex:
+    """Item-to-item co-purchase model over order baskets
+
+    Baskets are rows of a sparse order x product incidence matrix B; the
+    co-occurrence matrix is C = B'B, whose diagonal holds how many orders
+    contain each product. Two products score count_ij / sqrt(n_i * n_j)
+    (cosine over baskets) and each product keeps its top-K neighbours in
+    a dict, so lookups are a dict access.
+
+    New orders are polled by _id and folded in incrementally: their
+    co-occurrences are added to C and only the products they contain have
+    their neighbours recomputed. A periodic full rebuild drops cancelled
+    orders and refreshes scores whose normalization drifted.
+    """
+
+    def __init__(self, top_k=20, poll_interval=5.0, rebuild_interval=6 * 3600):
+        self.top_k = top_k
+        self.poll_interval = poll_interval
+        self.rebuild_interval = rebuild_interval
+        self.built_at = None
+        self.neighbors = {}
+        self.retailer_products = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._vocabulary = Dictionary()
+        self._matrix = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self._counts = np.zeros(0, dtype=np.int32)
+        self._watermark = None
+        self._recent = {}
+        self._suggestions = {}
+
+    def configure(self, top_k=None, poll_interval=None):
+        """Override defaults from app config"""
+        if top_k is not None:
+            self.top_k = top_k
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+
+    def start(self):
+        """Start the build/poll loop (idempotent)"""
+        if self._started:
+            return
+        self._started = True
+        realtime.start_background_task(self._run)
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def related(self, product_id, limit=None):
+        """Top co-purchased products: [(product_id, score, co_purchases)]"""
+        return self.neighbors.get(str(product_id), [])[:limit or self.top_k]
+
+    def suggestions(self, retailer_id, limit=10):
+        """Products a retailer has not bought, ranked by co-purchase with what they have
+
+        Each candidate's score sums its neighbour scores over the
+        retailer's products, weighted by how often the retailer bought them.
+        Rankings are cached until the model next changes.
+        """
+        key = str(retailer_id)
+        cached = self._suggestions.get(key)
+        if cached is not None and len(cached) >= limit:
+            return cached[:limit]
+
+        bought = self.retailer_products.get(key, {})
+        scores = {}
+        for product_id, times in list(bought.items()):
+            for neighbor_id, score, _ in self.neighbors.get(product_id, ()):
+                if neighbor_id not in bought:
+                    scores[neighbor_id] = scores.get(neighbor_id, 0.0) + score * times
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:max(limit, SUGGESTIONS_CACHED)]
+        self._suggestions[key] = [(product_id, round(score, 4)) for product_id, score in ranked]
+        return self._suggestions[key][:limit]
+
+    def build(self):
+        """Full rebuild from every purchase order, archived ones included"""
+        started = time.perf_counter()
+        watermark = datetime.utcnow()
+        cursor = itertools.chain.from_iterable(
+            get_collection(collection_name).find(
+                {'status': {'$nin': EXCLUDED_STATUSES}},
+                {'retailer_id': 1, 'items.product_id': 1},
+                batch_size=10000
+            )
+            for collection_name in ('orders', ARCHIVE)
+        )
+        vocabulary = Dictionary()
+        retailer_products = {}
+        recent = {}
+        recent_from = ObjectId.from_datetime(watermark - POLL_LAG)
+
+        def remember_recent(orders):
+            # The first poll looks back POLL_LAG; don't count these twice
+            for order in orders:
+                if order['_id'] >= recent_from:
+                    recent[order['_id']] = watermark
+                yield order
+
+        basket_matrix = self._baskets(remember_recent(cursor), vocabulary, retailer_products)
+
+        matrix = (basket_matrix.T @ basket_matrix).tocsr()
+        counts = matrix.diagonal().astype(np.int32)
+        matrix.setdiag(0)
+        matrix.eliminate_zeros()
+        neighbors = self._top_neighbors(matrix, counts, vocabulary, range(matrix.shape[0]))
+
+        with self._lock:
+            self._vocabulary = vocabulary
+            self._matrix = matrix
+            self._counts = counts
+            self.neighbors = neighbors
+            self.retailer_products = retailer_products
+            self._watermark = watermark
+            self._recent = recent
+            self._suggestions = {}
+            self.built_at = time.time()
+        metrics.observe('copurchase.build_time', time.perf_counter() - started)
+        metrics.set_gauge('copurchase.products', len(vocabulary.values))
+        return basket_matrix.shape[0]
+
+    def update(self, orders):
+        """Fold new order documents into the model"""
+        with self._lock:
+            retailer_products = self.retailer_products
+            basket_matrix = self._baskets(orders, self._vocabulary, retailer_products)
+            if basket_matrix.nnz == 0:
+                return 0
+
+            size = len(self._vocabulary.values)
+            delta = (basket_matrix.T @ basket_matrix).tocsr()
+            counts = np.zeros(size, dtype=np.int32)
+            counts[:len(self._counts)] = self._counts
+            counts += delta.diagonal().astype(np.int32)
+            delta.setdiag(0)
+            delta.eliminate_zeros()
+
+            matrix = self._matrix.copy()
+            matrix.resize((size, size))
+            matrix = (matrix + delta).tocsr()
+
+            touched = np.unique(basket_matrix.indices)
+            neighbors = dict(self.neighbors)
+            neighbors.update(self._top_neighbors(matrix, counts, self._vocabulary, touched.tolist()))
+
+            self._matrix = matrix
+            self._counts = counts
+            self.neighbors = neighbors
+            self._suggestions = {}
+            metrics.incr('copurchase.orders_applied', basket_matrix.shape[0])
+            return basket_matrix.shape[0]
+
+    def _baskets(self, orders, vocabulary, retailer_products):
+        """Incidence matrix of the given orders over `vocabulary` (grown as needed)"""
+        indptr, indices = [0], []
+        for order in orders:
+            basket = {vocabulary.encode(item['product_id'])
+                      for item in order.get('items', []) if item.get('product_id')}
+            indices.extend(basket)
+            indptr.append(len(indices))
+
+            bought = retailer_products.setdefault(str(order.get('retailer_id', '')), {})
+            for code in basket:
+                product_id = vocabulary.values[code]
+                bought[product_id] = bought.get(product_id, 0) + 1
+        return sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(indptr) - 1, len(vocabulary.values))
+        )
+
+    def _top_neighbors(self, matrix, counts, vocabulary, rows):
+        """Top-K neighbour lists for the given product rows"""
+        neighbors = {}
+        indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+        for row in rows:
+            start, end = indptr[row], indptr[row + 1]
+            if start == end:
+                neighbors[vocabulary.values[row]] = []
+                continue
+            columns = indices[start:end]
+            together = data[start:end]
+            scores = together / np.sqrt(float(counts[row]) * counts[columns])
+            if len(scores) > self.top_k:
+                best = np.argpartition(-scores, self.top_k - 1)[:self.top_k]
+            else:
+                best = np.arange(len(scores))
+            best = best[np.argsort(-scores[best], kind='stable')]
+            neighbors[vocabulary.values[row]] = [
+                (vocabulary.values[column], round(score, 4), count)
+                for column, score, count in zip(columns[best].tolist(), scores[best].tolist(), together[best].tolist())
+            ]
+        return neighbors
+
+    def _poll(self):
+        """Fold in orders created since the last poll (on any worker)"""
+        now = datetime.utcnow()
+        since = ObjectId.from_datetime(self._watermark - POLL_LAG)
+        new_orders = [
+            order for order in get_collection('orders').find(
+                {'_id': {'$gte': since}, 'status': {'$nin': EXCLUDED_STATUSES}},
+                {'retailer_id': 1, 'items.product_id': 1}
+            )
+            if order['_id'] not in self._recent
+        ]
+        for order in new_orders:
+            self._recent[order['_id']] = now
+        cutoff = now - 2 * POLL_LAG
+        self._recent = {order_id: seen for order_id, seen in self._recent.items() if seen >= cutoff}
+        self._watermark = now
+        if new_orders:
+            self.update(new_orders)
+
+    def _run(self):
+        while True:
+            realtime.sleep(self.poll_interval)
+            if get_status()['state'] != 'ready':
+                continue
+            try:
+                if not self.ready or time.time() - self.built_at > self.rebuild_interval:
+                    self.build()
+                else:
+                    self._poll()
+            except Exception as e:
+                print(f"✗ Co-purchase index error: {e}")
+
+# Global co-purchase index
+copurchase = CoPurchaseIndex()
+
+def with_products(scored):
+    """Attach catalog product fields to (product_id, score, ...) results
+
+    Products no longer in the catalog are dropped; without a loaded
+    catalog only IDs and scores are returned.
+    """
+    results = [{'product_id': entry[0], 'score': entry[1]} for entry in scored]
+    if not catalog.ready:
+        return results
+    products = {product['_id']: product for product in catalog.get_many(result['product_id'] for result in results)}
+    return [{**products[result['product_id']], **result} for result in results if result['product_id'] in products]
@@ -1,36 +1,204 @@
+from flask import request, has_request_context
 from pymongo import MongoClient
+from pymongo.errors import CollectionInvalid
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from pymongo.write_concern import WriteConcern
 from datetime import datetime
+from app.utils import realtime
 import os
 
 # Global database connection
+client = None
 db = None
 
-def init_db(mongo_uri):
-    """Initialize MongoDB connection"""
-    global db
+# Readiness reported by /api/health
+status = {
+    'state': 'not_initialized',
+    'indexes': 'pending',
+    'error': None,
+    'ready_at': None
+}
+
+# Indexes reconciled at startup: (collection, keys, options)
+INDEXES = [
+    ('users', 'email', {'unique': True}),
+    ('products', 'distributor_id', {}),
+    ('products', [('distributor_id', 1), ('sku', 1)],
+     {'unique': True, 'partialFilterExpression': {'sku': {'$type': 'string'}}}),
+    ('orders', 'retailer_id', {}),
+    ('orders', [('status', 1), ('created_at', 1)], {}),
+    ('orders', [('status', 1), ('updated_at', 1)], {}),
+    ('orders_archive', 'retailer_id', {}),
+    ('orders_archive', [('status', 1), ('created_at', 1)], {}),
+    ('products', 'change_seq', {}),
+    ('orders', 'change_seq', {}),
+    ('products', [('distributor_id', 1), ('change_seq', 1)], {}),
+    ('products', [('category', 1), ('change_seq', 1)], {}),
+    ('orders', [('retailer_id', 1), ('change_seq', 1)], {}),
+    ('sync_tombstones', [('entity', 1), ('change_seq', 1)], {}),
+    ('sync_tombstones', [('entity', 1), ('distributor_id', 1), ('change_seq', 1)], {}),
+    ('sync_tombstones', [('entity', 1), ('category', 1), ('change_seq', 1)], {}),
+    ('sync_tombstones', [('entity', 1), ('retailer_id', 1), ('change_seq', 1)], {}),
+    ('stock_history', [('product_id', 1), ('ts', 1)], {}),
+    ('stock_outbox', [('state', 1), ('_id', 1)], {}),
+    ('stock_outbox', 'batch_id', {'sparse': True}),
+    ('stock_shards', 'product_id', {}),
+]
+
+# Time-series collections created before their indexes: name -> timeseries options
+TIME_SERIES = {
+    'stock_history': {'timeField': 'ts', 'metaField': 'product_id', 'granularity': 'minutes'},
+}
+
+# Collections created with a WiredTiger block compressor: name -> compressor
+COMPRESSED_COLLECTIONS = {
+    'orders_archive': 'zstd',
+}
+
+# Write concern for writes that must survive a primary failover
+DURABLE_WRITES = WriteConcern(w='majority')
+
+# Read preferences by profile. Heavy analytics reads may go to a secondary
+# at most maxStalenessSeconds behind (90 is the server's minimum); the rest
+# stay on the primary so callers always read their own writes.
+READ_PROFILES = {
+    'primary': Primary(),
+    'analytics': SecondaryPreferred(max_staleness=90),
+}
+
+# Read profile used by get_collection() inside each blueprint's requests
+BLUEPRINT_READ_PROFILES = {
+    'analytics': 'analytics',
+}
+
+def init_db(mongo_uri, build_indexes=True):
+    """Initialize MongoDB connection
+
+    The client connects lazily on first use, so this returns without any
+    network round trip. Pass build_indexes=False to reconcile indexes
+    later with ensure_indexes() (e.g. from a background task).
+    """
+    global client, db
     try:
-        client = MongoClient(mongo_uri)
+        client = MongoClient(mongo_uri, connect=False)
         db = client.get_database()
-        print(f"✓ Connected to MongoDB: {db.name}")
-        
-        # Create indexes for better performance
-        db.users.create_index("email", unique=True)
-        db.products.create_index("distributor_id")
-        db.orders.create_index("retailer_id")
-        db.stock_history.create_index("product_id")
-        
-        print("✓ Database indexes created")
+        status['state'] = 'connecting'
+        print(f"✓ MongoDB client configured: {db.name}")
+
+        if build_indexes:
+            ensure_indexes()
         return db
     except Exception as e:
+        status.update(state='unavailable', error=str(e))
         print(f"✗ Database connection error: {e}")
         return None
 
+def ensure_indexes(retry_interval=None, max_retry_interval=300):
+    """Wait for MongoDB and create any missing indexes
+
+    With retry_interval set, keeps retrying until MongoDB answers instead
+    of giving up after the first failure. Only a failed ping marks the
+    database unavailable; a failed index or collection build leaves it
+    ready with indexes 'failed' and is retried with doubling delays up
+    to max_retry_interval.
+    """
+    delay = retry_interval
+    while True:
+        try:
+            client.admin.command('ping')
+        except Exception as e:
+            status.update(state='unavailable', indexes='pending', error=str(e))
+            print(f"✗ Database connection error: {e}")
+            if retry_interval is None:
+                return False
+            realtime.sleep(retry_interval)
+            continue
+
+        if status['state'] != 'ready':
+            status.update(state='ready', error=None, ready_at=datetime.utcnow().isoformat())
+            print(f"✓ Connected to MongoDB: {db.name}")
+
+        try:
+            status['indexes'] = 'building'
+            ensure_time_series(db)
+            ensure_compressed(db)
+            for collection_name, keys, options in INDEXES:
+                db[collection_name].create_index(keys, **options)
+            status.update(indexes='ready', error=None)
+            print("✓ Database indexes created")
+            return True
+        except Exception as e:
+            status.update(indexes='failed', error=str(e))
+            print(f"✗ Database index error: {e}")
+            if retry_interval is None:
+                return False
+            realtime.sleep(delay)
+            delay = min(delay * 2, max_retry_interval)
+
+def ensure_time_series(database):
+    """Create the TIME_SERIES collections that do not exist yet
+
+    An empty regular collection of the same name (e.g. left by an older
+    seed run) is replaced; one holding data is left alone.
+    """
+    for collection_name, options in TIME_SERIES.items():
+        if database[collection_name].options().get('timeseries'):
+            continue
+        if collection_name in database.list_collection_names():
+            if database[collection_name].estimated_document_count():
+                print(f"✗ {collection_name} is a regular collection with data; not converting")
+                continue
+            database[collection_name].drop()
+        try:
+            database.create_collection(collection_name, timeseries=options)
+        except CollectionInvalid:
+            pass
+
+def ensure_compressed(database):
+    """Create the COMPRESSED_COLLECTIONS that do not exist yet"""
+    existing = set(database.list_collection_names())
+    for collection_name, compressor in COMPRESSED_COLLECTIONS.items():
+        if collection_name in existing:
+            continue
+        try:
+            database.create_collection(collection_name, storageEngine={
+                'wiredTiger': {'configString': f'block_compressor={compressor}'}
+            })
+        except CollectionInvalid:
+            pass
+
+def ensure_indexes_in_background(retry_interval=5):
+    """Reconcile indexes without delaying startup"""
+    return realtime.start_background_task(ensure_indexes, retry_interval)
+
+def get_status():
+    """Get database readiness"""
+    return dict(status)
+
 def get_db():
     """Get database instance"""
     return db
 
-def get_collection(collection_name):
-    """Get a specific collection"""
+def configure_read_profiles(max_staleness=None):
+    """Override the analytics staleness bound (seconds, at least 90)"""
+    if max_staleness is not None:
+        READ_PROFILES['analytics'] = SecondaryPreferred(max_staleness=max(90, int(max_staleness)))
+
+def current_read_profile():
+    """Read profile for the current request's blueprint (primary elsewhere)"""
+    if has_request_context():
+        return BLUEPRINT_READ_PROFILES.get(request.blueprint, 'primary')
+    return 'primary'
+
+def get_collection(collection_name, profile=None):
+    """Get a specific collection
+
+    Reads follow the named read profile, or the current blueprint's
+    profile when none is given.
+    """
     if db is None:
         raise Exception("Database not initialized")
-    return db[collection_name]
+    profile = profile or current_read_profile()
+    if profile == 'primary':
+        return db[collection_name]
+    return db.get_collection(collection_name, read_preference=READ_PROFILES[profile])
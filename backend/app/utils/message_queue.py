@@ -0,0 +1,34 @@
+from socketio import PubSubManager
+
+# Subscriber queues per channel, shared by every server in this process
+_subscribers = {}
+
+class LocalManager(PubSubManager):
+    """In-process stand-in for the Redis message queue
+
+    Lets several Socket.IO servers living in one process share rooms and
+    broadcasts exactly as they would through Redis. Selected with
+    SOCKETIO_MESSAGE_QUEUE=local:// for tests and benchmarks.
+    """
+    name = 'local'
+
+    def _publish(self, data):
+        for subscriber in list(_subscribers.get(self.channel, [])):
+            subscriber.put(data)
+
+    def _listen(self):
+        subscriber = self.server.eio.create_queue()
+        _subscribers.setdefault(self.channel, []).append(subscriber)
+        try:
+            while True:
+                yield subscriber.get()
+        finally:
+            _subscribers[self.channel].remove(subscriber)
+
+def socketio_options(message_queue, channel='qwipo-socketio'):
+    """Get SocketIO() keyword arguments for the configured message queue"""
+    if not message_queue:
+        return {}
+    if message_queue.startswith('local://'):
+        return {'client_manager': LocalManager(channel=channel)}
+    return {'message_queue': message_queue, 'channel': channel}
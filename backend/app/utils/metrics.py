@@ -0,0 +1,68 @@
+import threading
+from collections import deque
+
+# Number of recent samples kept per timer for percentile estimates
+TIMER_WINDOW = 512
+
+class Metrics:
+    """In-process counters, gauges and timers exposed at /api/metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timers = {}
+
+    def incr(self, name, value=1):
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """Set a gauge to its current value"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Record a duration sample for a timer"""
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = {
+                    'count': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                    'recent': deque(maxlen=TIMER_WINDOW)
+                }
+            timer['count'] += 1
+            timer['total'] += seconds
+            timer['max'] = max(timer['max'], seconds)
+            timer['recent'].append(seconds)
+
+    def snapshot(self):
+        """Get a JSON-friendly copy of all metrics"""
+        with self._lock:
+            timers = {}
+            for name, timer in self._timers.items():
+                recent = sorted(timer['recent'])
+                timers[name] = {
+                    'count': timer['count'],
+                    'avg_ms': round(timer['total'] / timer['count'] * 1000, 3) if timer['count'] else 0,
+                    'max_ms': round(timer['max'] * 1000, 3),
+                    'p50_ms': round(_percentile(recent, 50) * 1000, 3),
+                    'p95_ms': round(_percentile(recent, 95) * 1000, 3)
+                }
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timers': timers
+            }
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+# Global metrics registry
+metrics = Metrics()
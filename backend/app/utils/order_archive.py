@@ -0,0 +1,162 @@
+import time
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError
+from app.utils import realtime
+from app.utils.database import get_collection, get_status, DURABLE_WRITES
+from app.utils.metrics import metrics
+
+# Cold tier: delivered and cancelled orders moved out of `orders`
+ARCHIVE = 'orders_archive'
+
+# Final statuses; orders in them no longer change
+ARCHIVE_STATUSES = ['delivered', 'cancelled']
+
+class OrderArchiver:
+    """Moves old finished orders from `orders` to the compressed archive
+
+    Orders delivered or cancelled more than `min_age_days` ago (by
+    updated_at) are copied to orders_archive with a majority write and
+    then deleted from orders, `batch_size` at a time. A batch interrupted
+    between the two steps is finished by the next one (the copy is
+    skipped as a duplicate). Every archived order was created before
+    now - min_age_days, which is all reads need to decide whether a date
+    range reaches the archive.
+    """
+
+    def __init__(self, min_age_days=90, batch_size=1000, interval=3600, pause=0.1):
+        self.min_age_days = min_age_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self.last_run = None
+        self._started = False
+
+    def configure(self, min_age_days=None, batch_size=None, interval=None):
+        """Override defaults from app config"""
+        if min_age_days is not None:
+            self.min_age_days = min_age_days
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if interval is not None:
+            self.interval = interval
+
+    def start(self):
+        """Start the archive loop (idempotent; disabled when min_age_days is 0)"""
+        if self._started or not self.min_age_days:
+            return
+        self._started = True
+        realtime.start_background_task(self._run)
+
+    @property
+    def boundary(self):
+        """Orders created at or after this are always in the hot collection"""
+        return datetime.utcnow() - timedelta(days=self.min_age_days)
+
+    def needs_archive(self, since=None):
+        """Whether reading orders created since `since` (None: all time) must include the archive"""
+        return since is None or since < self.boundary
+
+    def archive_batch(self):
+        """Move one batch; returns how many orders were archived"""
+        now = datetime.utcnow()
+        orders = get_collection('orders', 'primary')
+        batch = list(orders.find({
+            'status': {'$in': ARCHIVE_STATUSES},
+            'updated_at': {'$lt': now - timedelta(days=self.min_age_days)}
+        }).limit(self.batch_size))
+        if not batch:
+            return 0
+
+        for order in batch:
+            order['archived_at'] = now
+        archive = get_collection(ARCHIVE, 'primary').with_options(write_concern=DURABLE_WRITES)
+        try:
+            archive.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Already copied by an interrupted batch or another worker
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+        orders.delete_many({'_id': {'$in': [order['_id'] for order in batch]}, 'status': {'$in': ARCHIVE_STATUSES}})
+        metrics.incr('archive.orders', len(batch))
+        return len(batch)
+
+    def run_once(self):
+        """Archive until no eligible orders are left; returns the count"""
+        started = time.perf_counter()
+        total = 0
+        while True:
+            moved = self.archive_batch()
+            total += moved
+            if moved < self.batch_size:
+                break
+            realtime.sleep(self.pause)
+        self.last_run = {
+            'at': datetime.utcnow(),
+            'archived': total,
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+        return total
+
+    def stats(self):
+        return {'min_age_days': self.min_age_days, 'last_run': self.last_run}
+
+    def _run(self):
+        while True:
+            realtime.sleep(self.interval)
+            if get_status()['indexes'] != 'ready':
+                continue
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"✗ Order archive error: {e}")
+
+# Global order archiver
+order_archiver = OrderArchiver()
+
+def with_archive(pipeline, since=None):
+    """Orders aggregation that also reads the archive when `since` reaches it
+
+    The archive's documents are unioned in right after the leading $match
+    (applied to both tiers), so the remaining stages see one stream.
+    """
+    if not order_archiver.needs_archive(since):
+        return pipeline
+    match = pipeline[:1] if pipeline and '$match' in pipeline[0] else []
+    return match + [{'$unionWith': {'coll': ARCHIVE, 'pipeline': match}}] + pipeline[len(match):]
+
+def find_orders(query, since=None, sort=None, limit=0, **kwargs):
+    """Order documents from both tiers, merged by `sort` (a (field, direction) pair)
+
+    A newest-first page already filled with orders too recent to have
+    been archived is returned without reading the archive.
+    """
+    def read(collection_name):
+        cursor = get_collection(collection_name).find(query, **kwargs)
+        if sort:
+            cursor = cursor.sort(*sort)
+        return list(cursor.limit(limit))
+
+    results = read('orders')
+    if (sort == ('created_at', -1) and limit and len(results) == limit
+            and results[-1].get('created_at') and results[-1]['created_at'] >= order_archiver.boundary):
+        return results
+    if not order_archiver.needs_archive(since):
+        return results
+
+    # An order caught between the copy and the delete is in both tiers
+    hot_ids = {order['_id'] for order in results}
+    results.extend(order for order in read(ARCHIVE) if order['_id'] not in hot_ids)
+    if sort:
+        field, direction = sort
+        results.sort(key=lambda doc: doc.get(field) or datetime.min, reverse=direction < 0)
+    return results[:limit] if limit else results
+
+def find_order(query, projection=None):
+    """One order from the hot collection, else the archive"""
+    return (get_collection('orders').find_one(query, projection)
+            or get_collection(ARCHIVE).find_one(query, projection))
+
+def count_orders(query, **kwargs):
+    """Orders matching `query` across both tiers"""
+    return (get_collection('orders').count_documents(query, **kwargs)
+            + get_collection(ARCHIVE).count_documents(query, **kwargs))
@@ -0,0 +1,351 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from bson import ObjectId
+from gridfs import GridFSBucket
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.utils import realtime
+from app.utils.broadcast import publish_change, product_rooms
+from app.utils.database import get_collection, get_db
+from app.utils.metrics import metrics
+from app.utils.stock_history import stock_history
+from app.utils.stock_shards import sharded_stock
+from app.utils.sync import next_seq
+from app.utils.versions import bump_version
+
+# Collection recording each import and its outcome
+IMPORTS = 'product_imports'
+
+# GridFS bucket holding the rejected rows of each import (file _id = import _id)
+ERRORS_BUCKET = 'product_import_errors'
+
+# Rows per bulk_write call
+IMPORT_BATCH = 1000
+
+# Rows read from one upload; the rest are ignored and the import marked truncated
+MAX_IMPORT_ROWS = 1_000_000
+
+# Minimum seconds between import_progress events
+PROGRESS_INTERVAL = 1.0
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# Importable columns: field -> (parser, required, default for new products)
+IMPORT_FIELDS = {
+    'sku': (str, True, None),
+    'name': (str, True, None),
+    'category': (str, True, None),
+    'price': (float, True, None),
+    'stock': (int, True, None),
+    'mrp': (float, False, None),  # defaults to price
+    'min_stock': (int, False, 10),
+    'unit': (str, False, 'pcs'),
+    'brand': (str, False, ''),
+    'description': (str, False, ''),
+    'image_url': (str, False, ''),
+    'is_active': (bool, False, True),
+}
+
+# Non-negative numeric fields
+NON_NEGATIVE_FIELDS = ('price', 'stock', 'mrp', 'min_stock')
+
+# $set expressions keeping stored values and defaulting new products
+DEFAULT_EXPRESSIONS = {
+    field: {'$ifNull': [f'${field}', {'$literal': default}]}
+    for field, (_, _, default) in IMPORT_FIELDS.items() if default is not None
+}
+
+TRUE_VALUES = ('true', '1', 'yes', 'y')
+FALSE_VALUES = ('false', '0', 'no', 'n')
+
+def detect_format(content_type=None, filename=None):
+    """Upload format from a file name or content type, or None"""
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+        if extension == 'csv':
+            return 'csv'
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    return None
+
+def read_rows(stream, fmt):
+    """Yield (row_number, raw_row, error) from a binary stream, one row at a time
+
+    Rows are decoded as they are read, so memory does not grow with the
+    upload. CSV takes the header line as column names; NDJSON skips
+    blank lines.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text, restkey='__extra__')
+        for row in reader:
+            if '__extra__' in row:
+                row.pop('__extra__')
+                yield reader.line_num, row, 'More values than header columns'
+            else:
+                yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, line.rstrip('\r\n'), f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, row, 'Row must be a JSON object'
+        else:
+            yield line_number, row, None
+
+def parse_value(field, parser, value):
+    if parser is bool:
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in TRUE_VALUES:
+            return True
+        if text in FALSE_VALUES:
+            return False
+        raise ValueError(f'{field} must be true or false')
+    if parser is int:
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f'{field} must be a whole number')
+        return int(number)
+    if parser is float:
+        return float(value)
+    return str(value).strip()
+
+def validate_row(row):
+    """Parsed product fields of one row, or raise ValueError
+
+    Empty optional columns are left out, so updates keep the stored value
+    and new products get the default.
+    """
+    product = {}
+    for field, (parser, required, _) in IMPORT_FIELDS.items():
+        value = row.get(field)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            if required:
+                raise ValueError(f'Missing required field: {field}')
+            continue
+        try:
+            product[field] = parse_value(field, parser, value)
+        except (TypeError, ValueError) as e:
+            if str(e).startswith(field):
+                raise
+            raise ValueError(f'Invalid {field}: {value!r}')
+        if field in NON_NEGATIVE_FIELDS and product[field] < 0:
+            raise ValueError(f'{field} must not be negative')
+    return product
+
+def upsert_operation(distributor_id, product, now, change_seq):
+    """UpdateOne upserting a product by (distributor_id, sku)
+
+    An update pipeline so that defaults apply only to new products and the
+    stock of sharded products (which lives in its shards) is left alone.
+    updated_at and change_seq move only when an imported value differs,
+    so re-importing the same rows modifies nothing. Values are wrapped in
+    $literal so strings starting with '$' are data.
+    """
+    values = {field: {'$literal': value} for field, value in product.items()}
+    stage = dict(values)
+    if 'stock' in values:
+        stage['stock'] = {'$cond': [{'$eq': ['$sharded_stock', True]}, '$stock', values['stock']]}
+    changed = {'$or': [{'$ne': [f'${field}', expression]} for field, expression in stage.items()]}
+    stage['updated_at'] = {'$cond': [changed, {'$literal': now}, '$updated_at']}
+    stage['change_seq'] = {'$cond': [changed, {'$literal': change_seq}, '$change_seq']}
+    for field, expression in DEFAULT_EXPRESSIONS.items():
+        if field not in values:
+            stage[field] = expression
+    if 'mrp' not in values:
+        stage['mrp'] = {'$ifNull': ['$mrp', values['price']]}
+    stage['created_at'] = {'$ifNull': ['$created_at', {'$literal': now}]}
+    return UpdateOne(
+        {'distributor_id': distributor_id, 'sku': product['sku']},
+        [{'$set': stage}],
+        upsert=True
+    )
+
+class ErrorFile:
+    """CSV of rejected rows streamed into GridFS, opened on the first error"""
+
+    def __init__(self, import_id, distributor_id):
+        self.import_id = import_id
+        self.distributor_id = distributor_id
+        self.count = 0
+        self._upload = None
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def add(self, row_number, error, row):
+        if self._upload is None:
+            self._upload = GridFSBucket(get_db(), bucket_name=ERRORS_BUCKET).open_upload_stream_with_id(
+                self.import_id, f'{self.import_id}-errors.csv',
+                metadata={'distributor_id': self.distributor_id, 'contentType': 'text/csv'}
+            )
+            self._writer.writerow(['row', 'error', 'data'])
+        raw = json.dumps(row, default=str) if isinstance(row, (dict, list)) else row
+        self._writer.writerow([row_number, error, raw])
+        self.count += 1
+        if self._buffer.tell() >= 64 * 1024:
+            self._drain()
+
+    def close(self):
+        if self._upload is not None:
+            self._drain()
+            self._upload.close()
+
+    def _drain(self):
+        self._upload.write(self._buffer.getvalue().encode('utf-8'))
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+class ProductImport:
+    """One streaming import of a distributor's products
+
+    Rows are validated as they are read and upserted by SKU in unordered
+    bulk_write batches of IMPORT_BATCH; a later row for the same SKU in a
+    batch replaces the earlier one. Rejected rows, including those the
+    server refuses, go to the error file. Each product a batch changes
+    gets one stock_history sample, a document version bump and a change
+    event, as single-product writes do. Progress is emitted to the
+    distributor's room at most every PROGRESS_INTERVAL seconds.
+    """
+
+    def __init__(self, distributor_id, fmt, filename=None, user_id=None):
+        self.id = ObjectId()
+        self.distributor_id = distributor_id
+        self.format = fmt
+        self.room = f'distributor:{distributor_id}'
+        self.started = time.perf_counter()
+        self.summary = {
+            '_id': self.id,
+            'distributor_id': distributor_id,
+            'user_id': user_id,
+            'filename': filename,
+            'format': fmt,
+            'status': 'running',
+            'rows': 0,
+            'inserted': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'errors': 0,
+            'truncated': False,
+            'started_at': datetime.utcnow(),
+            'finished_at': None
+        }
+        self.errors = ErrorFile(self.id, distributor_id)
+        self._progress_at = 0
+
+    def run(self, stream):
+        """Import every row of a binary stream; returns the summary"""
+        imports = get_collection(IMPORTS)
+        imports.insert_one(dict(self.summary))
+        batch = {}
+        try:
+            for row_number, row, error in read_rows(stream, self.format):
+                if self.summary['rows'] >= MAX_IMPORT_ROWS:
+                    self.summary['truncated'] = True
+                    break
+                self.summary['rows'] += 1
+                if error is None:
+                    try:
+                        product = validate_row(row)
+                    except ValueError as e:
+                        error = str(e)
+                if error is not None:
+                    self.errors.add(row_number, error, row)
+                    continue
+
+                batch.pop(product['sku'], None)
+                batch[product['sku']] = (row_number, row, product)
+                if len(batch) >= IMPORT_BATCH:
+                    self._write(batch)
+                    batch = {}
+            self._write(batch)
+            self.summary['status'] = 'completed'
+        except Exception as e:
+            self.summary.update(status='failed', error=str(e))
+            raise
+        finally:
+            self.errors.close()
+            self.summary['errors'] = self.errors.count
+            self.summary['finished_at'] = datetime.utcnow()
+            self.summary['seconds'] = round(time.perf_counter() - self.started, 3)
+            imports.replace_one({'_id': self.id}, self.summary)
+            self._progress(force=True)
+            metrics.incr('imports.rows', self.summary['rows'])
+        return self.summary
+
+    def _write(self, batch):
+        if not batch:
+            return
+        now = datetime.utcnow()
+        entries = list(batch.values())
+        first = next_seq('products', len(entries))
+        operations = [upsert_operation(self.distributor_id, product, now, first + offset)
+                      for offset, (_, _, product) in enumerate(entries)]
+        try:
+            result = get_collection('products').bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+            for write_error in result.get('writeErrors', []):
+                row_number, row, _ = entries[write_error['index']]
+                self.errors.add(row_number, write_error.get('errmsg', 'Write failed'), row)
+
+        inserted = result.get('nUpserted', 0)
+        updated = result.get('nModified', 0)
+        self.summary['inserted'] += inserted
+        self.summary['updated'] += updated
+        self.summary['unchanged'] += result.get('nMatched', 0) - updated
+        if inserted or updated:
+            created = {upsert['_id'] for upsert in result.get('upserted', [])}
+            self._notify(list(batch), first, first + len(entries), created)
+        self._progress()
+
+    def _notify(self, skus, first_seq, end_seq, created):
+        """Record, version and publish the products this batch changed (stamped with its change_seq range)"""
+        projection = {field: 1 for field in IMPORT_FIELDS}
+        projection.update(distributor_id=1, sharded_stock=1, updated_at=1)
+        changed = sharded_stock.overlay(list(get_collection('products').find({
+            'distributor_id': self.distributor_id,
+            'sku': {'$in': skus},
+            'change_seq': {'$gte': first_seq, '$lt': end_seq}
+        }, projection)))
+        for product in changed:
+            stock_history.record(product['_id'], product.get('stock'), 'import')
+            data = {field: value for field, value in product.items() if field not in ('_id', 'sharded_stock')}
+            publish_change('product', product['_id'], 'create' if product['_id'] in created else 'update',
+                           data, product_rooms(product))
+        if changed:
+            bump_version('products', *[product['_id'] for product in changed])
+
+    def _progress(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._progress_at < PROGRESS_INTERVAL:
+            return
+        self._progress_at = now
+        realtime.emit('import_progress', {
+            'import_id': str(self.id),
+            'status': self.summary['status'],
+            'rows': self.summary['rows'],
+            'inserted': self.summary['inserted'],
+            'updated': self.summary['updated'],
+            'errors': self.errors.count,
+            'seconds': round(time.perf_counter() - self.started, 1)
+        }, to=self.room)
+
+def open_error_file(import_id):
+    """GridFS download stream of an import's rejected rows (raises gridfs.NoFile)"""
+    return GridFSBucket(get_db(), bucket_name=ERRORS_BUCKET).open_download_stream(ObjectId(import_id))
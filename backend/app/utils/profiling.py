@@ -0,0 +1,280 @@
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from bson import ObjectId
+from flask import request, g
+from app.utils import realtime
+from app.utils.auth import decode_token
+from app.utils.batch import batch_cached
+from app.utils.metrics import metrics
+
+# Request header that asks for a profile of that request (admins only)
+PROFILE_HEADER = 'X-Profile'
+
+# Path prefix stripped from file names in profiles
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def frame_label(code):
+    """Collapsed-stack label for a code object: function (file:line)"""
+    filename = code.co_filename
+    if filename.startswith(SOURCE_ROOT):
+        filename = os.path.relpath(filename, SOURCE_ROOT)
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+class BoundedStore:
+    """Insertion-ordered dict keeping only the newest `limit` entries"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.limit:
+                self._items.popitem(last=False)
+
+    def get(self, key):
+        return self._items.get(key)
+
+    def values(self):
+        with self._lock:
+            return list(self._items.values())
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+class SamplingProfiler:
+    """Sampling profiler for individual requests
+
+    A native thread wakes every `interval` seconds while any session is
+    active and reads each session's thread stack from
+    sys._current_frames(). Only stacks that pass through the session's
+    view function count, which also filters out other greenlets sharing
+    the thread under eventlet. Stacks are kept in collapsed form
+    ("root;child;leaf count" lines), ready for flamegraph.pl or
+    speedscope. With no session the thread exits, so nothing runs.
+
+    sys._current_frames() shows the greenlet running on a thread, so
+    under eventlet a request is only sampled while it is on the CPU:
+    profiles measure on-CPU time, not time spent waiting on I/O. With
+    native threads they are wall-clock.
+    """
+
+    def __init__(self, interval=0.005, sample_rate=0.0, max_profiles=50):
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.profiles = BoundedStore(max_profiles)
+        self._lock = realtime.native_lock()
+        self._sessions = {}
+        self._sampler = None
+
+    def configure(self, interval=None, sample_rate=None, max_profiles=None):
+        """Override defaults from app config (or the admin API)"""
+        if interval is not None:
+            self.interval = interval
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if max_profiles is not None:
+            self.profiles.limit = max_profiles
+
+    def begin(self, code, metadata):
+        """Start sampling the calling thread for frames under `code`"""
+        session = {
+            'code': code,
+            'thread_id': realtime.native_thread_id(),
+            'stacks': {},
+            'samples': 0,
+            'started': time.perf_counter(),
+            **metadata
+        }
+        with self._lock:
+            self._sessions[id(session)] = session
+            if self._sampler is None:
+                self._sampler = realtime.start_native_thread(self._run)
+        return session
+
+    def end(self, session, status=None):
+        """Stop a session and store its profile; returns the profile ID"""
+        with self._lock:
+            self._sessions.pop(id(session), None)
+        profile_id = str(ObjectId())
+        stacks = sorted(session['stacks'].items(), key=lambda item: item[1], reverse=True)
+        self.profiles.add(profile_id, {
+            'id': profile_id,
+            'endpoint': session.get('endpoint'),
+            'path': session.get('path'),
+            'trigger': session.get('trigger'),
+            'status': status,
+            'created_at': datetime.utcnow(),
+            'duration_ms': round((time.perf_counter() - session['started']) * 1000, 2),
+            'interval_ms': self.interval * 1000,
+            'samples': session['samples'],
+            'collapsed': '\n'.join(f'{stack} {count}' for stack, count in stacks)
+        })
+        metrics.incr('profiling.profiles')
+        return profile_id
+
+    def list(self):
+        """Profile metadata, newest first"""
+        return [{key: value for key, value in profile.items() if key != 'collapsed'}
+                for profile in reversed(self.profiles.values())]
+
+    def _run(self):
+        while True:
+            realtime.native_sleep(self.interval)
+            with self._lock:
+                sessions = list(self._sessions.values())
+                if not sessions:
+                    self._sampler = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                self._sample(session, frames.get(session['thread_id']))
+
+    def _sample(self, session, frame):
+        labels = []
+        while frame is not None:
+            labels.append(frame.f_code)
+            if frame.f_code is session['code']:
+                break
+            frame = frame.f_back
+        else:
+            return  # thread busy with something other than this request
+        stack = ';'.join(frame_label(code) for code in reversed(labels))
+        session['stacks'][stack] = session['stacks'].get(stack, 0) + 1
+        session['samples'] += 1
+
+class MemoryProfiler:
+    """tracemalloc snapshots and diffs, kept in a bounded store
+
+    Tracing starts with the first snapshot and stays on (it slows
+    allocations) until stop() is called.
+    """
+
+    def __init__(self, max_snapshots=5, frames=10):
+        self.frames = frames
+        self.snapshots = BoundedStore(max_snapshots)
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def snapshot(self, label=None):
+        """Take and store a snapshot; returns its metadata"""
+        entry = self._take(label)
+        self.snapshots.add(entry['id'], entry)
+        return self.describe(entry)
+
+    def _take(self, label=None):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'id': str(ObjectId()),
+            'label': label,
+            'created_at': datetime.utcnow(),
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'snapshot': snapshot
+        }
+
+    def describe(self, entry):
+        return {key: value for key, value in entry.items() if key != 'snapshot'}
+
+    def list(self):
+        return [self.describe(entry) for entry in reversed(self.snapshots.values())]
+
+    def diff(self, from_id, to_id=None, key_type='lineno', include=None, limit=25):
+        """Top allocation changes between two snapshots (to_id None: now)
+
+        The "now" snapshot is not stored, so it never evicts a baseline.
+        `include` is a filename glob (e.g. '*app/routes/*') limiting the
+        comparison to matching allocations.
+        """
+        before = self.snapshots.get(from_id)
+        if before is None:
+            raise KeyError(from_id)
+        after = self._take('now') if to_id is None else self.snapshots.get(to_id)
+        if after is None:
+            raise KeyError(to_id)
+
+        old, new = before['snapshot'], after['snapshot']
+        if include:
+            filters = [tracemalloc.Filter(True, include)]
+            old, new = old.filter_traces(filters), new.filter_traces(filters)
+        stats = new.compare_to(old, key_type)
+        return {
+            'from': self.describe(before),
+            'to': self.describe(after),
+            'key_type': key_type,
+            'size_diff_bytes': sum(stat.size_diff for stat in stats),
+            'top': [{
+                'location': [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback],
+                'size_bytes': stat.size,
+                'size_diff_bytes': stat.size_diff,
+                'count': stat.count,
+                'count_diff': stat.count_diff
+            } for stat in stats[:limit]]
+        }
+
+    def stop(self):
+        """Stop tracing and drop all snapshots"""
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+# Global profilers
+profiler = SamplingProfiler()
+memory_profiler = MemoryProfiler()
+
+def is_admin_request():
+    """Whether the current request carries a valid admin token"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return False
+    token = auth_header.split(' ')[1]
+    payload = batch_cached(('token', token), lambda: decode_token(token))
+    return bool(payload) and payload.get('role') == 'admin'
+
+def init_profiling(app):
+    """Profile requests asked for by admins (X-Profile: 1) or picked by the sample rate"""
+
+    @app.before_request
+    def start_profile():
+        view = app.view_functions.get(request.endpoint)
+        if view is None:
+            return None
+        requested = request.headers.get(PROFILE_HEADER) == '1' and is_admin_request()
+        sampled = profiler.sample_rate > 0 and random.random() < profiler.sample_rate
+        if not sampled and not requested:
+            return None
+        g.profile_session = profiler.begin(inspect.unwrap(view).__code__, {
+            'endpoint': request.endpoint,
+            'path': request.full_path.rstrip('?'),
+            'trigger': 'header' if requested else 'sample'
+        })
+        return None
+
+    @app.after_request
+    def finish_profile(response):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            response.headers['X-Profile-Id'] = profiler.end(session, response.status_code)
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc=None):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            profiler.end(session, 500)
+
+    return profiler
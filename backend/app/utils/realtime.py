@@ -0,0 +1,77 @@
+import queue
+import threading
+import time
+
+# Global Socket.IO server shared with blueprints and background workers
+socketio = None
+
+def init_realtime(sio):
+    """Register the Socket.IO server created by create_app()"""
+    global socketio
+    socketio = sio
+    return socketio
+
+def get_socketio():
+    """Get Socket.IO server instance"""
+    return socketio
+
+def start_background_task(target, *args, **kwargs):
+    """Start a background task using the Socket.IO async mode (threads as fallback)"""
+    if socketio is not None:
+        return socketio.start_background_task(target, *args, **kwargs)
+    thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+def sleep(seconds):
+    """Sleep without blocking other greenlets"""
+    if socketio is not None:
+        return socketio.sleep(seconds)
+    return time.sleep(seconds)
+
+def create_queue(*args, **kwargs):
+    """Create a queue compatible with the Socket.IO async mode"""
+    if socketio is not None:
+        return socketio.server.eio.create_queue(*args, **kwargs)
+    return queue.Queue(*args, **kwargs)
+
+def create_event():
+    """Create an event compatible with the Socket.IO async mode"""
+    if socketio is not None:
+        return socketio.server.eio.create_event()
+    return threading.Event()
+
+def emit(event, data, **kwargs):
+    """Emit from outside a socket handler; no-op until Socket.IO is initialized"""
+    if socketio is None:
+        return False
+    socketio.emit(event, data, **kwargs)
+    return True
+
+def _original(module_name):
+    """The unpatched stdlib module when eventlet has monkey-patched it"""
+    try:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread' if module_name == 'threading' else module_name):
+            return patcher.original(module_name)
+    except ImportError:
+        pass
+    return {'threading': threading, 'time': time}[module_name]
+
+def start_native_thread(target, *args):
+    """Start a real OS thread, even under eventlet (e.g. to sample the hub's thread)"""
+    thread = _original('threading').Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+def native_sleep(seconds):
+    """Blocking sleep for code running in a native thread"""
+    _original('time').sleep(seconds)
+
+def native_thread_id():
+    """OS thread ID of the caller (greenlets share their hub's)"""
+    return _original('threading').get_ident()
+
+def native_lock():
+    """Lock shared between native threads and greenlets"""
+    return _original('threading').Lock()
@@ -0,0 +1,185 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, make_response, current_app
+from app.utils import realtime
+from app.utils.broadcast import broadcaster
+from app.utils.metrics import metrics
+from app.utils.singleflight import flights
+
+class AnalyticsRefresher:
+    """Keeps registered analytics responses warm (stale-while-revalidate)
+
+    Requests are always answered from the last good response, with its
+    age in the Age header. A background scheduler recomputes an entry
+    once its jittered interval has passed or a change to one of its
+    entities was published (but no more often than every `min_age`
+    seconds), running at most `max_concurrency` refreshes at a time. Only
+    the first request for a URL computes synchronously. At most
+    `max_entries` responses are kept; the least recently requested one
+    is dropped to make room.
+    """
+
+    def __init__(self, max_concurrency=2, jitter=0.2, tick=1.0, min_age=5, idle_ttl=600, max_entries=256):
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+        self.tick = tick
+        self.min_age = min_age
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._running = 0
+        self._started = False
+
+    def configure(self, max_concurrency=None, jitter=None):
+        """Override defaults from app config"""
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if jitter is not None:
+            self.jitter = jitter
+
+    def start(self):
+        """Subscribe to change signals and start the scheduler (idempotent)"""
+        if self._started:
+            return
+        self._started = True
+        broadcaster.subscribe(self._on_change)
+        realtime.start_background_task(self._run)
+
+    def serve(self, key, compute, interval, entities):
+        """Return (body, status, mimetype, age) for key, computing it if new"""
+        entry = self._entries.get(key)
+        if entry is None:
+            metrics.incr('refresher.misses')
+            result, _ = flights.do(('refresher', key), compute)
+            entry = self._store(key, result, compute, interval, entities)
+            if entry is None:
+                return result + (0,)
+        else:
+            metrics.incr('refresher.hits')
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+
+        entry['requested_at'] = time.monotonic()
+        age = int(time.time() - entry['computed_at'])
+        return entry['body'], entry['status'], entry['mimetype'], age
+
+    def _store(self, key, result, compute, interval, entities):
+        body, status, mimetype = result
+        if status != 200:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key) or {
+                'compute': compute,
+                'interval': interval,
+                'entities': set(entities),
+                'refreshing': False,
+                'requested_at': now
+            }
+            entry.update(
+                body=body,
+                status=status,
+                mimetype=mimetype,
+                computed_at=time.time(),
+                due_at=now + interval * random.uniform(1 - self.jitter, 1 + self.jitter),
+                dirty=False
+            )
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr('refresher.evictions')
+            metrics.set_gauge('refresher.entries', len(self._entries))
+        return entry
+
+    def _on_change(self, change, rooms):
+        entity = change['entity'].split('_')[0]
+        with self._lock:
+            for entry in self._entries.values():
+                if entity in entry['entities']:
+                    entry['dirty'] = True
+
+    def _run(self):
+        while True:
+            realtime.sleep(self.tick)
+            try:
+                self._schedule()
+            except Exception as e:
+                print(f"✗ Analytics refresher error: {e}")
+
+    def _schedule(self):
+        now = time.monotonic()
+        settled_before = time.time() - self.min_age
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if now - e['requested_at'] > self.idle_ttl]:
+                del self._entries[key]
+            due = [(key, entry) for key, entry in self._entries.items()
+                   if not entry['refreshing'] and (entry['due_at'] <= now or
+                                                   (entry['dirty'] and entry['computed_at'] <= settled_before))]
+            due.sort(key=lambda item: item[1]['due_at'])
+            for key, entry in due[:max(0, self.max_concurrency - self._running)]:
+                entry['refreshing'] = True
+                self._running += 1
+                realtime.start_background_task(self._refresh, key, entry)
+            metrics.set_gauge('refresher.entries', len(self._entries))
+
+    def _refresh(self, key, entry):
+        started = time.perf_counter()
+        try:
+            stored = self._store(key, entry['compute'](), entry['compute'], entry['interval'], entry['entities'])
+        except Exception as e:
+            stored = None
+            print(f"✗ Analytics refresh error for {key[0]}: {e}")
+        finally:
+            with self._lock:
+                self._running -= 1
+                entry['refreshing'] = False
+            metrics.observe('refresher.refresh_time', time.perf_counter() - started)
+
+        if stored is None:
+            # Keep serving the last good value and retry after another interval
+            metrics.incr('refresher.refresh_errors')
+            with self._lock:
+                entry['dirty'] = False
+                entry['due_at'] = time.monotonic() + entry['interval']
+        else:
+            metrics.incr('refresher.refreshes')
+
+# Global analytics refresher
+refresher = AnalyticsRefresher()
+
+def stale_while_revalidate(interval, entities=('order', 'product'), params=()):
+    """Serve the view's last good response and refresh it in the background
+
+    `interval` is the target refresh period in seconds; a change published
+    for any of `entities` marks the response for an earlier refresh.
+    Responses are keyed on the query parameters named in `params` (the
+    ones the view reads); any others are ignored, and not passed to it.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            app = current_app._get_current_object()
+            path = request.path
+            key_args = tuple((name, request.args[name]) for name in params if name in request.args)
+            query_string = urlencode(key_args)
+            key = (path, key_args)
+
+            def compute():
+                with app.test_request_context(path, query_string=query_string):
+                    response = make_response(f(*args, **kwargs))
+                    return response.get_data(), response.status_code, response.mimetype
+
+            body, status, mimetype, age = refresher.serve(key, compute, interval, entities)
+            response = make_response(body, status)
+            response.mimetype = mimetype
+            response.headers['Age'] = str(age)
+            return response
+        return decorated
+    return decorator
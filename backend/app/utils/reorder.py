@@ -0,0 +1,241 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+import numpy as np
+from bson import ObjectId
+from app.utils.database import init_db, get_collection
+from app.utils.order_archive import with_archive
+from app.utils.sync import next_seq, record_tombstones
+
+# Collection recording each run of the job
+RUNS = 'reorder_runs'
+
+# Marks draft orders written by the job
+SOURCE = 'auto_reorder'
+
+# Order statuses that count as demand (drafts and cancellations do not)
+NON_DEMAND_STATUSES = ['draft', 'cancelled']
+
+# Draft orders per insert_many call
+INSERT_BATCH = 1000
+
+# Planning defaults, overridable per run
+DEFAULT_OPTIONS = {
+    'window_days': 28,         # sales history used for velocity
+    'lead_time_days': 2,       # when a product has no lead_time_days
+    'service_z': 1.65,         # safety stock z-score (~95% cycle service level)
+    'order_cost': 250.0,       # fixed cost of placing one order line (₹)
+    'holding_rate': 0.24,      # yearly holding cost as a fraction of price
+}
+
+def reorder_plan(total, sumsq, days_since_last, last_quantity, price, lead_time, options):
+    """Reorder points and economic order quantities for many (retailer, SKU) pairs
+
+    All arguments are equal-length arrays except options. `total` and
+    `sumsq` are the sum and sum of squares of daily units sold over the
+    window. On-hand stock is estimated as the last delivery less the
+    units sold since at the current velocity. Returns (reorder, quantity,
+    reorder_point, eoq); `reorder` marks pairs at or below their reorder
+    point, `quantity` what to order for them (the EOQ, or enough to get
+    back to the reorder point if that is more). Pairs with no positive
+    price have no holding cost to size an EOQ with, so they are never
+    marked (their eoq is 0).
+    """
+    window = options['window_days']
+    velocity = total / window
+    sigma = np.sqrt(np.maximum(sumsq / window - velocity * velocity, 0))
+    safety_stock = options['service_z'] * sigma * np.sqrt(lead_time)
+    reorder_point = velocity * lead_time + safety_stock
+
+    # Wilson EOQ: sqrt(2 * yearly demand * order cost / yearly holding cost per unit)
+    priced = price > 0
+    holding = np.where(priced, price * options['holding_rate'], np.inf)
+    eoq = np.sqrt(2 * velocity * 365 * options['order_cost'] / holding)
+
+    on_hand = np.maximum(last_quantity - velocity * days_since_last, 0)
+    reorder = priced & (velocity > 0) & (on_hand <= reorder_point)
+    quantity = np.ceil(np.maximum(eoq, reorder_point - on_hand)).astype(np.int64)
+    return reorder, quantity, reorder_point, eoq
+
+def demand_pipeline(product_ids, since):
+    """Daily units per (retailer, product) folded into sum, sum of squares and last order"""
+    return [
+        {'$match': {
+            'status': {'$nin': NON_DEMAND_STATUSES},
+            'created_at': {'$gte': since},
+            'items.product_id': {'$in': product_ids}
+        }},
+        {'$unwind': '$items'},
+        {'$match': {'items.product_id': {'$in': product_ids}}},
+        {'$group': {
+            '_id': {
+                'retailer_id': '$retailer_id',
+                'product_id': '$items.product_id',
+                'day': {'$dateTrunc': {'date': '$created_at', 'unit': 'day'}}
+            },
+            'quantity': {'$sum': '$items.quantity'}
+        }},
+        {'$sort': {'_id.day': 1}},
+        {'$group': {
+            '_id': {'retailer_id': '$_id.retailer_id', 'product_id': '$_id.product_id'},
+            'total': {'$sum': '$quantity'},
+            'sumsq': {'$sum': {'$multiply': ['$quantity', '$quantity']}},
+            'last_day': {'$last': '$_id.day'},
+            'last_quantity': {'$last': '$quantity'}
+        }}
+    ]
+
+def plan_distributor(distributor_id, run_id, now, options):
+    """Compute and write draft reorders for one distributor's retailers
+
+    Replaces the drafts of earlier runs for the same distributor. Returns
+    a summary dict, including the products skipped for having no price
+    (`unpriced`) and the IDs of the drafts deleted (`deleted_drafts`).
+    """
+    started = time.perf_counter()
+    products = {
+        str(product['_id']): product
+        for product in get_collection('products').find(
+            {'distributor_id': distributor_id, 'is_active': {'$ne': False}},
+            {'name': 1, 'price': 1, 'lead_time_days': 1}
+        )
+    }
+    summary = {'distributor_id': distributor_id, 'pairs': 0, 'drafts': 0, 'items': 0,
+               'unpriced': 0, 'deleted_drafts': []}
+    if not products:
+        return summary
+
+    since = now - timedelta(days=options['window_days'])
+    rows = list(get_collection('orders').aggregate(
+        with_archive(demand_pipeline(list(products), since), since), allowDiskUse=True
+    ))
+    summary['pairs'] = len(rows)
+
+    drafts = []
+    if rows:
+        retailer_ids = [row['_id']['retailer_id'] for row in rows]
+        product_ids = [row['_id']['product_id'] for row in rows]
+        pair_products = [products[product_id] for product_id in product_ids]
+        price = np.fromiter((product.get('price') or 0 for product in pair_products),
+                            dtype=np.float64, count=len(rows))
+        summary['unpriced'] = len({product_ids[index] for index in np.flatnonzero(price <= 0).tolist()})
+        reorder, quantity, reorder_point, eoq = reorder_plan(
+            total=np.fromiter((row['total'] for row in rows), dtype=np.float64, count=len(rows)),
+            sumsq=np.fromiter((row['sumsq'] for row in rows), dtype=np.float64, count=len(rows)),
+            days_since_last=np.fromiter(((now - row['last_day']).total_seconds() / 86400 for row in rows),
+                                        dtype=np.float64, count=len(rows)),
+            last_quantity=np.fromiter((row['last_quantity'] for row in rows), dtype=np.float64, count=len(rows)),
+            price=price,
+            lead_time=np.fromiter((product.get('lead_time_days') or options['lead_time_days']
+                                   for product in pair_products), dtype=np.float64, count=len(rows)),
+            options=options
+        )
+
+        by_retailer = {}
+        for index in np.flatnonzero(reorder).tolist():
+            product = pair_products[index]
+            price = product.get('price') or 0
+            by_retailer.setdefault(retailer_ids[index], []).append({
+                'product_id': product_ids[index],
+                'product_name': product.get('name', ''),
+                'quantity': int(quantity[index]),
+                'price': price,
+                'total': int(quantity[index]) * price,
+                'reorder_point': round(float(reorder_point[index]), 1),
+                'economic_order_quantity': round(float(eoq[index]), 1)
+            })
+
+        for retailer_id, items in by_retailer.items():
+            drafts.append({
+                '_id': ObjectId(),
+                'retailer_id': retailer_id,
+                'distributor_id': distributor_id,
+                'items': items,
+                'total_amount': sum(item['total'] for item in items),
+                'status': 'draft',
+                'source': SOURCE,
+                'run_id': run_id,
+                'delivery_address': '',
+                'notes': 'Auto-reorder draft',
+                'created_at': now,
+                'updated_at': now,
+                'mobile_order': False
+            })
+
+    orders = get_collection('orders')
+    if drafts:
+        first = next_seq('orders', len(drafts))
+        for offset, draft in enumerate(drafts):
+            draft['change_seq'] = first + offset
+    for start in range(0, len(drafts), INSERT_BATCH):
+        orders.insert_many(drafts[start:start + INSERT_BATCH], ordered=False)
+
+    # Drafts of earlier runs are replaced; sync clients get tombstones for them
+    stale = {'status': 'draft', 'source': SOURCE, 'distributor_id': distributor_id, 'run_id': {'$ne': run_id}}
+    stale_drafts = list(orders.find(stale, {'retailer_id': 1}))
+    if stale_drafts:
+        stale_ids = [draft['_id'] for draft in stale_drafts]
+        orders.delete_many({**stale, '_id': {'$in': stale_ids}})
+        # Drafts submitted in the meantime were not deleted
+        kept = set(orders.distinct('_id', {'_id': {'$in': stale_ids}}))
+        deleted = [draft for draft in stale_drafts if draft['_id'] not in kept]
+        record_tombstones('orders', deleted)
+        summary['deleted_drafts'] = [str(draft['_id']) for draft in deleted]
+
+    summary.update(
+        drafts=len(drafts),
+        items=sum(len(draft['items']) for draft in drafts),
+        seconds=round(time.perf_counter() - started, 3)
+    )
+    return summary
+
+def _init_worker(mongo_uri):
+    init_db(mongo_uri, build_indexes=False)
+
+def _plan_partition(distributor_id, run_id, now, options):
+    try:
+        return plan_distributor(distributor_id, run_id, now, options)
+    except Exception as e:
+        return {'distributor_id': distributor_id, 'error': str(e)}
+
+def run_reorder_job(mongo_uri, processes=None, distributor_ids=None, **options):
+    """Plan reorders for every distributor's retailers in a process pool
+
+    Work is partitioned by distributor: each partition reads only its own
+    products' demand and replaces only its own drafts, so partitions run
+    independently. Expects init_db() in the calling process. Returns the
+    run document also stored in `reorder_runs` (without the
+    `deleted_drafts` ID list).
+    """
+    options = {**DEFAULT_OPTIONS, **options}
+    if distributor_ids is None:
+        distributor_ids = [d for d in get_collection('products').distinct('distributor_id') if d]
+
+    run_id = str(ObjectId())
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    partitions = []
+    # spawn, not fork: each worker opens its own MongoClient
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'),
+                             initializer=_init_worker, initargs=(mongo_uri,)) as pool:
+        futures = [pool.submit(_plan_partition, distributor_id, run_id, now, options)
+                   for distributor_id in distributor_ids]
+        for future in as_completed(futures):
+            partitions.append(future.result())
+
+    run = {
+        '_id': run_id,
+        'started_at': now,
+        'seconds': round(time.perf_counter() - started, 3),
+        'options': options,
+        'distributors': len(partitions),
+        'pairs': sum(partition.get('pairs', 0) for partition in partitions),
+        'drafts': sum(partition.get('drafts', 0) for partition in partitions),
+        'items': sum(partition.get('items', 0) for partition in partitions),
+        'unpriced': sum(partition.get('unpriced', 0) for partition in partitions),
+        'errors': [partition for partition in partitions if 'error' in partition]
+    }
+    get_collection(RUNS).insert_one(dict(run))
+    run['deleted_drafts'] = [draft_id for partition in partitions for draft_id in partition.get('deleted_drafts', [])]
+    return run
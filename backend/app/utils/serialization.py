@@ -0,0 +1,65 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from bson import Decimal128, ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+def _default(value):
+    """Serialize types the fast encoder does not know natively"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes MongoDB documents as-is
+
+    ObjectId, datetime and Decimal128 values are encoded natively, so
+    routes can return documents straight from PyMongo without converting
+    IDs first. Uses orjson when installed and falls back to the standard
+    library otherwise; both produce the same output.
+    """
+
+    def dumps_bytes(self, obj, pretty=False):
+        """Serialize obj to UTF-8 JSON bytes"""
+        if orjson is None:
+            return json.dumps(
+                obj,
+                default=_default,
+                ensure_ascii=False,
+                sort_keys=self.sort_keys,
+                indent=2 if pretty else None,
+                separators=None if pretty else (',', ':')
+            ).encode('utf-8')
+
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, pretty=kwargs.get('indent') is not None).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self.dumps_bytes(obj, pretty=pretty) + b'\n', mimetype=self.mimetype)
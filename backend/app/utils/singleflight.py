@@ -0,0 +1,87 @@
+import threading
+from functools import wraps
+from flask import request, make_response
+from app.utils import realtime
+from app.utils.metrics import metrics
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution
+
+    The first caller for a key (the leader) runs the function; callers
+    arriving while it runs wait on an async-mode-aware event and receive
+    the leader's result. Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        """Run func() once for all concurrent callers of key
+
+        Returns (result, shared). A waiter that times out, or whose
+        leader raised, runs func() itself.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': realtime.create_event(), 'ok': False, 'result': None}
+
+        if not leader:
+            if call['event'].wait(timeout) and call['ok']:
+                return call['result'], True
+            metrics.incr('singleflight.timeouts' if not call['event'].is_set() else 'singleflight.leader_errors')
+            return func(), False
+
+        try:
+            call['result'] = func()
+            call['ok'] = True
+            return call['result'], False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['event'].set()
+
+    def in_flight(self):
+        """Number of keys currently being computed"""
+        return len(self._calls)
+
+# Global single-flight group for view functions
+flights = SingleFlight()
+
+def request_key(normalize=None):
+    """Endpoint plus normalized query arguments of the current request"""
+    args = request.args.to_dict(flat=False)
+    if normalize is not None:
+        args = normalize(args)
+    return (request.endpoint, tuple(sorted((name, tuple(values)) for name, values in args.items())))
+
+def single_flight(timeout=30, normalize=None):
+    """Share one in-flight execution of the view among identical requests
+
+    Requests are identical when they hit the same endpoint with the same
+    query arguments after `normalize(args)` (a dict of lists), e.g. to
+    apply defaults. Waiters give up after `timeout` seconds and run the
+    view themselves.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request_key(normalize)
+
+            def render():
+                response = make_response(f(*args, **kwargs))
+                return response.get_data(), response.status_code, response.mimetype
+
+            (body, status, mimetype), shared = flights.do(key, render, timeout)
+            outcome = 'coalesced' if shared else 'executed'
+            metrics.incr(f'singleflight.{outcome}')
+            metrics.incr(f'singleflight.{outcome}.{request.endpoint}')
+            metrics.set_gauge('singleflight.in_flight', flights.in_flight())
+
+            response = make_response(body, status)
+            response.mimetype = mimetype
+            return response
+        return decorated
+    return decorator
@@ -0,0 +1,136 @@
+import gzip
+import threading
+import time
+from functools import wraps
+from flask import request, make_response
+from app.utils.metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+# Upper bound on distinct URLs kept at once
+MAX_SNAPSHOTS = 256
+
+class SnapshotCache:
+    """Shares one serialized, precompressed response per URL and tick
+
+    The first request in a tick runs the view, then the body is stored
+    alongside its gzip and brotli encodings. Every other request in the
+    same tick gets the stored variant matching its Accept-Encoding, with
+    no per-request serialization or compression work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry['expires_at'] <= time.monotonic():
+            return None
+        return entry
+
+    def store(self, key, response, ttl):
+        """Store a response's body and its compressed encodings"""
+        body = response.get_data()
+        encodings = {'identity': body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            encodings['gzip'] = gzip.compress(body, compresslevel=6)
+            if brotli is not None:
+                encodings['br'] = brotli.compress(body, quality=5)
+
+        entry = {
+            'encodings': encodings,
+            'status': response.status_code,
+            'mimetype': response.mimetype,
+            'created_at': time.monotonic(),
+            'expires_at': time.monotonic() + ttl
+        }
+        with self._lock:
+            if len(self._entries) >= MAX_SNAPSHOTS:
+                now = time.monotonic()
+                for stale_key in [k for k, e in self._entries.items() if e['expires_at'] <= now]:
+                    del self._entries[stale_key]
+                if len(self._entries) >= MAX_SNAPSHOTS:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = entry
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+snapshot_cache = SnapshotCache()
+
+def accepted_encodings(header, candidates=('br', 'gzip')):
+    """Parse Accept-Encoding into the set of codings with a non-zero q-value
+
+    A `*` stands for the `candidates` the header does not name, so a
+    coding refused with q=0 stays refused.
+    """
+    qualities = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding] = quality
+
+    accepted = {coding for coding, quality in qualities.items() if quality > 0 and coding != '*'}
+    if qualities.get('*', 0) > 0:
+        accepted.update(coding for coding in candidates if coding not in qualities)
+    return accepted
+
+def serve_snapshot(entry, hit):
+    """Build a response from a stored snapshot for the current request"""
+    encodings = entry['encodings']
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding'))
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in encodings and candidate in accepted:
+            encoding = candidate
+            break
+
+    body = encodings[encoding]
+    response = make_response(body, entry['status'])
+    response.mimetype = entry['mimetype']
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Snapshot'] = 'hit' if hit else 'miss'
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+
+    metrics.incr('snapshots.hits' if hit else 'snapshots.misses')
+    metrics.incr('snapshots.bytes_served', len(body))
+    metrics.incr('snapshots.bytes_saved', len(encodings['identity']) - len(body))
+    return response
+
+def shared_snapshot(ttl):
+    """Serve one precompressed snapshot of the view per URL every `ttl` seconds"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = snapshot_cache.get(key)
+            if entry is not None:
+                return serve_snapshot(entry, hit=True)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+
+            entry = snapshot_cache.store(key, response, ttl)
+            return serve_snapshot(entry, hit=False)
+        return decorated
+    return decorator
@@ -0,0 +1,128 @@
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from app.utils import realtime
+from app.utils.database import get_collection, get_status
+from app.utils.metrics import metrics
+
+# Time-series collection of stock levels (see TIME_SERIES in database.py)
+HISTORY = 'stock_history'
+
+# Bucket sizes accepted by the history API: resolution -> ($dateTrunc unit, binSize, seconds)
+RESOLUTIONS = {
+    'minute': ('minute', 1, 60),
+    '5min': ('minute', 5, 300),
+    '15min': ('minute', 15, 900),
+    'hour': ('hour', 1, 3600),
+    '6hour': ('hour', 6, 21600),
+    'day': ('day', 1, 86400),
+    'week': ('week', 1, 604800),
+}
+
+# Most buckets a single history response may contain
+MAX_POINTS = 2000
+
+# Default history window when `from` is omitted
+DEFAULT_WINDOW = timedelta(days=7)
+
+class StockHistoryRecorder:
+    """Buffers stock level samples and writes them in batches
+
+    record() only appends to an in-memory buffer; a background loop
+    inserts the buffer with one unordered insert_many per interval.
+    """
+
+    def __init__(self, interval=1.0, max_buffered=50000):
+        self.interval = interval
+        self.max_buffered = max_buffered
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._started = False
+
+    def configure(self, interval=None):
+        """Override defaults from app config"""
+        if interval is not None:
+            self.interval = interval
+
+    def start(self):
+        """Start the background writer (idempotent)"""
+        if self._started:
+            return
+        self._started = True
+        realtime.start_background_task(self._run)
+
+    def record(self, product_id, stock, source=None, ts=None):
+        """Queue one stock level sample for a product"""
+        if stock is None:
+            return
+        sample = {
+            'product_id': ObjectId(product_id),
+            'ts': ts or datetime.utcnow(),
+            'stock': stock
+        }
+        if source:
+            sample['source'] = source
+        with self._lock:
+            if len(self._buffer) >= self.max_buffered:
+                metrics.incr('stock_history.dropped')
+                return
+            self._buffer.append(sample)
+
+    def flush(self):
+        """Write buffered samples; returns how many were written"""
+        with self._lock:
+            samples, self._buffer = self._buffer, []
+        if not samples:
+            return 0
+        try:
+            get_collection(HISTORY).insert_many(samples, ordered=False)
+        except BulkWriteError as e:
+            # Part of the batch landed; retrying would duplicate it
+            metrics.incr('stock_history.dropped', len(e.details.get('writeErrors', [])))
+            raise
+        except Exception:
+            # Nothing was written; put the samples back for the next flush
+            with self._lock:
+                self._buffer = (samples + self._buffer)[-self.max_buffered:]
+            raise
+        metrics.incr('stock_history.samples', len(samples))
+        return len(samples)
+
+    def _run(self):
+        while True:
+            realtime.sleep(self.interval)
+            if get_status()['indexes'] != 'ready':
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"✗ Stock history flush error: {e}")
+
+def pick_resolution(start, end):
+    """Finest resolution that keeps the range within MAX_POINTS buckets"""
+    span = (end - start).total_seconds()
+    for name, (_, _, seconds) in RESOLUTIONS.items():
+        if span / seconds <= MAX_POINTS:
+            return name
+    return 'week'
+
+def downsample(product_id, start, end, resolution):
+    """min/max/last stock per bucket, computed by MongoDB"""
+    unit, bin_size, _ = RESOLUTIONS[resolution]
+    pipeline = [
+        {'$match': {'product_id': ObjectId(product_id), 'ts': {'$gte': start, '$lt': end}}},
+        {'$sort': {'ts': 1}},
+        {'$group': {
+            '_id': {'$dateTrunc': {'date': '$ts', 'unit': unit, 'binSize': bin_size}},
+            'min': {'$min': '$stock'},
+            'max': {'$max': '$stock'},
+            'last': {'$last': '$stock'}
+        }},
+        {'$sort': {'_id': 1}},
+        {'$project': {'_id': 0, 't': '$_id', 'min': 1, 'max': 1, 'last': 1}}
+    ]
+    return list(get_collection(HISTORY).aggregate(pipeline, allowDiskUse=True))
+
+# Global stock history recorder
+stock_history = StockHistoryRecorder()
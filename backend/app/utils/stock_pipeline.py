@@ -0,0 +1,237 @@
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.utils import realtime
+from app.utils.broadcast import publish_change, product_rooms, order_rooms
+from app.utils.database import get_collection, get_status, DURABLE_WRITES
+from app.utils.metrics import metrics
+from app.utils.stock_history import stock_history
+from app.utils.stock_shards import sharded_stock
+from app.utils.sync import next_seq
+from app.utils.versions import bump_version
+
+# Outbox collection holding stock deltas not yet applied to products
+OUTBOX = 'stock_outbox'
+
+# How many recent batch IDs each product remembers for idempotent replay
+APPLIED_BATCH_HISTORY = 20
+
+class StockPipeline:
+    """Write-behind stock decrements for orders
+
+    create_order durably writes an outbox entry with the order's stock
+    deltas and then the order itself, and returns. A background flusher
+    claims pending entries, merges their deltas per product and applies
+    one $inc per product with a single bulk_write. Each product records
+    the batch IDs it has applied, so a batch interrupted by a crash can be
+    replayed without decrementing twice.
+    """
+
+    def __init__(self, interval=0.5, batch_size=1000, claim_timeout=30, orphan_grace=60, shard_sync_interval=2.0):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.claim_timeout = claim_timeout
+        self.orphan_grace = orphan_grace
+        self.shard_sync_interval = shard_sync_interval
+        self._started = False
+
+    def configure(self, interval=None, batch_size=None):
+        """Override defaults from app config"""
+        if interval is not None:
+            self.interval = interval
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+    def start(self):
+        """Start the background flusher (idempotent)"""
+        if self._started:
+            return
+        self._started = True
+        realtime.start_background_task(self._run)
+
+    def enqueue(self, order_id, items, retailer_id=None, notify=None):
+        """Durably queue the stock deltas of an order's items
+
+        Must be called before the order is inserted; an entry whose order
+        never appears is discarded after orphan_grace seconds.
+        """
+        deltas = {}
+        for item in items:
+            if 'product_id' in item:
+                product_id = ObjectId(item['product_id'])
+                deltas[product_id] = deltas.get(product_id, 0) - item['quantity']
+
+        outbox = get_collection(OUTBOX).with_options(write_concern=DURABLE_WRITES)
+        outbox.insert_one({
+            '_id': order_id,
+            'state': 'pending',
+            'deltas': [{'product_id': product_id, 'delta': delta} for product_id, delta in deltas.items()],
+            'retailer_id': retailer_id,
+            'notify': notify or {},
+            'created_at': datetime.utcnow()
+        })
+        metrics.incr('stock.enqueued')
+
+    def discard(self, order_id):
+        """Drop an outbox entry whose order could not be written"""
+        get_collection(OUTBOX).delete_one({'_id': order_id, 'state': 'pending'})
+
+    def flush(self):
+        """Claim pending entries, recover stale claims and apply them"""
+        self._recover_stale_claims()
+
+        outbox = get_collection(OUTBOX)
+        pending_ids = [entry['_id'] for entry in outbox.find(
+            {'state': 'pending'}, {'_id': 1}
+        ).sort('_id', 1).limit(self.batch_size)]
+        if not pending_ids:
+            metrics.set_gauge('stock.outbox_backlog', 0)
+            return 0
+
+        batch_id = ObjectId()
+        outbox.update_many(
+            {'_id': {'$in': pending_ids}, 'state': 'pending'},
+            {'$set': {'state': 'claimed', 'batch_id': batch_id, 'claimed_at': datetime.utcnow()}}
+        )
+        applied = self.apply_batch(batch_id)
+        metrics.set_gauge('stock.outbox_backlog', outbox.count_documents({'state': 'pending'}))
+        return applied
+
+    def apply_batch(self, batch_id):
+        """Apply every entry claimed under batch_id (safe to repeat)"""
+        started = time.perf_counter()
+        outbox = get_collection(OUTBOX)
+        entries = list(outbox.find({'batch_id': batch_id}))
+        if not entries:
+            return 0
+
+        # Skip entries whose order insert (or submission from draft) has not landed, or never will
+        orders = get_collection('orders')
+        existing = {order['_id'] for order in orders.find(
+            {'_id': {'$in': [entry['_id'] for entry in entries]}, 'status': {'$ne': 'draft'}}, {'_id': 1}
+        )}
+        orphan_cutoff = datetime.utcnow() - timedelta(seconds=self.orphan_grace)
+        ready = []
+        for entry in entries:
+            if entry['_id'] in existing:
+                ready.append(entry)
+            elif entry['created_at'] < orphan_cutoff:
+                outbox.delete_one({'_id': entry['_id']})
+                metrics.incr('stock.orphans_discarded')
+            else:
+                outbox.update_one({'_id': entry['_id']}, {
+                    '$set': {'state': 'pending'},
+                    '$unset': {'batch_id': '', 'claimed_at': ''}
+                })
+
+        merged = {}
+        for entry in ready:
+            for delta in entry['deltas']:
+                merged[delta['product_id']] = merged.get(delta['product_id'], 0) + delta['delta']
+
+        if merged:
+            self.apply_deltas(batch_id, dict(merged))
+
+        outbox.delete_many({'batch_id': batch_id, '_id': {'$in': [entry['_id'] for entry in ready]}})
+        self._notify(ready, list(merged))
+
+        metrics.observe('stock.flush_time', time.perf_counter() - started)
+        metrics.incr('stock.entries_applied', len(ready))
+        metrics.incr('stock.product_updates', len(merged))
+        return len(ready)
+
+    def apply_deltas(self, batch_id, merged):
+        """One guarded $inc per product for the merged deltas of a batch
+
+        Products in sharded mode take their delta on a stock shard
+        instead of the product document. The $inc skips flagged products,
+        so one sharded after the flags were cached is caught here and
+        rerouted to its shards; a cached flag whose shards are gone falls
+        through to the $inc.
+        """
+        sharded = sharded_stock.sharded_ids()
+        for product_id in [product_id for product_id in merged if product_id in sharded]:
+            if sharded_stock.apply(product_id, merged[product_id], batch_id):
+                merged.pop(product_id)
+        if not merged:
+            return
+
+        products = get_collection('products')
+        now = datetime.utcnow()
+        first = next_seq('products', len(merged))
+        result = products.bulk_write([
+            UpdateOne(
+                {'_id': product_id, 'stock_batches': {'$ne': batch_id}, 'sharded_stock': {'$ne': True}},
+                {
+                    '$inc': {'stock': delta},
+                    '$set': {'updated_at': now, 'change_seq': first + offset},
+                    '$push': {'stock_batches': {'$each': [batch_id], '$slice': -APPLIED_BATCH_HISTORY}}
+                }
+            )
+            for offset, (product_id, delta) in enumerate(merged.items())
+        ], ordered=False)
+        if result.matched_count < len(merged):
+            for product in products.find(
+                {'_id': {'$in': list(merged)}, 'sharded_stock': True, 'stock_batches': {'$ne': batch_id}}, {'_id': 1}
+            ):
+                sharded_stock.apply(product['_id'], merged[product['_id']], batch_id)
+
+    def _notify(self, entries, product_ids):
+        """Publish new stock levels and tell distributors about the orders"""
+        if not product_ids:
+            return
+        products = get_collection('products')
+        distributors = {}
+        product_list = sharded_stock.overlay(list(products.find(
+            {'_id': {'$in': product_ids}},
+            {'stock': 1, 'distributor_id': 1, 'category': 1, 'sharded_stock': 1}
+        )))
+        for product in product_list:
+            distributors[product['_id']] = product.get('distributor_id')
+            publish_change('product', product['_id'], 'update', {'stock': product['stock']}, product_rooms(product))
+            stock_history.record(product['_id'], product['stock'], 'order')
+        bump_version('products', *product_ids)
+
+        for entry in entries:
+            distributor_ids = {distributors.get(delta['product_id']) for delta in entry['deltas']}
+            rooms = [room for room in order_rooms({}, distributor_ids) if room]
+            if rooms:
+                publish_change('order', entry['_id'], 'create', entry.get('notify'), rooms)
+
+    def _recover_stale_claims(self):
+        """Replay batches whose flusher died before finishing them"""
+        outbox = get_collection(OUTBOX)
+        stale_before = datetime.utcnow() - timedelta(seconds=self.claim_timeout)
+        for batch_id in outbox.distinct('batch_id', {'state': 'claimed', 'claimed_at': {'$lt': stale_before}}):
+            print(f"✓ Replaying stock batch {batch_id}")
+            metrics.incr('stock.batches_replayed')
+            self.apply_batch(batch_id)
+
+    def sync_shards(self):
+        """Copy sharded stock totals into products and publish the changes"""
+        totals = sharded_stock.sync_totals()
+        if not totals:
+            return
+        products = get_collection('products')
+        for product in products.find({'_id': {'$in': list(totals)}}, {'distributor_id': 1, 'category': 1}):
+            publish_change('product', product['_id'], 'update', {'stock': totals[product['_id']]}, product_rooms(product))
+            stock_history.record(product['_id'], totals[product['_id']], 'shards')
+        bump_version('products', *totals)
+
+    def _run(self):
+        last_shard_sync = 0
+        while True:
+            realtime.sleep(self.interval)
+            if get_status()['state'] != 'ready':
+                continue
+            try:
+                self.flush()
+                if time.monotonic() - last_shard_sync >= self.shard_sync_interval:
+                    last_shard_sync = time.monotonic()
+                    self.sync_shards()
+            except Exception as e:
+                print(f"✗ Stock flush error: {e}")
+
+# Global stock pipeline
+stock_pipeline = StockPipeline()
@@ -0,0 +1,371 @@
+import random
+import threading
+import time
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from app.utils import versions
+from app.utils.database import get_collection
+from app.utils.metrics import metrics
+from app.utils.sync import next_seq
+from app.utils.versions import bump_version
+
+# Collection holding the sub-counters of sharded products
+SHARDS = 'stock_shards'
+
+# How many recent batch IDs each shard remembers for idempotent replay
+APPLIED_BATCH_HISTORY = 20
+
+# Version bumped whenever a product enters or leaves sharded mode
+FLAG_VERSION = 'stock_shards'
+
+class ShardedStock:
+    """Optional sharded stock counters for high-contention products
+
+    A flagged product's stock is split across N documents in
+    stock_shards. Writers pick shards in random order and decrement the
+    first one that can cover the quantity, so concurrent writers rarely
+    touch the same document. Totals are summed from the shards, cached
+    briefly, and periodically copied back into products.stock so
+    existing queries keep working.
+
+    Writes to products.stock skip documents flagged sharded_stock, and
+    shard writes that find no shard report it, so a worker whose flag
+    cache is stale gets its delta rerouted instead of lost.
+    """
+
+    def __init__(self, cache_ttl=1.0, flag_ttl=5.0):
+        self.cache_ttl = cache_ttl
+        self.flag_ttl = flag_ttl
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._flagged = {}
+        self._flagged_at = 0
+        self._flagged_version = None
+
+    def sharded_ids(self):
+        """Shard counts of products in sharded mode, keyed by ID
+
+        Cached for flag_ttl seconds, and reloaded as soon as another
+        worker enables or disables sharding (through the shared version
+        store when one is configured).
+        """
+        try:
+            version = versions.store.get(FLAG_VERSION)
+        except Exception as e:
+            print(f"✗ Version lookup error: {e}")
+            version = self._flagged_version
+        if version != self._flagged_version or time.monotonic() - self._flagged_at > self.flag_ttl:
+            products = get_collection('products')
+            flagged = {
+                product['_id']: product.get('stock_shards', 1)
+                for product in products.find({'sharded_stock': True}, {'stock_shards': 1})
+            }
+            with self._lock:
+                self._flagged = flagged
+                self._flagged_at = time.monotonic()
+                self._flagged_version = version
+        return self._flagged
+
+    def is_sharded(self, product_id):
+        return ObjectId(product_id) in self.sharded_ids()
+
+    def enable(self, product_id, shard_count):
+        """Split a product's current stock across shard_count sub-counters
+
+        Empty shards are created before the flag is set, and the stock
+        read atomically with setting it is then added to them, so a
+        concurrent $inc lands either in that stock or (once it sees the
+        flag) on a shard.
+        """
+        product_id = ObjectId(product_id)
+        shard_count = max(1, int(shard_count))
+        products = get_collection('products')
+        product = products.find_one({'_id': product_id}, {'sharded_stock': 1})
+        if product is None:
+            return None
+
+        if product.get('sharded_stock'):
+            self._resize_shards(product_id, shard_count)
+            products.update_one({'_id': product_id, 'sharded_stock': True}, {'$set': {
+                'stock_shards': shard_count,
+                'updated_at': datetime.utcnow(),
+                'change_seq': next_seq('products')
+            }})
+        else:
+            shards = get_collection(SHARDS)
+            self._create_shards(product_id, shard_count)
+            product = products.find_one_and_update(
+                {'_id': product_id, 'sharded_stock': {'$ne': True}},
+                {'$set': {
+                    'sharded_stock': True,
+                    'stock_shards': shard_count,
+                    'updated_at': datetime.utcnow(),
+                    'change_seq': next_seq('products')
+                }},
+                projection={'stock': 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if product is not None:
+                base, remainder = divmod(int(product.get('stock', 0)), shard_count)
+                shards.bulk_write([
+                    UpdateOne({'_id': f'{product_id}:{index}'},
+                              {'$inc': {'stock': base + (1 if index < remainder else 0)}})
+                    for index in range(shard_count)
+                ], ordered=False)
+            elif products.find_one({'_id': product_id}, {'_id': 1}) is None:
+                shards.delete_many({'product_id': product_id})
+                return None
+
+        self._forget(product_id, shard_count)
+        bump_version(FLAG_VERSION)
+        return self.total(product_id)
+
+    def disable(self, product_id):
+        """Fold the shards back into products.stock
+
+        The flag is cleared first; each shard is then deleted and its
+        stock added to the document, adjusted by the copy it held, so
+        writes made meanwhile by either path are kept. A product that is
+        not sharded is left untouched. Returns the stock, or None when
+        the product does not exist (its shards are then dropped).
+        """
+        product_id = ObjectId(product_id)
+        products = get_collection('products')
+        product = products.find_one_and_update(
+            {'_id': product_id, 'sharded_stock': True},
+            {'$unset': {'sharded_stock': '', 'stock_shards': ''}},
+            projection={'stock': 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if product is None:
+            product = products.find_one({'_id': product_id}, {'stock': 1})
+            if product is not None:
+                return product.get('stock', 0)
+            # Deleted product: drop whatever shards it left behind
+            get_collection(SHARDS).delete_many({'product_id': product_id})
+            self._forget(product_id, None)
+            bump_version(FLAG_VERSION)
+            return None
+
+        shards = get_collection(SHARDS)
+        total = 0
+        while True:
+            shard = shards.find_one_and_delete({'product_id': product_id}, projection={'stock': 1})
+            if shard is None:
+                break
+            total += shard.get('stock', 0)
+
+        product = products.find_one_and_update(
+            {'_id': product_id},
+            {
+                '$inc': {'stock': total - product.get('stock', 0)},
+                '$set': {'updated_at': datetime.utcnow(), 'change_seq': next_seq('products')}
+            },
+            projection={'stock': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        self._forget(product_id, None)
+        bump_version(FLAG_VERSION)
+        return total if product is None else product.get('stock', 0)
+
+    def reset(self, product_id, stock, shard_count=None):
+        """Overwrite a sharded product's stock (e.g. from update_product)"""
+        product_id = ObjectId(product_id)
+        shard_count = shard_count or self.sharded_ids().get(product_id) or 1
+        self._write_shards(product_id, stock, shard_count)
+        self._forget(product_id, shard_count)
+
+    def apply(self, product_id, delta, batch_id=None):
+        """Apply a stock delta to the product's shards
+
+        Decrements go to the first shard (in random order) that can cover
+        them; if none can, the quantity is drained from several shards,
+        and only what exceeds their total goes negative, matching the
+        unguarded behaviour of the single counter. With batch_id set, the
+        batch is first claimed on shard 0 (a guarded $push, so concurrent
+        retries of one batch cannot both pass) and a delta already claimed
+        is skipped; a crash between the claim and the write loses that
+        delta rather than applying it twice. Returns False when the
+        product has no shards (it is not, or no longer, sharded).
+        """
+        product_id = ObjectId(product_id)
+        shards = get_collection(SHARDS)
+        if batch_id is not None:
+            claimed = shards.update_one(
+                {'_id': f'{product_id}:0', 'batches': {'$ne': batch_id}},
+                {'$push': {'batches': {'$each': [batch_id], '$slice': -APPLIED_BATCH_HISTORY}}}
+            )
+            if not claimed.matched_count:
+                # Already applied, unless the product has no shards at all
+                return shards.find_one({'_id': f'{product_id}:0'}, {'_id': 1}) is not None
+
+        shard_count = self._flagged.get(product_id) or 1
+        shard_ids = [f'{product_id}:{index}' for index in range(shard_count)]
+        random.shuffle(shard_ids)
+
+        update = {'$inc': {'stock': delta}}
+        applied = False
+        if delta < 0:
+            for attempt, shard_id in enumerate(shard_ids):
+                if shards.update_one({'_id': shard_id, 'stock': {'$gte': -delta}}, update).modified_count:
+                    metrics.incr('stock_shards.fallbacks', attempt)
+                    applied = True
+                    break
+            else:
+                applied = self._drain(product_id, -delta)
+        else:
+            # A stale shard count can name a shard that no longer exists
+            applied = (shards.update_one({'_id': shard_ids[0]}, update).matched_count
+                       or shards.update_one({'product_id': product_id}, update).matched_count)
+        if not applied:
+            return False
+
+        metrics.incr('stock_shards.writes')
+        with self._lock:
+            self._totals.pop(product_id, None)
+        return True
+
+    def _drain(self, product_id, quantity):
+        """Take a decrement no single shard covers from as many shards as needed
+
+        Fullest shards are drained first. Returns False when the product
+        has no shards.
+        """
+        shards = get_collection(SHARDS)
+        remaining = quantity
+        last_id = None
+        for shard in shards.find({'product_id': product_id}, {'stock': 1}).sort('stock', -1):
+            last_id = shard['_id']
+            take = min(max(shard.get('stock', 0), 0), remaining)
+            if not take:
+                continue
+            if shards.update_one({'_id': shard['_id'], 'stock': {'$gte': take}}, {'$inc': {'stock': -take}}).modified_count:
+                remaining -= take
+                if not remaining:
+                    metrics.incr('stock_shards.split')
+                    return True
+        if last_id is None:
+            return False
+
+        metrics.incr('stock_shards.overdrawn')
+        shards.update_one({'_id': last_id}, {'$inc': {'stock': -remaining}})
+        return True
+
+    def total(self, product_id):
+        """Cached sum of a product's shards"""
+        return self.totals([product_id]).get(ObjectId(product_id), 0)
+
+    def totals(self, product_ids):
+        """Cached shard sums for several products"""
+        product_ids = [ObjectId(product_id) for product_id in product_ids]
+        now = time.monotonic()
+        result, missing = {}, []
+        for product_id in product_ids:
+            cached = self._totals.get(product_id)
+            if cached and cached[1] > now:
+                result[product_id] = cached[0]
+            else:
+                missing.append(product_id)
+
+        if missing:
+            fresh = self._sum(missing)
+            with self._lock:
+                for product_id in missing:
+                    result[product_id] = fresh.get(product_id, 0)
+                    self._totals[product_id] = (result[product_id], now + self.cache_ttl)
+        return result
+
+    def overlay(self, product_list):
+        """Replace stock with the shard total for sharded products in a result list"""
+        sharded = [product['_id'] for product in product_list if product.get('sharded_stock')]
+        if sharded:
+            totals = self.totals(sharded)
+            for product in product_list:
+                if product.get('sharded_stock'):
+                    product['stock'] = totals.get(product['_id'], product.get('stock', 0))
+        return product_list
+
+    def sync_totals(self):
+        """Copy shard totals into products.stock; returns the totals that changed"""
+        flagged = list(self.sharded_ids())
+        if not flagged:
+            return {}
+        totals = self._sum(flagged)
+        products = get_collection('products')
+        changed = {
+            product['_id']: totals.get(product['_id'], 0)
+            for product in products.find({'_id': {'$in': flagged}, 'sharded_stock': True}, {'stock': 1})
+            if product.get('stock') != totals.get(product['_id'], 0)
+        }
+        if changed:
+            now = datetime.utcnow()
+            first = next_seq('products', len(changed))
+            products.bulk_write([
+                UpdateOne({'_id': product_id, 'sharded_stock': True},
+                          {'$set': {'stock': total, 'updated_at': now, 'change_seq': first + offset}})
+                for offset, (product_id, total) in enumerate(changed.items())
+            ], ordered=False)
+        return changed
+
+    def _create_shards(self, product_id, shard_count):
+        """Upsert empty shards 0..shard_count-1 (existing ones are left alone)"""
+        get_collection(SHARDS).bulk_write([
+            UpdateOne({'_id': f'{product_id}:{index}'}, {'$setOnInsert': {
+                'product_id': product_id, 'shard': index, 'stock': 0, 'batches': []
+            }}, upsert=True)
+            for index in range(shard_count)
+        ], ordered=False)
+
+    def _resize_shards(self, product_id, shard_count):
+        """Change the shard count, moving the stock of dropped shards onto shard 0
+
+        Shards are added and removed one document at a time and their
+        stock moved with $inc, so concurrent deltas are never overwritten.
+        """
+        shards = get_collection(SHARDS)
+        self._create_shards(product_id, shard_count)
+        while True:
+            extra = shards.find_one_and_delete(
+                {'product_id': product_id, 'shard': {'$gte': shard_count}}, projection={'stock': 1}
+            )
+            if extra is None:
+                break
+            shards.update_one({'_id': f'{product_id}:0'}, {'$inc': {'stock': extra.get('stock', 0)}})
+
+    def _write_shards(self, product_id, stock, shard_count):
+        """Set a product's stock across shard_count shards, in place
+
+        Each shard is overwritten by an upsert rather than deleted and
+        reinserted, so a concurrent apply always finds its shard.
+        """
+        base, remainder = divmod(int(stock), shard_count)
+        shards = get_collection(SHARDS)
+        shards.bulk_write([
+            UpdateOne({'_id': f'{product_id}:{index}'}, {
+                '$set': {'product_id': product_id, 'shard': index, 'stock': base + (1 if index < remainder else 0)},
+                '$setOnInsert': {'batches': []}
+            }, upsert=True)
+            for index in range(shard_count)
+        ], ordered=False)
+        shards.delete_many({'product_id': product_id, 'shard': {'$gte': shard_count}})
+
+    def _sum(self, product_ids):
+        pipeline = [
+            {'$match': {'product_id': {'$in': product_ids}}},
+            {'$group': {'_id': '$product_id', 'stock': {'$sum': '$stock'}}}
+        ]
+        return {row['_id']: row['stock'] for row in get_collection(SHARDS).aggregate(pipeline)}
+
+    def _forget(self, product_id, shard_count):
+        with self._lock:
+            self._totals.pop(product_id, None)
+            flagged = dict(self._flagged)
+            if shard_count:
+                flagged[product_id] = shard_count
+            else:
+                flagged.pop(product_id, None)
+            self._flagged = flagged
+
+# Global sharded stock manager
+sharded_stock = ShardedStock()
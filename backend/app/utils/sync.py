@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
+from app.utils import realtime
+from app.utils.database import get_collection, get_status
+from app.utils.metrics import metrics
+
+# Per-entity change sequence counters: {_id: entity, seq}
+COUNTERS = 'sync_counters'
+
+# Deleted documents as seen by sync clients
+TOMBSTONES = 'sync_tombstones'
+
+# Collections whose writes carry a change_seq
+SYNC_ENTITIES = ('products', 'orders')
+
+# Changes younger than this are sent but not yet covered by the returned
+# token, so a write that took a lower sequence number and is still in
+# flight cannot be skipped; clients apply the repeats idempotently
+SYNC_SETTLE = timedelta(seconds=10)
+
+# Documents given a change_seq per backfill round
+BACKFILL_BATCH = 1000
+
+# Scope fields with a (field, change_seq) index, most selective first
+SCOPE_FIELDS = ('retailer_id', 'distributor_id', 'category')
+
+def next_seq(entity, count=1):
+    """Reserve `count` consecutive change sequence numbers; returns the first"""
+    counter = get_collection(COUNTERS, 'primary').find_one_and_update(
+        {'_id': entity},
+        {'$inc': {'seq': count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['seq'] - count + 1
+
+def record_tombstones(entity, docs, now=None):
+    """Record deleted documents (with their scope fields) for sync clients"""
+    docs = list(docs)
+    if not docs:
+        return
+    now = now or datetime.utcnow()
+    first = next_seq(entity, len(docs))
+    get_collection(TOMBSTONES, 'primary').insert_many([
+        {**{field: value for field, value in doc.items() if field != '_id'},
+         'entity': entity, 'doc_id': doc['_id'], 'change_seq': first + offset, 'updated_at': now}
+        for offset, doc in enumerate(docs)
+    ], ordered=False)
+
+def changes_since(entity, since, limit, query=None, projection=None):
+    """Documents and tombstones of an entity changed after sequence `since`
+
+    Both are read off their change_seq indexes (the (scope field,
+    change_seq) ones when `query` pins a SCOPE_FIELDS field), so the
+    cost follows the number of changes rather than the collection size,
+    or the scope's share of them. Returns
+    (documents, deleted_ids, token, has_more). The token is the last
+    sequence number of the settled prefix of the page; documents newer
+    than SYNC_SETTLE are included but sent again on the next sync.
+    """
+    query = query or {}
+    window = {'change_seq': {'$gt': since}}
+    scope = next(([(field, 1)] for field in SCOPE_FIELDS if field in query), [])
+    docs = get_collection(entity).find({**window, **query}, projection).sort('change_seq', 1).limit(limit + 1)
+    tombstones = get_collection(TOMBSTONES).find(
+        {'entity': entity, **window, **query}, {'doc_id': 1, 'change_seq': 1, 'updated_at': 1}
+    ).sort('change_seq', 1).limit(limit + 1)
+    # Hints name indexes that exist only once the startup build has finished
+    if scope and get_status()['indexes'] == 'ready':
+        docs = docs.hint(scope + [('change_seq', 1)])
+        tombstones = tombstones.hint([('entity', 1)] + scope + [('change_seq', 1)])
+    docs, tombstones = list(docs), list(tombstones)
+
+    entries = sorted([(doc['change_seq'], False, doc) for doc in docs] +
+                     [(tombstone['change_seq'], True, tombstone) for tombstone in tombstones],
+                     key=lambda entry: entry[0])
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    token = since
+    settled_before = datetime.utcnow() - SYNC_SETTLE
+    for seq, _, doc in entries:
+        if doc.get('updated_at') and doc['updated_at'] > settled_before:
+            break
+        token = seq
+
+    documents = [doc for _, deleted, doc in entries if not deleted]
+    deleted = [str(doc['doc_id']) for _, deleted, doc in entries if deleted]
+    metrics.incr(f'sync.{entity}.documents', len(entries))
+    # A page that cannot advance the token is not worth fetching again now
+    return documents, deleted, token, more and token > since
+
+def backfill_change_seq(entity):
+    """Give documents written before change sequences existed a change_seq"""
+    collection = get_collection(entity, 'primary')
+    total = 0
+    while True:
+        ids = [doc['_id'] for doc in collection.find({'change_seq': {'$exists': False}}, {'_id': 1})
+               .limit(BACKFILL_BATCH)]
+        if not ids:
+            return total
+        first = next_seq(entity, len(ids))
+        collection.bulk_write([
+            UpdateOne({'_id': doc_id, 'change_seq': {'$exists': False}}, {'$set': {'change_seq': first + offset}})
+            for offset, doc_id in enumerate(ids)
+        ], ordered=False)
+        total += len(ids)
+
+def backfill_in_background(interval=5):
+    """Backfill every sync entity once the database indexes are ready"""
+    def run():
+        while get_status()['indexes'] != 'ready':
+            realtime.sleep(interval)
+        for entity in SYNC_ENTITIES:
+            try:
+                count = backfill_change_seq(entity)
+                if count:
+                    print(f"✓ Assigned change sequences to {count} {entity}")
+            except Exception as e:
+                print(f"✗ Change sequence backfill error ({entity}): {e}")
+    return realtime.start_background_task(run)
@@ -0,0 +1,104 @@
+import threading
+import time
+import uuid
+from app.utils import realtime
+from app.utils.metrics import metrics
+
+class QueueFull(Exception):
+    """Raised when a task pool or a user's share of it is full"""
+
+class TaskPool:
+    """Bounded background worker pool for socket event handlers
+
+    Work is queued and executed by a fixed number of background tasks
+    started through Socket.IO, so a slow command never blocks the event
+    loop of the connection that sent it. Each user may only have a
+    limited number of tasks queued or running at once.
+    """
+
+    def __init__(self, name, workers=4, max_queue=256, per_user_limit=4):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+        self._queue = None
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._per_user = {}
+        self._started = False
+
+    def start(self):
+        """Start the worker tasks (idempotent)"""
+        if self._started:
+            return
+        self._started = True
+        self._queue = realtime.create_queue()
+        for _ in range(self.workers):
+            realtime.start_background_task(self._worker)
+
+    def submit(self, user_key, func, args=(), callback=None, request_id=None):
+        """Queue func(*args) and return its request ID
+
+        callback(request_id, result, error) is called from the worker when
+        the task finishes.
+        """
+        if not self._started:
+            self.start()
+
+        request_id = request_id or uuid.uuid4().hex
+        with self._lock:
+            if self._depth >= self.max_queue:
+                metrics.incr(f'{self.name}.rejected')
+                raise QueueFull('Server is busy, please retry shortly')
+            if self._per_user.get(user_key, 0) >= self.per_user_limit:
+                metrics.incr(f'{self.name}.rejected_user_limit')
+                raise QueueFull('Too many pending requests for this user')
+            self._depth += 1
+            self._per_user[user_key] = self._per_user.get(user_key, 0) + 1
+            metrics.set_gauge(f'{self.name}.queue_depth', self._depth)
+
+        metrics.incr(f'{self.name}.submitted')
+        self._queue.put((request_id, user_key, func, args, callback, time.perf_counter()))
+        return request_id
+
+    def stats(self):
+        """Get current pool state"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_depth': self._depth,
+                'max_queue': self.max_queue,
+                'active_users': len(self._per_user)
+            }
+
+    def _worker(self):
+        while True:
+            request_id, user_key, func, args, callback, enqueued_at = self._queue.get()
+            started_at = time.perf_counter()
+            metrics.observe(f'{self.name}.wait_time', started_at - enqueued_at)
+
+            result, error = None, None
+            try:
+                result = func(*args)
+            except Exception as e:
+                error = str(e)
+                metrics.incr(f'{self.name}.failed')
+            finally:
+                metrics.observe(f'{self.name}.service_time', time.perf_counter() - started_at)
+                self._release(user_key)
+
+            if callback is not None:
+                try:
+                    callback(request_id, result, error)
+                except Exception as e:
+                    print(f"✗ {self.name} callback error: {e}")
+
+    def _release(self, user_key):
+        with self._lock:
+            self._depth -= 1
+            remaining = self._per_user.get(user_key, 1) - 1
+            if remaining > 0:
+                self._per_user[user_key] = remaining
+            else:
+                self._per_user.pop(user_key, None)
+            metrics.set_gauge(f'{self.name}.queue_depth', self._depth)
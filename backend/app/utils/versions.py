@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import uuid
+from functools import wraps
+from flask import request, make_response
+from app.utils.metrics import metrics
+
+class MemoryVersionStore:
+    """Collection and document version counters held in this process
+
+    The epoch changes on every restart so tags issued by an earlier
+    process can never match a fresh counter.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._collections = {}
+        self._documents = {}
+
+    def bump(self, collection, doc_ids=()):
+        with self._lock:
+            self._collections[collection] = self._collections.get(collection, 0) + 1
+            documents = self._documents.setdefault(collection, {})
+            for doc_id in doc_ids:
+                documents[str(doc_id)] = documents.get(str(doc_id), 0) + 1
+
+    def get(self, collection, doc_id=None):
+        if doc_id is None:
+            return f'{self.epoch}.{self._collections.get(collection, 0)}'
+        return f'{self.epoch}.{self._documents.get(collection, {}).get(str(doc_id), 0)}'
+
+class RedisVersionStore:
+    """Version counters shared by every worker through Redis
+
+    An epoch is stored next to the counters on the first read (and again
+    if Redis loses them), so tags issued before a reset never match the
+    restarted counters.
+    """
+
+    epoch_field = '_epoch'
+
+    def __init__(self, url, prefix='qwipo:versions'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _ensure_epoch(self):
+        self.client.hsetnx(self.prefix, self.epoch_field, uuid.uuid4().hex[:8])
+        return self.client.hget(self.prefix, self.epoch_field)
+
+    def bump(self, collection, doc_ids=()):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(self.prefix, collection, 1)
+        for doc_id in doc_ids:
+            pipe.hincrby(f'{self.prefix}:{collection}', str(doc_id), 1)
+        pipe.execute()
+
+    def get(self, collection, doc_id=None):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hget(self.prefix, self.epoch_field)
+        if doc_id is None:
+            pipe.hget(self.prefix, collection)
+        else:
+            pipe.hget(f'{self.prefix}:{collection}', str(doc_id))
+        epoch, value = pipe.execute()
+        epoch = epoch or self._ensure_epoch()
+        return f'{epoch.decode()}.{(value or b"0").decode()}'
+
+# Global version store (replaced by init_versions)
+store = MemoryVersionStore()
+
+def init_versions(url=None):
+    """Use Redis for version counters when several workers serve traffic"""
+    global store
+    if url and url.startswith(('redis://', 'rediss://')):
+        store = RedisVersionStore(url)
+        print("✓ Version counters shared through Redis")
+    else:
+        store = MemoryVersionStore()
+    return store
+
+def bump_version(collection, *doc_ids):
+    """Record a write to a collection and, optionally, specific documents"""
+    try:
+        store.bump(collection, [doc_id for doc_id in doc_ids if doc_id is not None])
+    except Exception as e:
+        print(f"✗ Version bump error: {e}")
+
+def conditional(collection, doc_arg=None):
+    """Answer If-None-Match from version counters without running the view
+
+    The strong ETag is derived from the collection version (or the
+    document version named by the `doc_arg` view argument) and the full
+    request URL. The version is read before the view runs, so a write
+    racing with the query can only make the tag older, never newer.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            try:
+                version = store.get(collection, kwargs.get(doc_arg) if doc_arg else None)
+            except Exception as e:
+                print(f"✗ Version lookup error: {e}")
+                return f(*args, **kwargs)
+
+            etag = hashlib.sha1(f'{collection}|{version}|{request.full_path}'.encode()).hexdigest()[:24]
+            if request.if_none_match.contains(etag):
+                metrics.incr('etag.not_modified')
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
+
+            metrics.incr('etag.full_responses')
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return decorated
+    return decorator
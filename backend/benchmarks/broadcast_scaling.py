@@ -0,0 +1,146 @@
+"""
+Benchmark room broadcast latency as Socket.IO workers are added
+Run with: python benchmarks/broadcast_scaling.py --workers 1,2,4 --clients 1000
+
+By default the workers are real serve.py processes coordinated through
+Redis (--message-queue). With --in-process the workers are lightweight
+Socket.IO servers in this process sharing the local:// stand-in queue,
+which needs neither Redis nor MongoDB. Clients connect with a signed
+retailer token (JWT_SECRET must match the workers') and join a
+`category:` room, which any authenticated socket may join.
+
+Requires: python-socketio[asyncio_client]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import socketio
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+from app.utils.auth import generate_token
+from app.utils.message_queue import socketio_options
+import serve
+
+ROOM = 'category:bench'
+
+def start_in_process_servers(count, base_port):
+    """Start bare Socket.IO servers sharing the local:// message queue"""
+    servers = []
+    for index in range(count):
+        app = Flask(f'bench-{index}')
+        server = SocketIO(app, async_mode='threading', **socketio_options('local://'))
+
+        @server.on('join_room')
+        def handle_join_room(data):
+            join_room(data.get('room', 'default'))
+
+        port = base_port + index + 1
+        thread = threading.Thread(
+            target=server.run,
+            args=(app,),
+            kwargs={'host': '127.0.0.1', 'port': port, 'allow_unsafe_werkzeug': True, 'log_output': False},
+            daemon=True
+        )
+        thread.start()
+        servers.append(server)
+    time.sleep(1)
+    return servers, servers[0]
+
+def start_process_servers(count, base_port, message_queue):
+    """Start serve.py workers and a write-only publisher on the queue"""
+    workers = serve.start_workers(count, '127.0.0.1', base_port, message_queue)
+    time.sleep(5)
+    publisher = SocketIO(**socketio_options(message_queue))
+    return workers, publisher
+
+async def connect_clients(count, ports, latencies):
+    """Connect clients round-robin across worker ports and join the room"""
+    clients = []
+    connect_times = []
+
+    async def connect(index):
+        client = socketio.AsyncClient(reconnection=False)
+
+        @client.on('bench_broadcast')
+        async def on_broadcast(data):
+            latencies.setdefault(data['seq'], []).append(time.time() - data['sent_at'])
+
+        token = generate_token({'_id': f'bench-{index}', 'email': f'bench-{index}@example.com',
+                                'role': 'retailer', 'name': f'Bench {index}'})
+        started = time.perf_counter()
+        await client.connect(f'http://127.0.0.1:{ports[index % len(ports)]}', transports=['websocket'],
+                             auth={'token': token})
+        connect_times.append(time.perf_counter() - started)
+        await client.emit('join_room', {'room': ROOM})
+        clients.append(client)
+
+    for start in range(0, count, 100):
+        await asyncio.gather(*(connect(i) for i in range(start, min(count, start + 100))))
+    await asyncio.sleep(1)
+    return clients, connect_times
+
+async def run_round(workers, base_port, args, publisher):
+    ports = [base_port + i + 1 for i in range(workers)]
+    latencies = {}
+    clients, connect_times = await connect_clients(args.clients, ports, latencies)
+
+    for seq in range(args.broadcasts):
+        publisher.emit('bench_broadcast', {'seq': seq, 'sent_at': time.time()}, to=ROOM)
+        await asyncio.sleep(args.interval)
+    await asyncio.sleep(2)
+
+    await asyncio.gather(*(client.disconnect() for client in clients))
+
+    per_client = sorted(value for values in latencies.values() for value in values)
+    fan_out = [max(values) for values in latencies.values()]
+    delivered = len(per_client) / float(args.clients * args.broadcasts) * 100
+    return {
+        'workers': workers,
+        'connect_ms': statistics.mean(connect_times) * 1000,
+        'p50_ms': per_client[len(per_client) // 2] * 1000 if per_client else 0,
+        'p95_ms': per_client[int(len(per_client) * 0.95)] * 1000 if per_client else 0,
+        'fan_out_ms': statistics.mean(fan_out) * 1000 if fan_out else 0,
+        'delivered_pct': delivered
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO broadcast scaling benchmark')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--broadcasts', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.25)
+    parser.add_argument('--base-port', type=int, default=6000)
+    parser.add_argument('--message-queue', default='redis://localhost:6379/0')
+    parser.add_argument('--in-process', action='store_true')
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'connect ms':>11} {'p50 ms':>8} {'p95 ms':>8} {'fan-out ms':>11} {'delivered':>10}")
+    for index, workers in enumerate(int(w) for w in args.workers.split(',')):
+        # Fresh ports per round so old servers never answer
+        base_port = args.base_port + index * 100
+        if args.in_process:
+            _, publisher = start_in_process_servers(workers, base_port)
+            processes = []
+        else:
+            processes, publisher = start_process_servers(workers, base_port, args.message_queue)
+
+        try:
+            result = asyncio.run(run_round(workers, base_port, args, publisher))
+        finally:
+            if processes:
+                serve.stop_workers(processes)
+
+        print(f"{result['workers']:>8} {result['connect_ms']:>11.2f} {result['p50_ms']:>8.2f} "
+              f"{result['p95_ms']:>8.2f} {result['fan_out_ms']:>11.2f} {result['delivered_pct']:>9.1f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark in-memory catalog queries at catalog scale
+Run with: python benchmarks/catalog_query.py [--rows 1000000] [--updates 4000]
+
+Loads synthetic product documents into a ColumnarCatalog and times
+typical get_products-style queries: category/brand filters, price ranges,
+stock status and top-N sorts, plus uncached facet counts, before and after a burst of in-place
+updates. No MongoDB needed.
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bson import ObjectId
+from app.utils.catalog import ColumnarCatalog
+
+CATEGORIES = ['Noodles & Pasta', 'Beverages', 'Snacks & Chips', 'Dairy Products', 'Personal Care',
+              'Household', 'Spices', 'Bakery', 'Frozen Foods', 'Baby Care']
+SUPPLIERS = ['Amul', 'Tata', 'ITC', 'HUL', 'Nestle', 'PepsiCo', 'Coca Cola', 'Procter & Gamble', 'Unilever', 'Dabur']
+
+def product_documents(count):
+    now = datetime.utcnow()
+    distributors = [str(ObjectId()) for _ in range(50)]
+    for index in range(count):
+        supplier = random.choice(SUPPLIERS)
+        yield {
+            '_id': ObjectId(),
+            'name': f'Product {index}',
+            'category': random.choice(CATEGORIES),
+            'brand': supplier,
+            'supplier': supplier,
+            'distributor_id': random.choice(distributors),
+            'price': round(random.uniform(5, 500), 2),
+            'stock': random.randint(0, 500),
+            'min_stock': random.randint(10, 50),
+            'is_active': random.random() > 0.05,
+            'updated_at': now - timedelta(minutes=random.randint(0, 100000))
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar catalog query benchmark')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=4000)
+    args = parser.parse_args()
+
+    catalog = ColumnarCatalog()
+    started = timeit.default_timer()
+    catalog.load_documents(product_documents(args.rows), args.rows)
+    print(f"Loaded {catalog.size} rows in {timeit.default_timer() - started:.1f}s")
+
+    cases = [
+        ('category', dict(category='Beverages')),
+        ('category + brand', dict(category='Beverages', brand='Amul')),
+        ('price range, top 20 by price', dict(min_price=100, max_price=200, sort='price', limit=20)),
+        ('low stock, top 50 by stock', dict(stock_status='low_stock', sort='stock', limit=50)),
+        ('active, newest 100', dict(active_only=True, sort='updated_at', descending=True, limit=100)),
+        ('category + in stock + price desc', dict(category='Spices', stock_status='in_stock',
+                                                  sort='price', descending=True, limit=100)),
+    ]
+
+    def run(title):
+        print(f"\n{title}")
+        print(f"{'query':<36} {'matches':>9} {'ms/op':>8}")
+        for name, params in cases:
+            _, total, _ = catalog.query(with_total=True, **params)
+            seconds = timeit.timeit(lambda: catalog.query(**params), number=args.repeat) / args.repeat
+            print(f"{name:<36} {total:>9} {seconds * 1000:>8.3f}")
+
+    run('Freshly loaded')
+
+    print(f"\n{'facets':<36} {'matches':>9} {'ms/op':>8}")
+    for name, params in [('all products', {}), ('category', dict(category='Beverages')),
+                         ('price range', dict(min_price=100, max_price=200))]:
+        def facets():
+            catalog.version += 1  # defeat the per-version facet cache
+            return catalog.facets(**params)
+        _, total, _ = facets()
+        seconds = timeit.timeit(facets, number=args.repeat) / args.repeat
+        print(f"{name:<36} {total:>9} {seconds * 1000:>8.3f}")
+
+    # Apply stock/price updates that land below the index rebuild threshold
+    ids = list(catalog.rows)
+    for product_id in random.sample(ids, min(args.updates, len(ids))):
+        catalog.apply({'_id': product_id, 'stock': random.randint(0, 500),
+                       'price': round(random.uniform(5, 500), 2), 'updated_at': datetime.utcnow()})
+    run(f'After {args.updates} in-place updates')
+
+if __name__ == '__main__':
+    main()
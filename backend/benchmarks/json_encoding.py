@@ -0,0 +1,122 @@
+"""
+Benchmark JSON encoding of the 1000-row products and live-stocks payloads
+Run with: python benchmarks/json_encoding.py
+
+Compares the previous approach (per-route str() loops + Flask's default
+provider) with MongoJSONProvider, using both orjson and its stdlib
+fallback. Payloads are synthetic documents shaped like seed_1000_products.py.
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from app.utils import serialization
+from app.utils.serialization import MongoJSONProvider
+
+def product_documents(count):
+    """Product documents as PyMongo returns them"""
+    categories = ['Noodles & Pasta', 'Beverages', 'Snacks & Chips', 'Dairy Products', 'Personal Care']
+    suppliers = ['Amul', 'Tata', 'ITC', 'HUL', 'Nestle', 'PepsiCo']
+    documents = []
+    for index in range(count):
+        supplier = random.choice(suppliers)
+        documents.append({
+            '_id': ObjectId(),
+            'name': f'Product {index}',
+            'category': random.choice(categories),
+            'price': round(random.uniform(5, 500), 2),
+            'stock': random.randint(0, 500),
+            'min_stock': random.randint(10, 50),
+            'max_stock': random.randint(200, 700),
+            'supplier': supplier,
+            'brand': supplier,
+            'description': f'High quality product {index} from {supplier}',
+            'distributor_id': ObjectId(),
+            'is_active': True,
+            'trend': random.choice(['up', 'down', 'stable']),
+            'trend_percentage': round(random.uniform(-15, 25), 1),
+            'days_to_stockout': random.randint(1, 60),
+            'ai_confidence': round(random.uniform(75, 99), 1),
+            'demand_level': random.choice(['Very High', 'High', 'Moderate', 'Low']),
+            'last_updated': datetime.utcnow(),
+            'created_at': datetime.utcnow() - timedelta(days=random.randint(1, 365))
+        })
+    return documents
+
+def live_stock_rows(documents):
+    """Rows shaped like the /api/analytics/live-stocks response"""
+    return [{
+        '_id': str(doc['_id']),
+        'name': doc['name'],
+        'category': doc['category'],
+        'brand': doc['brand'],
+        'price': doc['price'],
+        'stock': doc['stock'],
+        'min_stock': doc['min_stock'],
+        'max_stock': doc['max_stock'],
+        'trend': doc['trend'],
+        'trend_percentage': doc['trend_percentage'],
+        'ai_confidence': doc['ai_confidence'],
+        'demand_level': doc['demand_level'],
+        'days_to_stockout': doc['days_to_stockout'],
+        'supplier': doc['supplier'],
+        'last_updated': datetime.utcnow().isoformat(),
+        'volume': random.randint(100, 10000),
+        'market_cap': round(doc['price'] * doc['stock'], 2)
+    } for doc in documents]
+
+def legacy_products(provider, documents):
+    documents = copy.copy(documents)
+    for index, product in enumerate(documents):
+        product = documents[index] = dict(product)
+        product['_id'] = str(product['_id'])
+        product['distributor_id'] = str(product['distributor_id'])
+    return provider.dumps({'products': documents, 'count': len(documents)})
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON encoding benchmark')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    mongo_provider = MongoJSONProvider(app)
+    documents = product_documents(args.rows)
+    live_stocks = {'stocks': live_stock_rows(documents), 'total_stocks': args.rows}
+    products = {'products': documents, 'count': args.rows}
+
+    fast_encoder = serialization.orjson
+    cases = [
+        ('products', 'legacy loops + default', lambda: legacy_products(default_provider, documents)),
+        ('products', 'MongoJSONProvider', lambda: mongo_provider.dumps_bytes(products)),
+        ('live-stocks', 'default provider', lambda: default_provider.dumps(live_stocks)),
+        ('live-stocks', 'MongoJSONProvider', lambda: mongo_provider.dumps_bytes(live_stocks)),
+    ]
+
+    print(f"{'payload':<12} {'encoder':<28} {'ms/op':>8} {'KB':>8}")
+    for payload, name, func in cases:
+        encoders = [('', fast_encoder)]
+        if 'Mongo' in name and fast_encoder is not None:
+            encoders.append((' (stdlib)', None))
+        for suffix, encoder in encoders:
+            serialization.orjson = encoder
+            with app.app_context():
+                size = len(func()) / 1024
+                seconds = timeit.timeit(func, number=args.repeat) / args.repeat
+            print(f"{payload:<12} {name + suffix:<28} {seconds * 1000:>8.3f} {size:>8.1f}")
+    serialization.orjson = fast_encoder
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Benchmark the vectorized reorder math on synthetic (retailer, SKU) pairs
+Run with: python benchmarks/reorder_plan.py [--pairs 1000000]
+
+Times reorder_plan (reorder points, safety stock and EOQ) over arrays
+shaped like one partition's demand rows. No MongoDB needed; the full job
+additionally spends its time in the demand aggregation and inserts.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+from app.utils.reorder import reorder_plan, DEFAULT_OPTIONS
+
+def synthetic_pairs(count, seed=7):
+    rng = np.random.default_rng(seed)
+    days = rng.integers(1, DEFAULT_OPTIONS['window_days'], count)
+    daily = rng.gamma(2.0, 5.0, count)
+    return {
+        'total': daily * days,
+        'sumsq': daily * daily * days * 1.3,
+        'days_since_last': rng.uniform(0, 14, count),
+        'last_quantity': rng.integers(5, 200, count).astype(np.float64),
+        'price': rng.uniform(5, 500, count),
+        'lead_time': rng.choice([1.0, 2.0, 3.0, 5.0], count)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Reorder math benchmark')
+    parser.add_argument('--pairs', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    pairs = synthetic_pairs(args.pairs)
+    seconds = timeit.timeit(lambda: reorder_plan(options=DEFAULT_OPTIONS, **pairs), number=args.repeat) / args.repeat
+    reorder, quantity, _, _ = reorder_plan(options=DEFAULT_OPTIONS, **pairs)
+    print(f"{args.pairs:,} pairs in {seconds * 1000:.1f} ms ({args.pairs / seconds:,.0f} pairs/s)")
+    print(f"{int(reorder.sum()):,} pairs due, median quantity {int(np.median(quantity[reorder]))}")
+
+if __name__ == '__main__':
+    main()
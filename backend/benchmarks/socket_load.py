@@ -0,0 +1,226 @@
+"""
+Load-test one backend worker with thousands of Socket.IO clients
+Run with: python benchmarks/socket_load.py --spawn --clients 2000 --duration 30
+
+Opens --clients connections (in batches of --connect-batch), each with a
+signed retailer token (JWT_SECRET must match the server's) and joining a
+shared category room plus one of --rooms smaller ones via `join_room`, then for
+--duration seconds fires `voice_command` and `stock_update_request` at the
+given total rates and times the round trip to `voice_response` /
+`stock_update`. Reports:
+
+- connect time (connect + join) percentiles
+- event round-trip percentiles, acknowledgement and full response
+- broadcast fan-out latency to the shared room (time until the last
+  client has it), when a --message-queue is given to publish through
+- server memory per connection (RSS delta / clients; needs the
+  server's pid, known with --spawn or given by --server-pid, Linux only)
+
+With --spawn a single app.py worker is started on --port (as serve.py
+would) and stopped at the end. Raise the open-files limit (ulimit -n)
+above the client count on both sides.
+
+Requires: python-socketio[asyncio_client]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import socketio
+import serve
+from app.utils.auth import generate_token
+
+SHARED_ROOM = 'category:load-all'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Socket.IO connection and latency load test')
+    parser.add_argument('--url', default=None, help='Server to test (default http://127.0.0.1:PORT)')
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--spawn', action='store_true', help='Start an app.py worker on --port')
+    parser.add_argument('--server-pid', type=int, default=None)
+    parser.add_argument('--message-queue', default=None,
+                        help='Queue the server uses (e.g. redis://localhost:6379/0); enables fan-out timing')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--connect-batch', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--voice-rate', type=float, default=50, help='voice_command events per second (total)')
+    parser.add_argument('--stock-rate', type=float, default=50, help='stock_update_request events per second (total)')
+    parser.add_argument('--broadcasts', type=int, default=10)
+    return parser.parse_args()
+
+def rss_bytes(pid):
+    """Resident set size of a process, or None when unavailable"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def percentiles(values, points=(50, 95, 99)):
+    """Millisecond percentiles of a list of seconds"""
+    ordered = sorted(values)
+    if not ordered:
+        return {f'p{point}': None for point in points}
+    return {f'p{point}': ordered[min(len(ordered) - 1, len(ordered) * point // 100)] * 1000 for point in points}
+
+class LoadClient:
+    """One Socket.IO client and its pending requests"""
+
+    def __init__(self, index, stats):
+        self.index = index
+        self.stats = stats
+        self.pending = {}
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.client.on('voice_response', self._on_response)
+        self.client.on('stock_update', self._on_response)
+        self.client.on('load_broadcast', self._on_broadcast)
+        self.client.on('task_rejected', self._on_rejected)
+
+    async def connect(self, url, rooms):
+        started = time.perf_counter()
+        token = generate_token({'_id': f'load-{self.index}', 'email': f'load-{self.index}@example.com',
+                                'role': 'retailer', 'name': f'Load {self.index}'})
+        await self.client.connect(url, transports=['websocket'], auth={'token': token})
+        await self.client.call('join_room', {'room': SHARED_ROOM}, timeout=30)
+        await self.client.call('join_room', {'room': f'category:load-{self.index % rooms}'}, timeout=30)
+        self.stats['connect'].append(time.perf_counter() - started)
+
+    async def send(self, event, request_id):
+        data = {'request_id': request_id, 'user_id': f'load-{self.index}'}
+        if event == 'voice_command':
+            data['command'] = random.choice(['check stock', 'sales this week', 'reorder maggi'])
+        self.pending[request_id] = (event, time.perf_counter())
+        try:
+            await self.client.call(event, data, timeout=30)
+            self.stats[f'{event}.ack'].append(time.perf_counter() - self.pending[request_id][1])
+        except Exception:
+            self.pending.pop(request_id, None)
+            self.stats['errors'] += 1
+
+    async def _on_response(self, data):
+        entry = self.pending.pop(data.get('request_id'), None)
+        if entry:
+            event, sent_at = entry
+            self.stats[event].append(time.perf_counter() - sent_at)
+
+    async def _on_rejected(self, data):
+        self.pending.pop(data.get('request_id'), None)
+        self.stats['rejected'] += 1
+
+    async def _on_broadcast(self, data):
+        self.stats['broadcast'].setdefault(data['seq'], []).append(time.time() - data['sent_at'])
+
+async def fire(clients, event, rate, duration, ids):
+    """Send `event` from random clients at `rate` per second for `duration`"""
+    if rate <= 0:
+        return
+    tasks = []
+    started = time.perf_counter()
+    for count in itertools.count():
+        due = started + count / rate
+        if due - started >= duration:
+            break
+        await asyncio.sleep(max(0, due - time.perf_counter()))
+        tasks.append(asyncio.ensure_future(random.choice(clients).send(event, f'{event}-{next(ids)}')))
+    await asyncio.gather(*tasks)
+
+async def broadcast(args, stats):
+    """Publish timestamped messages to the shared room through the message queue"""
+    from flask_socketio import SocketIO
+    from app.utils.message_queue import socketio_options
+    publisher = SocketIO(**socketio_options(args.message_queue))
+    for seq in range(args.broadcasts):
+        publisher.emit('load_broadcast', {'seq': seq, 'sent_at': time.time()}, to=SHARED_ROOM)
+        await asyncio.sleep(max(0.5, args.duration / max(args.broadcasts, 1)))
+
+async def run(args, url, server_pid):
+    stats = {'connect': [], 'voice_command': [], 'stock_update_request': [],
+             'voice_command.ack': [], 'stock_update_request.ack': [],
+             'broadcast': {}, 'errors': 0, 'rejected': 0}
+    memory_before = rss_bytes(server_pid) if server_pid else None
+
+    clients = [LoadClient(index, stats) for index in range(args.clients)]
+    connect_started = time.perf_counter()
+    for start in range(0, len(clients), args.connect_batch):
+        batch = clients[start:start + args.connect_batch]
+        results = await asyncio.gather(*(client.connect(url, args.rooms) for client in batch), return_exceptions=True)
+        stats['errors'] += sum(1 for result in results if isinstance(result, Exception))
+    connect_seconds = time.perf_counter() - connect_started
+    connected = [client for client in clients if client.client.connected]
+    await asyncio.sleep(2)
+    memory_after = rss_bytes(server_pid) if server_pid else None
+
+    ids = itertools.count()
+    jobs = [fire(connected, 'voice_command', args.voice_rate, args.duration, ids),
+            fire(connected, 'stock_update_request', args.stock_rate, args.duration, ids)]
+    if args.message_queue:
+        jobs.append(broadcast(args, stats))
+    if connected:
+        await asyncio.gather(*jobs)
+    await asyncio.sleep(3)
+
+    await asyncio.gather(*(client.client.disconnect() for client in connected), return_exceptions=True)
+    return stats, len(connected), connect_seconds, memory_before, memory_after
+
+def report(args, stats, connected, connect_seconds, memory_before, memory_after):
+    def row(name, values):
+        p = percentiles(values)
+        cells = ' '.join(f'{p[key]:>9.2f}' if p[key] is not None else f"{'-':>9}" for key in ('p50', 'p95', 'p99'))
+        print(f'{name:<32} {len(values):>8} {cells}')
+
+    print(f"\nConnected {connected}/{args.clients} clients in {connect_seconds:.1f}s "
+          f"({connected / connect_seconds if connect_seconds else 0:.0f}/s), "
+          f"{stats['errors']} errors, {stats['rejected']} rejected tasks")
+    print(f"{'metric (ms)':<32} {'samples':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    row('connect + join', stats['connect'])
+    for event in ('voice_command', 'stock_update_request'):
+        row(f'{event} ack', stats[f'{event}.ack'])
+        row(f'{event} response', stats[event])
+
+    if stats['broadcast']:
+        fan_out = [max(latencies) for latencies in stats['broadcast'].values()]
+        delivered = sum(len(latencies) for latencies in stats['broadcast'].values())
+        row(f'broadcast to {connected} (first)', [min(latencies) for latencies in stats['broadcast'].values()])
+        row(f'broadcast to {connected} (fan-out)', fan_out)
+        print(f"broadcast delivery: {delivered / float(connected * args.broadcasts) * 100:.1f}%")
+    else:
+        print('broadcast fan-out: skipped (pass --message-queue to publish through the server\'s queue)')
+
+    if memory_before is not None and memory_after is not None and connected:
+        per_connection = (memory_after - memory_before) / connected
+        print(f"server RSS {memory_before / 2**20:.1f} MiB -> {memory_after / 2**20:.1f} MiB "
+              f"({per_connection / 1024:.1f} KiB per connection)")
+    else:
+        print('server memory: unavailable (use --spawn or --server-pid on Linux)')
+
+def main():
+    args = parse_args()
+    url = args.url or f'http://127.0.0.1:{args.port}'
+    workers = []
+    server_pid = args.server_pid
+    if args.spawn:
+        workers = [(args.port, serve.start_worker(args.port, '127.0.0.1', args.message_queue or 'local://'))]
+        server_pid = workers[0][1].pid
+        time.sleep(5)
+
+    try:
+        results = asyncio.run(run(args, url, server_pid))
+    finally:
+        if workers:
+            serve.stop_workers(workers)
+    report(args, *results)
+
+if __name__ == '__main__':
+    main()
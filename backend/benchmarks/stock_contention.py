@@ -0,0 +1,91 @@
+"""
+Benchmark stock decrements on one hot product, single counter vs sharded
+Run with: python benchmarks/stock_contention.py [--mongo-uri URI] [--shards 16]
+
+Each writer thread repeatedly decrements the same product, either with a
+guarded $inc on the product document (the single counter) or through
+ShardedStock.apply. Reports throughput and latency for 1, 8 and 64
+concurrent writers. Uses a scratch database that is dropped afterwards.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.utils import database
+from app.utils.database import init_db, get_collection
+from app.utils.stock_shards import ShardedStock
+
+def single_counter(product_id):
+    products = get_collection('products')
+
+    def decrement():
+        products.update_one({'_id': product_id, 'stock': {'$gte': 1}}, {'$inc': {'stock': -1}})
+    return decrement
+
+def sharded_counter(product_id, shards):
+    sharded = ShardedStock()
+    sharded.enable(product_id, shards)
+
+    def decrement():
+        sharded.apply(product_id, -1)
+    return decrement
+
+def run(decrement, writers, duration):
+    """Run writers threads for duration seconds; returns (ops, latencies)"""
+    latencies = [[] for _ in range(writers)]
+    deadline = time.perf_counter() + duration
+    barrier = threading.Barrier(writers)
+
+    def writer(index):
+        barrier.wait()
+        samples = latencies[index]
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            decrement()
+            samples.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    merged = sorted(sample for samples in latencies for sample in samples)
+    return len(merged), merged
+
+def main():
+    parser = argparse.ArgumentParser(description='Stock contention benchmark')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/qwipo_stock_bench'))
+    parser.add_argument('--writers', default='1,8,64')
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    init_db(args.mongo_uri)
+    products = get_collection('products')
+
+    print(f"{'mode':<10} {'writers':>7} {'ops/s':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    try:
+        for writers in [int(value) for value in args.writers.split(',')]:
+            for mode in ('single', 'sharded'):
+                product_id = products.insert_one({'name': 'Hot product', 'stock': 10 ** 9}).inserted_id
+                if mode == 'single':
+                    decrement = single_counter(product_id)
+                else:
+                    decrement = sharded_counter(product_id, args.shards)
+
+                ops, latencies = run(decrement, writers, args.duration)
+                p50 = statistics.median(latencies) * 1000 if latencies else 0
+                p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+                print(f"{mode:<10} {writers:>7} {ops / args.duration:>10.0f} {p50:>8.2f} {p95:>8.2f}")
+    finally:
+        database.client.drop_database(database.db.name)
+
+if __name__ == '__main__':
+    main()
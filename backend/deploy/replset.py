@@ -0,0 +1,95 @@
+"""
+Local three-node MongoDB replica set for testing read routing
+Run with: python deploy/replset.py [--base-port 27017] [--dbpath deploy/.replset]
+
+Starts three mongod processes (ports base .. base + 2) in replica set
+`rs0`, initiates the set and waits for a primary. Point the backend at it
+with the printed MONGO_URI; analytics reads then prefer the secondaries.
+Ctrl+C stops all three.
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+DEPLOY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a local three-node MongoDB replica set')
+    parser.add_argument('--base-port', type=int, default=27017)
+    parser.add_argument('--dbpath', default=os.path.join(DEPLOY_DIR, '.replset'))
+    parser.add_argument('--replset', default='rs0')
+    parser.add_argument('--mongod', default=shutil.which('mongod') or 'mongod')
+    return parser.parse_args()
+
+def start_member(mongod, port, dbpath, replset):
+    """Start one mongod member"""
+    member_path = os.path.join(dbpath, str(port))
+    os.makedirs(member_path, exist_ok=True)
+    return subprocess.Popen([
+        mongod,
+        '--replSet', replset,
+        '--port', str(port),
+        '--bind_ip', '127.0.0.1',
+        '--dbpath', member_path,
+        '--logpath', os.path.join(member_path, 'mongod.log')
+    ])
+
+def initiate(ports, replset, timeout=60):
+    """Initiate the replica set (if needed) and wait for a primary"""
+    client = MongoClient('127.0.0.1', ports[0], directConnection=True, serverSelectionTimeoutMS=timeout * 1000)
+    config = {
+        '_id': replset,
+        'members': [{'_id': index, 'host': f'127.0.0.1:{port}'} for index, port in enumerate(ports)]
+    }
+    try:
+        client.admin.command('replSetInitiate', config)
+        print(f"✓ Replica set {replset} initiated")
+    except OperationFailure as e:
+        if e.code != 23:  # AlreadyInitialized
+            raise
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.admin.command('replSetGetStatus')
+        if any(member['stateStr'] == 'PRIMARY' for member in status['members']):
+            return True
+        time.sleep(1)
+    return False
+
+def main():
+    args = parse_args()
+    ports = [args.base_port + index for index in range(3)]
+    members = [start_member(args.mongod, port, args.dbpath, args.replset) for port in ports]
+
+    def stop(*_):
+        for member in members:
+            member.terminate()
+        for member in members:
+            member.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    if not initiate(ports, args.replset):
+        print("✗ No primary elected")
+        stop()
+
+    hosts = ','.join(f'127.0.0.1:{port}' for port in ports)
+    print(f"✓ Replica set ready: MONGO_URI=mongodb://{hosts}/qwipo_ai?replicaSet={args.replset}")
+    while True:
+        for member in members:
+            if member.poll() is not None:
+                print(f"✗ mongod exited with code {member.returncode}")
+                stop()
+        time.sleep(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Draft replenishment orders for every retailer
+Run with: python reorder_job.py [--processes 4] [--distributor ID ...]
+
+Computes reorder points and economic order quantities for every
+(retailer, SKU) pair from recent sales and writes one draft order per
+retailer and distributor, replacing the previous run's drafts. Schedule
+it from cron, e.g. nightly:
+
+    0 2 * * * cd /srv/qwipo/backend && python reorder_job.py
+
+The drafts change order listings, whose ETags come from version
+counters held by the web server. The job bumps them through Redis, so
+VERSION_STORE_URL (or SOCKETIO_MESSAGE_QUEUE) must point at the same
+Redis the server uses; pass --skip-version-bump to run without it and
+accept stale cached listings until the next order write.
+"""
+
+import argparse
+import os
+from dotenv import load_dotenv
+from app.utils.database import init_db
+from app.utils.reorder import run_reorder_job, DEFAULT_OPTIONS
+from app.utils.versions import init_versions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Draft auto-reorder orders for every retailer')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--distributor', action='append', dest='distributors',
+                        help='Only plan for this distributor (repeatable)')
+    parser.add_argument('--skip-version-bump', action='store_true',
+                        help='Run without a shared version store (cached order listings stay stale)')
+    for option, default in DEFAULT_OPTIONS.items():
+        parser.add_argument(f"--{option.replace('_', '-')}", type=type(default), default=default)
+    return parser.parse_args()
+
+def main():
+    load_dotenv()
+    args = parse_args()
+    version_store_url = os.getenv('VERSION_STORE_URL', os.getenv('SOCKETIO_MESSAGE_QUEUE'))
+    if not args.skip_version_bump and not (version_store_url or '').startswith(('redis://', 'rediss://')):
+        raise SystemExit("✗ VERSION_STORE_URL (or SOCKETIO_MESSAGE_QUEUE) must be a redis:// URL shared with "
+                         "the web server so order ETags see the new drafts; use --skip-version-bump to run anyway")
+    mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/qwipo_ai')
+    init_db(mongo_uri, build_indexes=False)
+
+    options = {option: getattr(args, option) for option in DEFAULT_OPTIONS}
+    run = run_reorder_job(mongo_uri, processes=args.processes, distributor_ids=args.distributors, **options)
+
+    # Drafts show up in order listings, so invalidate their ETags
+    if not args.skip_version_bump:
+        init_versions(version_store_url).bump('orders', run['deleted_drafts'])
+
+    rate = run['pairs'] / run['seconds'] if run['seconds'] else 0
+    print(f"✓ Reorder run {run['_id']}: {run['pairs']} pairs across {run['distributors']} distributors "
+          f"in {run['seconds']:.1f}s ({rate:,.0f} pairs/s)")
+    print(f"✓ {run['drafts']} draft orders with {run['items']} items, {len(run['deleted_drafts'])} old drafts replaced")
+    if run['unpriced']:
+        print(f"✗ {run['unpriced']} products with demand but no price were skipped")
+    for error in run['errors']:
+        print(f"✗ Distributor {error['distributor_id']}: {error['error']}")
+
+if __name__ == '__main__':
+    main()
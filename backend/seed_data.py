@@ -6,6 +6,7 @@ Run with: python seed_data.py
 from pymongo import MongoClient
 from datetime import datetime
 from app.utils.auth import hash_password
+from app.utils.database import ensure_time_series
 import random
 
 # Connect to MongoDB
@@ -18,7 +19,8 @@ def clear_database():
     db.users.delete_many({})
     db.products.delete_many({})
     db.orders.delete_many({})
-    db.stock_history.delete_many({})
+    db.stock_history.drop()
+    ensure_time_series(db)
     print("✓ Database cleared")
 
 def seed_users():
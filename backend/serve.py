@@ -0,0 +1,104 @@
+"""
+Production server: N eventlet workers sharing rooms through a message queue
+Run with: python serve.py --workers 4 --message-queue redis://localhost:6379/0
+
+Each worker is a separate app.py process listening on its own port
+(base port + 1 .. base port + N). Put a load balancer with sticky
+sessions in front of them, e.g. deploy/nginx.conf which hashes clients
+by IP and listens on the base port. Workers trust one X-Forwarded-For
+hop (the proxy's) for client addresses; set PROXY_FIX_X_FOR to change
+that, or to 0 when they are exposed without a proxy.
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run Qwipo AI backend workers')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--host', default=os.getenv('HOST', '127.0.0.1'))
+    parser.add_argument('--base-port', type=int, default=int(os.getenv('PORT', 5000)))
+    parser.add_argument('--message-queue', default=os.getenv('SOCKETIO_MESSAGE_QUEUE', 'redis://localhost:6379/0'))
+    return parser.parse_args()
+
+def worker_env(port, host, message_queue):
+    """Environment for one worker process"""
+    env = dict(os.environ)
+    env.update({
+        'EVENTLET_MONKEY_PATCH': '1',
+        'SOCKETIO_ASYNC_MODE': 'eventlet',
+        'SOCKETIO_MESSAGE_QUEUE': message_queue,
+        'FLASK_DEBUG': '0',
+        'PROXY_FIX_X_FOR': os.getenv('PROXY_FIX_X_FOR', '1'),
+        'HOST': host,
+        'PORT': str(port)
+    })
+    return env
+
+def start_worker(port, host, message_queue):
+    """Start one worker process"""
+    return subprocess.Popen(
+        [sys.executable, 'app.py'],
+        cwd=BACKEND_DIR,
+        env=worker_env(port, host, message_queue)
+    )
+
+def start_workers(count, host, base_port, message_queue):
+    """Start worker processes and return them"""
+    if count > 1 and message_queue.startswith('local://'):
+        raise SystemExit('local:// only works inside one process; use Redis for multiple workers')
+
+    workers = []
+    for index in range(count):
+        port = base_port + index + 1
+        process = start_worker(port, host, message_queue)
+        workers.append((port, process))
+        print(f"✓ Worker {index + 1} (pid {process.pid}) listening on {host}:{port}")
+    return workers
+
+def stop_workers(workers):
+    """Terminate worker processes"""
+    for _, process in workers:
+        if process.poll() is None:
+            process.terminate()
+    for _, process in workers:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    args = parse_args()
+    workers = start_workers(args.workers, args.host, args.base_port, args.message_queue)
+
+    print("\nnginx upstream for sticky sessions:")
+    print("upstream qwipo_backend {\n    ip_hash;")
+    for port, _ in workers:
+        print(f"    server {args.host}:{port};")
+    print("}\n")
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        # Restart crashed workers on the same port
+        while True:
+            for index, (port, process) in enumerate(workers):
+                if process.poll() is not None:
+                    print(f"✗ Worker on port {port} exited with {process.returncode}, restarting")
+                    workers[index] = (port, start_worker(port, args.host, args.message_queue))
+            time.sleep(1)
+    except (KeyboardInterrupt, SystemExit):
+        print("\nStopping workers...")
+    finally:
+        stop_workers(workers)
+
+if __name__ == '__main__':
+    main()
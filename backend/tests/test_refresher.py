@@ -0,0 +1,36 @@
+from flask import Flask, jsonify, request
+from app.utils.refresher import refresher, stale_while_revalidate
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/sales')
+    @stale_while_revalidate(interval=60, entities=('order',), params=('days',))
+    def sales():
+        return jsonify({'days': int(request.args.get('days', 7)), 'ignored': request.args.get('other')})
+
+    @app.route('/top/<kind>')
+    @stale_while_revalidate(interval=60, params=('limit',))
+    def top(kind):
+        return jsonify({'kind': kind, 'limit': int(request.args.get('limit', 10))})
+
+    return app
+
+def setup_function():
+    refresher._entries.clear()
+
+def test_keyed_param_reaches_view():
+    client = make_app().test_client()
+    response = client.get('/sales?days=7')
+    assert response.status_code == 200
+    assert response.get_json() == {'days': 7, 'ignored': None}
+
+def test_entries_keyed_on_read_params_only():
+    client = make_app().test_client()
+    assert client.get('/sales?days=30&other=1').get_json() == {'days': 30, 'ignored': None}
+    assert client.get('/sales?days=30&other=2').headers['Age'] == '0'
+    assert len(refresher._entries) == 1
+
+def test_view_arguments_are_kept():
+    client = make_app().test_client()
+    assert client.get('/top/products?limit=5').get_json() == {'kind': 'products', 'limit': 5}
@@ -20,11 +20,14 @@ const AppContent = () => {
       const newSocket = io('http://localhost:5000', {
         transports: ['websocket'],
         autoConnect: true,
+        auth: { token: localStorage.getItem('token') },
       });
 
       newSocket.on('connect', () => {
         console.log('✓ Connected to WebSocket');
-        newSocket.emit('join_room', { room: `user_${user.user_id || user.id}` });
+        if (user.role === 'retailer' || user.role === 'distributor') {
+          newSocket.emit('join_room', { room: `${user.role}:${user.user_id || user.id}` });
+        }
       });
 
       newSocket.on('status', (data) => {
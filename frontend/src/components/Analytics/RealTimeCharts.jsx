@@ -10,6 +10,7 @@ import {
   Brain,
   Zap
 } from 'lucide-react';
+import { fetchBatch } from '../../utils/batch';
 
 const RealTimeCharts = () => {
   const [salesData, setSalesData] = useState([]);
@@ -21,30 +22,24 @@ const RealTimeCharts = () => {
   const fetchAnalyticsData = async () => {
     setLoading(true);
     try {
-      const [salesRes, topProductsRes, revenueRes] = await Promise.all([
-        fetch('/api/analytics/sales?days=7', {
-          headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
-        }),
-        fetch('/api/analytics/top-products?limit=5', {
-          headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
-        }),
-        fetch('/api/analytics/revenue-trends', {
-          headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
-        })
+      const results = await fetchBatch([
+        '/api/analytics/sales?days=7',
+        '/api/analytics/top-products?limit=5',
+        '/api/analytics/revenue-trends'
       ]);
+      const salesData = results['/api/analytics/sales?days=7'];
+      const topProductsData = results['/api/analytics/top-products?limit=5'];
+      const revenueData = results['/api/analytics/revenue-trends'];
 
-      if (salesRes.ok) {
-        const salesData = await salesRes.json();
+      if (salesData) {
         setSalesData(salesData.daily_sales || []);
       }
 
-      if (topProductsRes.ok) {
-        const topProductsData = await topProductsRes.json();
+      if (topProductsData) {
         setTopProducts(topProductsData.top_products || []);
       }
 
-      if (revenueRes.ok) {
-        const revenueData = await revenueRes.json();
+      if (revenueData) {
         setRevenueTrends(revenueData.monthly_trends || []);
       }
     } catch (error) {
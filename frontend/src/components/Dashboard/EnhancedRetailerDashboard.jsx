@@ -29,6 +29,7 @@ import { useAuth } from '../../contexts/AuthContext';
 import RealTimeCharts from '../Analytics/RealTimeCharts';
 import LiveStockMarket from '../LiveStockMarket/LiveStockMarket';
 import LiveStocksAnalytics from '../Analytics/LiveStocksAnalytics';
+import { fetchBatch } from '../../utils/batch';
 
 const EnhancedRetailerDashboard = ({ socket }) => {
   const [activeTab, setActiveTab] = useState('live-market');
@@ -41,67 +42,40 @@ const EnhancedRetailerDashboard = ({ socket }) => {
   const [lastUpdate, setLastUpdate] = useState(null);
   const { user, logout } = useAuth();
 
-  // Fetch AI predictions
-  const fetchAiPredictions = async () => {
-    try {
-      const response = await fetch('/api/analytics/ai-predictions', {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      if (response.ok) {
-        const data = await response.json();
-        setAiPredictions(data.predictions || []);
-        setLastUpdate(new Date().toLocaleTimeString());
-      }
-    } catch (error) {
-      console.error('Error fetching AI predictions:', error);
+  // Fetch predictions, recommendations and (optionally) stats in one batch
+  const fetchDashboardData = async (includeStats = true) => {
+    const paths = ['/api/analytics/ai-predictions', '/api/analytics/live-recommendations'];
+    if (includeStats) {
+      paths.push('/api/analytics/dashboard');
     }
-  };
 
-  // Fetch live recommendations
-  const fetchLiveRecommendations = async () => {
     try {
-      const response = await fetch('/api/analytics/live-recommendations', {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      if (response.ok) {
-        const data = await response.json();
-        setLiveRecommendations(data.recommendations || []);
-      }
-    } catch (error) {
-      console.error('Error fetching live recommendations:', error);
-    }
-  };
+      const results = await fetchBatch(paths);
+      const predictions = results['/api/analytics/ai-predictions'];
+      const recommendations = results['/api/analytics/live-recommendations'];
+      const stats = results['/api/analytics/dashboard'];
 
-  // Fetch dashboard stats
-  const fetchDashboardStats = async () => {
-    try {
-      const response = await fetch('/api/analytics/dashboard', {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      if (response.ok) {
-        const data = await response.json();
-        setDashboardStats(data);
+      if (predictions) {
+        setAiPredictions(predictions.predictions || []);
+        setLastUpdate(new Date().toLocaleTimeString());
+      }
+      if (recommendations) {
+        setLiveRecommendations(recommendations.recommendations || []);
+      }
+      if (stats) {
+        setDashboardStats(stats);
       }
     } catch (error) {
-      console.error('Error fetching dashboard stats:', error);
+      console.error('Error fetching dashboard data:', error);
     }
   };
 
   // Auto-refresh data every 5 minutes
   useEffect(() => {
-    fetchDashboardStats();
-    fetchAiPredictions();
-    fetchLiveRecommendations();
+    fetchDashboardData();
 
     const interval = setInterval(() => {
-      fetchAiPredictions();
-      fetchLiveRecommendations();
+      fetchDashboardData(false);
     }, 300000); // 5 minutes
 
     return () => clearInterval(interval);
@@ -124,11 +98,7 @@ const EnhancedRetailerDashboard = ({ socket }) => {
 
   const handleRefresh = () => {
     setLoading(true);
-    Promise.all([
-      fetchDashboardStats(),
-      fetchAiPredictions(),
-      fetchLiveRecommendations()
-    ]).finally(() => {
+    fetchDashboardData().finally(() => {
       setLoading(false);
     });
   };
@@ -0,0 +1,23 @@
+// Fetch several GET API routes in one round trip through POST /api/batch.
+// Resolves to an object keyed by path with each sub-response's body, or
+// null for sub-requests that failed.
+export const fetchBatch = async (paths) => {
+  const response = await fetch('/api/batch', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Authorization': `Bearer ${localStorage.getItem('token')}`
+    },
+    body: JSON.stringify({ requests: paths.map((path) => ({ id: path, path })) })
+  });
+  if (!response.ok) {
+    throw new Error(`Batch request failed: ${response.status}`);
+  }
+
+  const data = await response.json();
+  const results = {};
+  for (const item of data.responses || []) {
+    results[item.id] = item.status === 200 ? item.body : null;
+  }
+  return results;
+};